@@ -0,0 +1,5 @@
+import sys
+
+from awsedu.cli import main
+
+sys.exit(main())
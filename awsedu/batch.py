@@ -0,0 +1,301 @@
+import importlib
+import json
+import re
+import threading
+import time
+import Queue
+
+''' Notes:
+	-	A batch file lists jobs, every job calls a function of the problem modules:
+
+		{"jobs": [
+			{"id": "v2", "call": "problem_2.ec2ClientCreateVolume",
+			 "args": {"zone": "eu-west-3c", "volumetype": "gp2", "size": 512}},
+			{"id": "x", "call": "problem_1.ec2ClientStart", "args": {"ids": ["i-0abc"]}},
+			{"id": "attach", "call": "problem_2.ec2ClientAttachVolume",
+			 "args": {"devicename": "/dev/sdh", "volumeid": "${v2.VolumeId}", "instanceid": "i-0abc"}}]}
+
+	-	Dependencies are explicit ("after": [ids]) or inferred:
+		a "${job.path}" reference depends on -job- and is replaced by the path of its result,
+		jobs naming the same instance or volume id, or the same "${job.path}" reference,
+		run in file order, unless both only read
+	-	Created and detached volumes are awaited until available before their job is done,
+		attached ones until attached, lifecycle calls run with sync=True unless the job says otherwise
+	-	YAML batch files need PyYAML
+'''
+
+REFERENCE = re.compile(r'\$\{([\w-]+)((?:\.[\w-]+)*)\}')
+RESOURCE  = re.compile(r'^(i|vol|snap|ami)-[0-9a-f]+$')
+
+# functions that only read: they never need to be ordered among themselves
+READERS = re.compile(r'^(ec2|iam)\w*List')
+
+MAX_WORKERS = 16
+
+class BatchError(Exception):
+	''' Raised for malformed batch files: unknown functions or references, cycles '''
+	pass
+
+# volume_in_use is reached while the attachment is still attaching: wait for attached
+ATTACHED = {
+	'version': 2,
+	'waiters': {'VolumeAttached': {
+		'operation': 'DescribeVolumes', 'delay': 5, 'maxAttempts': 40,
+		'acceptors': [
+			{'matcher': 'pathAll', 'argument': 'Volumes[].Attachments[].State', 'expected': 'attached', 'state': 'success'},
+			{'matcher': 'pathAny', 'argument': 'Volumes[].State', 'expected': 'deleted', 'state': 'failure'}]}}}
+
+def _volumeId(result):
+	return result['VolumeId'] if isinstance(result, dict) else result.id
+
+def _availableVolume(result):
+	import boto3
+	boto3.client('ec2').get_waiter('volume_available').wait(VolumeIds=[_volumeId(result)])
+
+def _attachedVolume(result):
+	import boto3
+	from botocore.waiter import WaiterModel, create_waiter_with_client
+	ec2client = boto3.client('ec2')
+	ec2client.get_waiter('volume_in_use').wait(VolumeIds=[_volumeId(result)])
+	create_waiter_with_client('VolumeAttached', WaiterModel(ATTACHED), ec2client).wait(VolumeIds=[_volumeId(result)])
+
+# steps run after a call, before the jobs depending on it can start
+READY = {
+	'ec2ClientCreateVolume':   _availableVolume,
+	'ec2ResourceCreateVolume': _availableVolume,
+	'ec2ClientAttachVolume':   _attachedVolume,
+	'ec2ResourceAttachVolume': _attachedVolume,
+	'ec2ClientDetachVolume':   _availableVolume,
+	'ec2ResourceDetachVolume': _availableVolume
+}
+
+def batchLoad(path):
+	''' Load the jobs of a json or yaml batch file
+
+		@type path:		string
+		@param path:	path of the batch file
+		@rtype:    [dict,...,dict]
+		@return:   the jobs
+	'''
+	with open(path) as f:
+		if path.endswith(('.yaml', '.yml')):
+			import yaml
+			return yaml.safe_load(f)['jobs']
+		return json.load(f)['jobs']
+
+def _references(value):
+	if isinstance(value, basestring):
+		return [m.group(1) for m in REFERENCE.finditer(value)]
+	if isinstance(value, dict):
+		return sum([_references(v) for v in value.values()], [])
+	if isinstance(value, (list, tuple)):
+		return sum([_references(v) for v in value], [])
+	return []
+
+def _resources(value):
+	# literal ids, and references: identical ones name the same resource once resolved
+	if isinstance(value, basestring):
+		return set([value]) if RESOURCE.match(value) else set(m.group(0) for m in REFERENCE.finditer(value))
+	if isinstance(value, dict):
+		return set().union(*[_resources(v) for v in value.values()])
+	if isinstance(value, (list, tuple)):
+		return set().union(*[_resources(v) for v in value])
+	return set()
+
+def batchGraph(jobs):
+	''' Compute the dependencies of every job
+
+		@type jobs:		[dict,...,dict]
+		@param jobs:	jobs as described in the module notes
+		@rtype:    dict
+		@return:   {job id: set of the job ids it depends on}
+	'''
+	ids   = [job['id'] for job in jobs]
+	graph = {}
+
+	if len(set(ids)) != len(ids):
+		raise BatchError('job ids must be unique')
+
+	for position, job in enumerate(jobs):
+		depends = set(job.get('after', [])) | set(_references(job.get('args', {})))
+
+		# jobs touching the same resources keep their order, unless both only read
+		mine = _resources(job.get('args', {}))
+		for previous in jobs[:position]:
+			readers = READERS.match(job['call'].split('.')[-1]) and READERS.match(previous['call'].split('.')[-1])
+			if not readers and mine & _resources(previous.get('args', {})):
+				depends.add(previous['id'])
+
+		unknown = depends - set(ids)
+		if unknown:
+			raise BatchError('job %s depends on unknown jobs %s' % (job['id'], ', '.join(sorted(unknown))))
+		graph[job['id']] = depends
+
+	# a topological visit finds the cycles
+	visited, active = set(), set()
+	def visit(my_id):
+		if my_id in active:
+			raise BatchError('dependency cycle through job %s' % my_id)
+		if my_id not in visited:
+			active.add(my_id)
+			for other in graph[my_id]:
+				visit(other)
+			active.discard(my_id)
+			visited.add(my_id)
+	for my_id in ids:
+		visit(my_id)
+
+	return graph
+
+def _lookup(result, path):
+	for step in path:
+		if isinstance(result, dict):
+			result = result[step]
+		elif isinstance(result, (list, tuple)):
+			result = result[int(step)]
+		else:
+			result = getattr(result, step)
+	return result
+
+def _resolve(value, results):
+	if isinstance(value, basestring):
+		whole = REFERENCE.match(value)
+		if whole and whole.end() == len(value):
+			# a whole reference keeps the type of the value, ex. lists of ids
+			return _lookup(results[whole.group(1)], whole.group(2).split('.')[1:])
+		return REFERENCE.sub(lambda m: str(_lookup(results[m.group(1)], m.group(2).split('.')[1:])), value)
+	if isinstance(value, dict):
+		return dict((k, _resolve(v, results)) for k, v in value.items())
+	if isinstance(value, list):
+		return [_resolve(v, results) for v in value]
+	return value
+
+def _function(call):
+	# problem_1.ec2ClientStart -> problem_1.problem1.ec2ClientStart
+	package, name = call.rsplit('.', 1)
+	if '.' not in package:
+		package = '%s.%s' % (package, package.replace('_', ''))
+	try:
+		return getattr(importlib.import_module(package), name)
+	except (ImportError, AttributeError):
+		raise BatchError('unknown function %s' % call)
+
+def batchRun(jobs, workers = MAX_WORKERS):
+	''' Run the jobs with maximum safe parallelism:
+		a job starts as soon as all its dependencies are done
+
+		@type jobs:		[dict,...,dict]
+		@param jobs:	jobs as described in the module notes
+		@type workers:	integer
+		@param workers:	maximum number of jobs running at once
+		@rtype:    dict
+		@return:   {'results', 'errors', 'skipped', 'timings', 'critical'}
+	'''
+	import boto3
+
+	graph     = batchGraph(jobs)
+	byid      = dict((job['id'], job) for job in jobs)
+	functions = dict((job['id'], _function(job['call'])) for job in jobs)
+
+	# the default session is not safe to initialize from many threads at once
+	boto3.client('ec2')
+
+	results, errors, timings, skipped = {}, {}, {}, []
+	waiting  = dict((my_id, set(depends)) for my_id, depends in graph.items())
+	finished = Queue.Queue()
+	lock     = threading.Lock()
+	running  = [0]
+
+	def execute(my_id):
+		job     = byid[my_id]
+		started = time.time()
+		try:
+			kwargs = _resolve(job.get('args', {}), results)
+			result = functions[my_id](**kwargs)
+			ready  = READY.get(job['call'].split('.')[-1])
+			if ready and job.get('wait', True):
+				ready(result)
+			finished.put((my_id, result, None, started, time.time()))
+		except Exception as e:
+			finished.put((my_id, None, e, started, time.time()))
+
+	def launch():
+		with lock:
+			ready = sorted(my_id for my_id, depends in waiting.items() if not depends)
+			ready = ready[:max(0, workers - running[0])]
+			for my_id in ready:
+				del waiting[my_id]
+				running[0] += 1
+				worker = threading.Thread(target=execute, args=(my_id,))
+				worker.daemon = True
+				worker.start()
+
+	def skip(my_id):
+		# dependents of a failed job never run
+		for other, depends in waiting.items():
+			if my_id in depends and other not in skipped:
+				skipped.append(other)
+				del waiting[other]
+				skip(other)
+
+	launch()
+	while running[0]:
+		my_id, result, error, started, ended = finished.get()
+		with lock:
+			running[0] -= 1
+			timings[my_id] = (started, ended)
+			if error is None:
+				results[my_id] = result
+				for depends in waiting.values():
+					depends.discard(my_id)
+			else:
+				errors[my_id] = error
+				skip(my_id)
+		launch()
+
+	return {
+		'results':  results,
+		'errors':   errors,
+		'skipped':  skipped,
+		'timings':  timings,
+		'critical': batchCriticalPath(graph, timings)}
+
+def batchCriticalPath(graph, timings):
+	''' Find the chain of jobs that determined the duration of the batch:
+		from the last job to end, go back to the dependency that ended last
+
+		@type graph:	dict
+		@param graph:	dependencies, as returned by batchGraph
+		@type timings:	dict
+		@param timings:	{job id: (start, end)} of the executed jobs
+		@rtype:    [string,...,string]
+		@return:   job ids of the critical path, in execution order
+	'''
+	if not timings:
+		return []
+
+	path   = [max(timings, key=lambda my_id: timings[my_id][1])]
+	before = [d for d in graph[path[-1]] if d in timings]
+	while before:
+		path.append(max(before, key=lambda my_id: timings[my_id][1]))
+		before = [d for d in graph[path[-1]] if d in timings]
+
+	return list(reversed(path))
+
+def batchReport(report):
+	''' Print the outcome of batchRun '''
+	timings = report['timings']
+	origin  = min(start for start, end in timings.values()) if timings else 0
+
+	for my_id in sorted(timings, key=lambda my_id: timings[my_id][0]):
+		start, end = timings[my_id]
+		outcome    = 'failed: %s' % report['errors'][my_id] if my_id in report['errors'] else 'done'
+		print "%-20s %8.2f s %8.2f s  %s" % (my_id, start - origin, end - start, outcome)
+
+	for my_id in report['skipped']:
+		print "%-20s skipped" % my_id
+
+	if report['critical']:
+		first, last = report['critical'][0], report['critical'][-1]
+		print "Critical path: ", ' > '.join(report['critical'])
+		print "Critical time: %.2f s" % (timings[last][1] - timings[first][0])
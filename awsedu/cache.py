@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+''' Notes:
+	-	Entries live in memory and in a json file of CACHE_DIR, one file per cache name:
+		a new process reads the file once, then only memory is looked up
+	-	Every entry expires -ttl- seconds after it was stored, the ttl given to put or
+		the default one of the cache. A reader can ask for fresher entries with the ttl of get:
+		caches are shared per name, callers with different ttls do not step on each other
+	-	The file is rewritten on every put through a rename, readers never see half a file
+	-	The cache is best effort: an unreadable or unwritable file only costs the API calls
+'''
+
+CACHE_DIR = os.environ.get('AWSEDU_CACHE', os.path.join(os.path.expanduser('~'), '.awsedu', 'cache'))
+
+class DiskCache(object):
+	''' Thread safe key/value cache with expiry, in memory and on disk '''
+
+	def __init__(self, name, ttl = None, directory = None):
+		''' @type name:			string
+			@param name:		name of the json file, ex. images-eu-west-3
+			@type ttl:			integer
+			@param ttl:			default seconds an entry stays valid, forever if None
+			@type directory:	string
+			@param directory:	directory of the file, CACHE_DIR if None
+		'''
+		self.path    = os.path.join(directory or CACHE_DIR, name + '.json')
+		self.ttl     = ttl
+		self.lock    = threading.Lock()
+		self.entries = None
+
+	def _load(self):
+		if self.entries is None:
+			try:
+				with open(self.path) as f:
+					self.entries = json.load(f)
+			except (IOError, OSError, ValueError):
+				self.entries = {}
+
+	def _save(self):
+		try:
+			directory = os.path.dirname(self.path)
+			if not os.path.isdir(directory):
+				os.makedirs(directory)
+			descriptor, temporary = tempfile.mkstemp(dir=directory)
+			with os.fdopen(descriptor, 'w') as f:
+				json.dump(self.entries, f)
+			os.rename(temporary, self.path)
+		except (IOError, OSError):
+			pass
+
+	def get(self, key, ttl = None):
+		''' @type ttl:		integer
+			@param ttl:		also ignore an entry stored more than -ttl- seconds ago
+			@rtype:    object
+			@return:   the value of -key-, None if missing or expired
+		'''
+		now = time.time()
+		with self.lock:
+			self._load()
+			entry = self.entries.get(key)
+			if entry is None or 'stored' not in entry:
+				return None
+			if entry['expires'] is not None and entry['expires'] < now:
+				return None
+			if ttl is not None and entry['stored'] + ttl < now:
+				return None
+			return entry['value']
+
+	def put(self, key, value, ttl = None):
+		''' Store -value- under -key-, value must be json serializable
+
+			@type ttl:		integer
+			@param ttl:		seconds the entry stays valid, the default of the cache if None
+		'''
+		ttl = self.ttl if ttl is None else ttl
+		now = time.time()
+		with self.lock:
+			self._load()
+			self.entries[key] = {'stored': now, 'expires': None if ttl is None else now + ttl, 'value': value}
+			self._save()
+
+	def clear(self):
+		''' Forget every entry, in memory and on disk '''
+		with self.lock:
+			self.entries = {}
+			self._save()
+
+_CACHES = {}
+_LOCK   = threading.Lock()
+
+def diskCache(name, ttl = None):
+	''' Get the cache named -name-, shared by the whole process:
+		the ttl of the first caller is the default one, pass the others to get and put
+
+		@type name:		string
+		@param name:	name of the json file, ex. images-eu-west-3
+		@type ttl:		integer
+		@param ttl:		default seconds an entry stays valid, forever if None
+		@rtype:    DiskCache
+		@return:   the cache
+	'''
+	with _LOCK:
+		if name not in _CACHES:
+			_CACHES[name] = DiskCache(name, ttl)
+		return _CACHES[name]
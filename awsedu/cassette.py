@@ -0,0 +1,231 @@
+import base64
+import json
+import re
+import threading
+import time
+
+import boto3
+import botocore
+from botocore.awsrequest import AWSResponse
+
+''' Notes:
+	-	Recording keeps every HTTP exchange of the clients created from now on,
+		retries and waiter polls included: request body, response, latency and the time
+		it was sent, relative to the first request of the cassette
+	-	Replaying answers from the cassette instead of the network, after the recorded
+		latency multiplied by -scale-. Requests are not signed: no credentials are needed
+	-	Replay runs a virtual clock on the recorded timeline. Every recorded write,
+		ex. StopInstances, is used once and in order, and it re-aligns the clock. Reads
+		(Describe*, List*, Get*) get the latest answer recorded at the virtual time.
+		A waiter that polls more or less often still sees the state the recorded
+		world had at that moment, ex. 'stopping' until the instance was stopped
+	-	Requests are matched on service, operation and body, idempotency tokens excluded.
+		Reads fall back to the answers of the same operation with another body,
+		writes never do: a write with other parameters fails with CassetteError
+	-	Client-side sleeps, waiter delays and retry backoffs, are the code under test: they are not scaled
+	-	Connection errors and streamed bodies are not recorded
+'''
+
+HOOK_ID = 'awsedu-cassette'
+
+READS    = re.compile(r'^(Describe|List|Get)')
+VOLATILE = re.compile(r'(ClientToken|ClientRequestToken)(=[^&]*|"\s*:\s*"[^"]*")')
+
+class CassetteError(Exception):
+	''' Raised when a replayed request has no recorded answer '''
+	pass
+
+def _operation(event_name):
+	# event names look like before-send.ec2.DescribeInstances
+	return event_name.split('.')[1:3]
+
+def _canonical(body):
+	if body is None:
+		return ''
+	if not isinstance(body, basestring):
+		body = body.read() if hasattr(body, 'read') else str(body)
+	return VOLATILE.sub(r'\1', body)
+
+def _encode(body):
+	try:
+		return {'body': body.decode('utf-8')}
+	except UnicodeDecodeError:
+		return {'body': base64.b64encode(body), 'encoding': 'base64'}
+
+def _decode(interaction):
+	if interaction.get('encoding') == 'base64':
+		return base64.b64decode(interaction['body'])
+	return interaction['body'].encode('utf-8')
+
+class _Raw(object):
+	# the body of a replayed response, read by AWSResponse.content
+
+	def __init__(self, body):
+		self.body = body
+
+	def stream(self, **kwargs):
+		return [self.body]
+
+class Recorder(object):
+	''' Records the HTTP exchanges of instrumented sessions '''
+
+	def __init__(self, path, region = None):
+		self.path         = path
+		self.region       = region
+		self.lock         = threading.Lock()
+		self.local        = threading.local()
+		self.origin       = None
+		self.interactions = []
+
+	def sending(self, request, event_name, **kwargs):
+		now = time.time()
+		with self.lock:
+			if self.origin is None:
+				self.origin = now
+		self.local.sent = (_operation(event_name), _canonical(request.body), now)
+
+	def received(self, response_dict, event_name, **kwargs):
+		sent = getattr(self.local, 'sent', None)
+		self.local.sent = None
+		if sent is None or response_dict is None:
+			return
+		if not isinstance(response_dict['body'], basestring):
+			return
+		(service, operation), body, started = sent
+		interaction = dict(_encode(response_dict['body'] or ''),
+			service=service,
+			operation=operation,
+			request=body,
+			at=started - self.origin,
+			latency=time.time() - started,
+			status=response_dict['status_code'],
+			headers=dict(response_dict['headers']))
+		with self.lock:
+			self.interactions.append(interaction)
+
+	def save(self):
+		''' Write the cassette file '''
+		with self.lock:
+			with open(self.path, 'w') as f:
+				json.dump({'version': 1, 'region': self.region, 'interactions': self.interactions}, f, indent=1)
+
+class Replayer(object):
+	''' Answers the requests of instrumented sessions from a cassette '''
+
+	def __init__(self, path, scale = 1.0):
+		''' @type path:		string
+			@param path:	path of the cassette file
+			@type scale:	float
+			@param scale:	factor of the recorded latencies and timeline, ex. 0.1 runs 10 times faster
+		'''
+		if scale <= 0:
+			raise ValueError('scale must be positive')
+		with open(path) as f:
+			cassette = json.load(f)
+		self.region       = cassette['region']
+		self.interactions = cassette['interactions']
+		self.scale        = scale
+		self.lock         = threading.Lock()
+		self.used         = set()
+		self.anchor       = None
+
+	def _candidates(self, service, operation, body):
+		same    = [i for i in self.interactions if i['service'] == service and i['operation'] == operation]
+		matched = [i for i in same if i['request'] == body]
+		if matched or READS.match(operation):
+			return matched or same
+		if same:
+			# replaying a write recorded with other parameters would lie about its effect
+			raise CassetteError('no recorded %s.%s with these parameters: %s' % (service, operation, body))
+		return []
+
+	def _pick(self, service, operation, body, virtual):
+		candidates = self._candidates(service, operation, body)
+		if READS.match(operation):
+			past = [i for i in candidates if i['at'] <= virtual]
+			return past[-1] if past else (candidates[0] if candidates else None)
+		for interaction in candidates:
+			if id(interaction) not in self.used:
+				self.used.add(id(interaction))
+				return interaction
+		return None
+
+	def sending(self, request, event_name, **kwargs):
+		service, operation = _operation(event_name)
+		now = time.time()
+
+		with self.lock:
+			if self.anchor is None:
+				self.anchor = (0.0, now)
+			virtual     = self.anchor[0] + (now - self.anchor[1]) / self.scale
+			interaction = self._pick(service, operation, _canonical(request.body), virtual)
+			if interaction is None:
+				raise CassetteError('no recorded answer for %s.%s' % (service, operation))
+			if not READS.match(operation):
+				self.anchor = (interaction['at'], now)
+
+		time.sleep(interaction['latency'] * self.scale)
+		return AWSResponse(request.url, interaction['status'], interaction['headers'], _Raw(_decode(interaction)))
+
+	def signer(self, **kwargs):
+		return botocore.UNSIGNED
+
+# the single active recorder or replayer, with the session it is registered on
+_ACTIVE = []
+
+def _hooks(active):
+	hooks = [('before-send', active.sending)]
+	if isinstance(active, Recorder):
+		hooks.append(('response-received', active.received))
+	else:
+		hooks.append(('choose-signer', active.signer))
+	return hooks
+
+def cassetteRecord(path, session = None):
+	''' Start recording the HTTP exchanges of the clients created from now on
+
+		@type path:		string
+		@param path:	cassette file, written by cassetteStop
+		@type session:	boto3.Session
+		@param session:	session to instrument, the default one if None
+		@rtype:    Recorder
+		@return:   the recorder
+	'''
+	session = session or boto3._get_default_session()
+	return _start(Recorder(path, session.region_name), session)
+
+def cassetteReplay(path, scale = 1.0, session = None):
+	''' Answer the requests of the clients created from now on from a cassette
+
+		@type path:		string
+		@param path:	cassette file
+		@type scale:	float
+		@param scale:	factor of the recorded latencies and timeline
+		@type session:	boto3.Session
+		@param session:	session to instrument, the default one if None
+		@rtype:    Replayer
+		@return:   the replayer
+	'''
+	session  = session or boto3._get_default_session()
+	replayer = Replayer(path, scale)
+	if session.region_name is None and replayer.region:
+		session._session.set_config_variable('region', replayer.region)
+	return _start(replayer, session)
+
+def _start(active, session):
+	if _ACTIVE:
+		raise CassetteError('a cassette is already recording or replaying')
+	for event, handler in _hooks(active):
+		session.events.register_first(event, handler, unique_id=HOOK_ID + event)
+	_ACTIVE.append((active, session))
+	return active
+
+def cassetteStop():
+	''' Stop recording or replaying, a recording is saved to its file '''
+	if not _ACTIVE:
+		return
+	active, session = _ACTIVE.pop()
+	for event, handler in _hooks(active):
+		session.events.unregister(event, handler, unique_id=HOOK_ID + event)
+	if isinstance(active, Recorder):
+		active.save()
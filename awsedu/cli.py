@@ -0,0 +1,288 @@
+import argparse
+import sys
+
+''' Notes:
+	-	boto3, botocore and the problem modules are imported by the command that runs,
+		never at module level: --help and argument errors do not pay for them
+	-	Service models are loaded when the first client is created, so a command
+		only loads the model of the service it talks to
+	-	Keep this module free of heavy imports, tests/test_cli.py checks the cold start budget
+'''
+
+def _instancesList(args):
+	if args.select is None:
+		import problem_1.problem1 as p1
+		return p1.ec2ClientListInstanceByStatus(args.state, fields=args.fields)
+
+	import awsedu.selector as selector
+	for instance in selector.selectorSelect(args.select):
+		print "Instance id: ", instance['InstanceId']
+		print "Instance type: ", instance['InstanceType']
+		print "Instance state: ", instance['State']['Name']
+		print "Instance launch time: ", instance['LaunchTime']
+		print "--------------------"
+
+def _readiness(args):
+	if not args.ports and not args.status_checks:
+		return None
+	return {'ports': args.ports or [], 'status': args.status_checks, 'deadline': args.deadline}
+
+def _instancesLaunch(args):
+	import problem_1.problem1 as p1
+	p1.ec2ClientLaunch(args.min or args.count, args.count, args.ami, args.type, sync=args.wait, readiness=_readiness(args))
+
+def _instancesStop(args):
+	import problem_1.problem1 as p1
+	p1.ec2ClientStop(args.ids, force=args.force, sync=args.wait)
+
+def _instancesStart(args):
+	import problem_1.problem1 as p1
+	p1.ec2ClientStart(args.ids, sync=args.wait, readiness=_readiness(args))
+
+def _instancesTerminate(args):
+	import problem_1.problem1 as p1
+	p1.ec2ClientTerminate(args.ids, sync=args.wait)
+
+def _instancesModifyType(args):
+	import problem_1.problem1 as p1
+	p1.ec2ClientModifyInstanceType(args.ids, args.type)
+
+def _instancesReconcile(args):
+	import problem_1.reconciler as rec
+	rec.ec2ClientReconcile(rec.reconcileLoadSpec(args.spec), plan=args.plan, sync=args.wait, replace=args.replace)
+
+def _volumesList(args):
+	import problem_2.problem2 as p2
+	for volume in p2.ec2ClientListAttacchedVolumes(args.ids)['Volumes']:
+		print "Volume id: ", volume['VolumeId']
+		print "Volume type: ", volume['VolumeType']
+		print "Volume size: ", volume['Size']
+		for attachment in volume['Attachments']:
+			print "Attached to: ", attachment['InstanceId'], attachment['Device']
+		print "--------------------"
+
+def _volumesCreate(args):
+	import problem_2.problem2 as p2
+	print "Volume id: ", p2.ec2ClientCreateVolume(args.zone, args.type, args.size, args.encrypted)['VolumeId']
+
+def _volumesDelete(args):
+	import problem_2.problem2 as p2
+	p2.ec2ClientDeleteVolume(args.id)
+
+def _volumesAttach(args):
+	import problem_2.problem2 as p2
+	p2.ec2ClientAttachVolume(args.device, args.volume, args.instance)
+
+def _volumesDetach(args):
+	import problem_2.problem2 as p2
+	p2.ec2ClientDetachVolume(args.id, force=args.force)
+
+def _volumesSnapshot(args):
+	import problem_2.snapshots as snapshots
+	try:
+		snapshotids = snapshots.ec2ClientSnapshotInstances(args.ids, args.name, args.rate, sync=args.wait)
+	except snapshots.SnapshotError as e:
+		# the snapshots taken must still be known
+		for snapshotid in filter(None, e.done):
+			print "Snapshot id: ", snapshotid
+		raise
+	for snapshotid in snapshotids:
+		print "Snapshot id: ", snapshotid
+
+def _volumesPrune(args):
+	import problem_2.snapshots as snapshots
+	snapshots.ec2ClientPruneSnapshots(args.name, args.keep, args.days, args.rate, plan=args.plan, region=args.region)
+
+def _iamCreateGroup(args):
+	import problem_3.problem3 as p3
+	print "Group: ", p3.iamCreateSecurityGroup(args.name).name
+
+def _iamCreateUser(args):
+	import problem_3.problem3 as p3
+	print "User: ", p3.iamCreateUser(args.name).name
+
+def _iamAddUser(args):
+	import problem_3.problem3 as p3
+	p3.iamAddUserToGroup(args.group, args.user)
+
+def _iamDeleteUser(args):
+	import problem_3.problem3 as p3
+	p3.iamDeleteUser(args.name)
+
+def _batch(args):
+	import awsedu.batch as batch
+	report = batch.batchRun(batch.batchLoad(args.file), workers=args.workers)
+	batch.batchReport(report)
+	if report['errors']:
+		raise RuntimeError('%d jobs failed, %d skipped' % (len(report['errors']), len(report['skipped'])))
+
+def _daemon(args):
+	import awsedu.coalescer as coalescer
+	coalescer.coalescerServe(args.port, args.window, args.interval)
+
+def _parser():
+	parser = argparse.ArgumentParser(prog='awsedu', description='AWS exercises from the command line')
+	parser.add_argument('--metrics', action='store_true', help='print the API call metrics when done')
+	parser.add_argument('--hedge', action='store_true', help='hedge slow describe and list calls, bound them by a deadline; '
+		'they are sent with the proxies of the environment and the ca_bundle of the profile')
+	parser.add_argument('--record', metavar='CASSETTE', help='record the HTTP exchanges into a cassette file')
+	parser.add_argument('--replay', metavar='CASSETTE', help='answer from a cassette file instead of AWS')
+	parser.add_argument('--scale', type=float, default=1.0, help='factor of the replayed latencies')
+	groups = parser.add_subparsers(title='resources')
+
+	def command(subparsers, name, handler, text):
+		sub = subparsers.add_parser(name, help=text, description=text)
+		sub.set_defaults(handler=handler)
+		return sub
+
+	def waitable(sub):
+		sub.add_argument('--no-wait', dest='wait', action='store_false', help='do not wait for the operation to take effect')
+		return sub
+
+	def probing(sub):
+		sub.add_argument('--ports', type=int, nargs='+', help='wait for these TCP ports to accept connections, ex. 22')
+		sub.add_argument('--status-checks', action='store_true', help='wait for the status checks to be ok')
+		sub.add_argument('--deadline', type=float, default=600, help='seconds given to the instances to be ready')
+		return sub
+
+	instances = groups.add_parser('instances', help='EC2 instances').add_subparsers()
+
+	sub = command(instances, 'list', _instancesList, 'list the instances in a given state')
+	sub.add_argument('--state', default='running', help='running|stopped|terminated...')
+	sub.add_argument('--fields', nargs='+', help='only keep these fields of every instance, ex. InstanceId State.Name')
+	sub.add_argument('--select', help='selector, ex. "state=running and type!=t2.nano | top 2 by launch_time"')
+
+	sub = probing(waitable(command(instances, 'launch', _instancesLaunch, 'launch instances')))
+	sub.add_argument('ami', help='amazon machine image deployed: an id, an alias like amazon-linux-2 or a name pattern')
+	sub.add_argument('--count', type=int, default=1, help='maximum number of instances to launch')
+	sub.add_argument('--min', type=int, help='minimum number of instances to launch, --count if missing')
+	sub.add_argument('--type', default='t2.micro', help='type of launched instances')
+
+	sub = waitable(command(instances, 'stop', _instancesStop, 'stop running instances'))
+	sub.add_argument('ids', nargs='+')
+	sub.add_argument('--force', action='store_true', help='force the stop')
+
+	sub = probing(waitable(command(instances, 'start', _instancesStart, 'start stopped instances')))
+	sub.add_argument('ids', nargs='+')
+
+	sub = waitable(command(instances, 'terminate', _instancesTerminate, 'terminate instances'))
+	sub.add_argument('ids', nargs='+')
+
+	sub = command(instances, 'modify-type', _instancesModifyType, 'change the type of stopped instances')
+	sub.add_argument('ids', nargs='+')
+	sub.add_argument('--type', required=True, help='t2.micro|m4.large|...')
+
+	sub = waitable(command(instances, 'reconcile', _instancesReconcile, 'bring instance groups to the state of a json spec'))
+	sub.add_argument('spec', help='path of the json spec')
+	sub.add_argument('--plan', action='store_true', help='only report the changes and their API calls')
+	sub.add_argument('--replace', action='store_true', help='replace the instances of an image alias by its newer ami')
+
+	volumes = groups.add_parser('volumes', help='EBS volumes').add_subparsers()
+
+	sub = command(volumes, 'list', _volumesList, 'list the volumes attached to instances')
+	sub.add_argument('ids', nargs='+', help='ids of the instances')
+
+	sub = command(volumes, 'create', _volumesCreate, 'create a volume')
+	sub.add_argument('--zone', required=True, help='one of the available zones')
+	sub.add_argument('--type', default='gp2', help='standard|io1|gp2|sc1|st1')
+	sub.add_argument('--size', type=int, required=True, help='size in GigaBytes')
+	sub.add_argument('--encrypted', action='store_true')
+
+	sub = command(volumes, 'delete', _volumesDelete, 'delete a volume')
+	sub.add_argument('id')
+
+	sub = command(volumes, 'attach', _volumesAttach, 'attach a volume to an instance')
+	sub.add_argument('volume')
+	sub.add_argument('instance')
+	sub.add_argument('--device', default='/dev/sdh', help='ex. /dev/sdh or xvdh')
+
+	sub = command(volumes, 'detach', _volumesDetach, 'detach a volume from its instance')
+	sub.add_argument('id')
+	sub.add_argument('--force', action='store_true', help='force the operation')
+
+	sub = waitable(command(volumes, 'snapshot', _volumesSnapshot, 'snapshot the volumes attached to instances'))
+	sub.add_argument('ids', nargs='+', help='ids of the instances')
+	sub.add_argument('--name', required=True, help='name of the backup')
+	sub.add_argument('--rate', type=int, default=5, help='maximum number of calls per second')
+
+	sub = command(volumes, 'prune', _volumesPrune, 'delete the expired snapshots of a backup')
+	sub.add_argument('--name', required=True, help='name of the backup')
+	sub.add_argument('--keep', type=int, default=7, help='snapshots kept for every volume')
+	sub.add_argument('--days', type=int, help='snapshots younger than this are always kept')
+	sub.add_argument('--rate', type=int, default=5, help='maximum number of calls per second')
+	sub.add_argument('--plan', action='store_true', help='only list the snapshots to delete')
+	sub.add_argument('--region', help='region of the backup, the default one if missing')
+
+	iam = groups.add_parser('iam', help='IAM users and groups').add_subparsers()
+
+	sub = command(iam, 'create-group', _iamCreateGroup, 'create a group')
+	sub.add_argument('name')
+
+	sub = command(iam, 'create-user', _iamCreateUser, 'create a user')
+	sub.add_argument('name')
+
+	sub = command(iam, 'add-user', _iamAddUser, 'add a user to a group')
+	sub.add_argument('group')
+	sub.add_argument('user')
+
+	sub = command(iam, 'delete-user', _iamDeleteUser, 'delete a user')
+	sub.add_argument('name')
+
+	sub = command(groups, 'batch', _batch, 'run the jobs of a json or yaml batch file in parallel')
+	sub.add_argument('file')
+	sub.add_argument('--workers', type=int, default=16, help='maximum number of jobs running at once')
+
+	sub = command(groups, 'daemon', _daemon, 'merge concurrent lifecycle requests into batched API calls')
+	sub.add_argument('--port', type=int, default=8649, help='localhost port to listen on')
+	sub.add_argument('--window', type=float, default=0.05, help='seconds a batch stays open to new requests')
+	sub.add_argument('--interval', type=float, default=5, help='seconds between two polls of the shared waiter')
+
+	return parser
+
+def main(argv = None):
+	''' Entry point of the awsedu command
+
+		@type argv:		[string,...,string]
+		@param argv:	command line arguments, sys.argv[1:] if None
+		@rtype:    integer
+		@return:   exit status
+	'''
+	parser = _parser()
+	args   = parser.parse_args(argv)
+
+	if args.hedge and args.replay:
+		parser.error('--hedge would send the replayed reads to AWS')
+
+	if args.metrics:
+		import awsedu.metrics as metrics
+		metrics.metricsEnable()
+
+	if args.hedge:
+		import awsedu.hedging as hedging
+		hedger = hedging.hedgingEnable()
+
+	if args.record or args.replay:
+		import awsedu.cassette as cassette
+		if args.record:
+			cassette.cassetteRecord(args.record)
+		else:
+			cassette.cassetteReplay(args.replay, args.scale)
+
+	try:
+		args.handler(args)
+	except Exception as e:
+		# botocore errors are only known once boto3 is loaded
+		print >> sys.stderr, "awsedu: %s" % e
+		return 1
+	finally:
+		if args.record or args.replay:
+			cassette.cassetteStop()
+		if args.metrics:
+			sys.stdout.write(metrics.METRICS.prometheus())
+			if args.hedge:
+				sys.stdout.write(hedger.prometheus())
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,334 @@
+import json
+import re
+import threading
+import time
+import urllib2
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+from problem_1.events import DEAD_ENDS
+
+''' Notes:
+	-	The daemon listens on localhost only, every POST carries a json body:
+		/stop {"ids": [...], "force": false, "sync": true}, /start and /terminate {"ids", "sync"},
+		/describe {"ids"}, /wait {"ids", "state"}; GET /stats reports the calls saved
+	-	Requests of the same operation arriving within -window- seconds become
+		a single API call on the union of their ids, each caller gets back its own instances
+	-	One invalid id fails a whole batched call: the callers of a batch failed by an
+		InvalidInstanceID error retry alone, so that only the caller of the invalid id
+		sees the error. Any other error, ex. throttling, is the answer of every caller:
+		retrying alone would multiply the calls
+	-	All the callers waiting on instances share one poller: a single
+		describe_instances every -interval- seconds covers every awaited instance.
+		When an awaited id is invalid the poll describes the others without it, one by one
+		if the error does not name it, and only the waits on the invalid id fail.
+		Other errors skip the round, the next one tries again
+'''
+
+PORT = 8649
+
+# EC2 limit of ids per call
+MAX_IDS = 1000
+
+RESULTS = {
+	'stop':      ('stop_instances',      'StoppingInstances'),
+	'start':     ('start_instances',     'StartingInstances'),
+	'terminate': ('terminate_instances', 'TerminatingInstances'),
+	'describe':  ('describe_instances',  'Instances')
+}
+
+TARGETS = {'stop': 'stopped', 'start': 'running', 'terminate': 'terminated'}
+
+INSTANCE_ID = re.compile(r'\bi-[0-9a-zA-Z]+')
+
+def _invalid(error):
+	# errors caused by the ids themselves, ex. InvalidInstanceID.NotFound or .Malformed
+	return isinstance(error, ClientError) and error.response['Error']['Code'].startswith('InvalidInstanceID.')
+
+class _Batch(object):
+
+	def __init__(self):
+		self.ids      = set()
+		self.done     = threading.Event()
+		self.response = None
+		self.error    = None
+
+class Coalescer(object):
+	''' Merges concurrent lifecycle and describe requests into batched API calls '''
+
+	def __init__(self, window = 0.05, interval = 5, region = None):
+		''' @type window:		float
+			@param window:		seconds a batch stays open to new requests
+			@type interval:		float
+			@param interval:	seconds between two polls of the shared waiter
+		'''
+		self.window    = window
+		self.interval  = interval
+		self.ec2client = boto3.client('ec2', region_name=region)
+		self.lock      = threading.Lock()
+		self.pending   = {}
+		self.waits     = []
+		self.poller    = None
+		self.stats     = {'requests': 0, 'calls': 0, 'polls': 0}
+
+	def _call(self, operation, ids, force):
+		method, key = RESULTS[operation]
+		kwargs      = {'InstanceIds': sorted(ids)}
+		if operation == 'stop':
+			kwargs['Force'] = force
+
+		with self.lock:
+			self.stats['calls'] += 1
+
+		response = getattr(self.ec2client, method)(**kwargs)
+
+		if operation == 'describe':
+			return dict((i['InstanceId'], i) for r in response['Reservations'] for i in r['Instances'])
+		return dict((i['InstanceId'], i) for i in response[key])
+
+	def _flush(self, key, batch):
+		with self.lock:
+			if self.pending.get(key) is batch:
+				del self.pending[key]
+		try:
+			batch.response = self._call(key[0], batch.ids, key[1])
+		except Exception as e:
+			batch.error = e
+		finally:
+			# whatever happens, the callers of the batch must not wait forever
+			batch.done.set()
+
+	def call(self, operation, ids, force = False):
+		''' Run -operation- on -ids-, batched with the concurrent requests
+
+			@type operation:	string
+			@param operation:	stop|start|terminate|describe
+			@type ids:			[string,...,string]
+			@param ids:			ids of the instances
+			@type force:		boolean
+			@param force:		force the stop
+			@rtype:    dict
+			@return:   {'StoppingInstances'|...|'Instances': [dict,...,dict]} of -ids- only
+		'''
+		key = (operation, bool(force))
+
+		with self.lock:
+			self.stats['requests'] += 1
+			batch = self.pending.get(key)
+			if batch is None or len(batch.ids | set(ids)) > MAX_IDS:
+				# a full batch is left to its timer, new requests open another one
+				batch = self.pending[key] = _Batch()
+				threading.Timer(self.window, self._flush, (key, batch)).start()
+			batch.ids.update(ids)
+
+		batch.done.wait()
+
+		if batch.error is None:
+			response = batch.response
+		elif batch.ids == set(ids) or not _invalid(batch.error):
+			raise batch.error
+		else:
+			response = self._call(operation, ids, force)
+
+		return {RESULTS[operation][1]: [response[my_id] for my_id in ids if my_id in response]}
+
+	def _describe(self, ids):
+		# one invalid id fails a whole describe: the others are described without it
+		try:
+			return self.call('describe', ids)['Instances'], {}
+		except ClientError as e:
+			if not _invalid(e):
+				raise
+			code   = e.response['Error']['Code']
+			errors = dict((my_id, code) for my_id in INSTANCE_ID.findall(e.response['Error'].get('Message', '')) if my_id in ids)
+
+		others = [my_id for my_id in ids if my_id not in errors]
+		if errors and others:
+			try:
+				return self._call('describe', others, False).values(), errors
+			except ClientError as e:
+				if not _invalid(e):
+					raise
+
+		# the error does not name the invalid ids: one call per id
+		instances = []
+		for my_id in others:
+			try:
+				instances.extend(self._call('describe', [my_id], False).values())
+			except ClientError as e:
+				if not _invalid(e):
+					raise
+				errors[my_id] = e.response['Error']['Code']
+		return instances, errors
+
+	def _round(self):
+		# right after a request describe may still report the previous state
+		time.sleep(self.interval)
+
+		with self.lock:
+			awaited = sorted(set().union(*[wait['ids'] for wait in self.waits]))
+			if not awaited:
+				self.poller = None
+				return False
+
+		states, errors = {}, {}
+		try:
+			for start in range(0, len(awaited), MAX_IDS):
+				instances, invalid = self._describe(awaited[start:start + MAX_IDS])
+				states.update((i['InstanceId'], i['State']['Name']) for i in instances)
+				errors.update(invalid)
+		except (BotoCoreError, ClientError):
+			# ex. throttled or unreachable endpoint: the next round tries again
+			return True
+
+		with self.lock:
+			self.stats['polls'] += 1
+			for wait in list(self.waits):
+				reached = [my_id for my_id in wait['ids'] if states.get(my_id) == wait['state']]
+				failed  = [my_id for my_id in wait['ids'] if states.get(my_id) in DEAD_ENDS.get(wait['state'], [])]
+				invalid = ['%s (%s)' % (my_id, errors[my_id]) for my_id in sorted(wait['ids']) if my_id in errors]
+				if failed:
+					wait['error'] = '%s cannot become %s' % (', '.join(failed), wait['state'])
+				elif invalid:
+					wait['error'] = 'cannot describe %s' % ', '.join(invalid)
+				if failed or invalid or len(reached) == len(wait['ids']):
+					self.waits.remove(wait)
+					wait['done'].set()
+		return True
+
+	def _poll(self):
+		try:
+			while self._round():
+				pass
+		except Exception as e:
+			# a dead poller must not leave its callers waiting until their timeout
+			with self.lock:
+				for wait in self.waits:
+					wait['error'] = 'poller failed: %r' % e
+					wait['done'].set()
+				self.waits = []
+		finally:
+			with self.lock:
+				if self.poller is threading.current_thread():
+					self.poller = None
+
+	def wait(self, ids, state, timeout = 600):
+		''' Wait for the instances to be in state -state-,
+			sharing a single poller with every other waiting caller
+
+			@type ids:		[string,...,string]
+			@param ids:		ids of the instances
+			@type state:	string
+			@param state:	running|stopped|terminated
+			@type timeout:	integer
+			@param timeout:	seconds before giving up
+			@rtype:    None
+			@return:   None
+		'''
+		wait = {'ids': set(ids), 'state': state, 'done': threading.Event(), 'error': None}
+
+		with self.lock:
+			self.waits.append(wait)
+			if self.poller is None:
+				self.poller = threading.Thread(target=self._poll)
+				self.poller.daemon = True
+				self.poller.start()
+
+		if not wait['done'].wait(timeout):
+			with self.lock:
+				if wait in self.waits:
+					self.waits.remove(wait)
+			raise RuntimeError('instances are not %s after %d seconds' % (state, timeout))
+		if wait['error']:
+			raise RuntimeError(wait['error'])
+
+class _Handler(BaseHTTPRequestHandler):
+
+	def _reply(self, status, body):
+		data = json.dumps(body, default=str)
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		if self.path != '/stats':
+			return self._reply(404, {'error': 'unknown path %s' % self.path})
+		with self.server.coalescer.lock:
+			self._reply(200, dict(self.server.coalescer.stats))
+
+	def do_POST(self):
+		operation = self.path.strip('/')
+		coalescer = self.server.coalescer
+
+		try:
+			body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or '{}')
+			if operation == 'wait':
+				coalescer.wait(body['ids'], body['state'], body.get('timeout', 600))
+				return self._reply(200, {})
+			if operation not in RESULTS:
+				return self._reply(404, {'error': 'unknown operation %s' % operation})
+
+			response = coalescer.call(operation, body['ids'], body.get('force', False))
+			if body.get('sync') and operation in TARGETS:
+				coalescer.wait(body['ids'], TARGETS[operation], body.get('timeout', 600))
+			self._reply(200, response)
+		except ClientError as e:
+			self._reply(400, {'error': str(e), 'code': e.response['Error']['Code']})
+		except BotoCoreError as e:
+			self._reply(502, {'error': str(e)})
+		except (KeyError, ValueError, RuntimeError) as e:
+			self._reply(400, {'error': str(e)})
+
+	def log_message(self, format, *args):
+		pass
+
+class CoalescerServer(ThreadingMixIn, HTTPServer):
+	''' HTTP front end of a Coalescer, one thread per request '''
+
+	daemon_threads = True
+
+	def __init__(self, coalescer, port = PORT):
+		HTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+		self.coalescer = coalescer
+
+def coalescerServe(port = PORT, window = 0.05, interval = 5, region = None):
+	''' Run the coalescing daemon until interrupted
+
+		@type port:		integer
+		@param port:	localhost port to listen on
+		@type window:	float
+		@param window:	seconds a batch stays open to new requests
+		@type interval:	float
+		@param interval:	seconds between two polls of the shared waiter
+	'''
+	server = CoalescerServer(Coalescer(window, interval, region), port)
+	print "coalescing requests on 127.0.0.1:%d" % port
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		server.server_close()
+
+def coalescerRequest(operation, ids, port = PORT, **kwargs):
+	''' Send a request to the coalescing daemon
+
+		@type operation:	string
+		@param operation:	stop|start|terminate|describe|wait
+		@type ids:			[string,...,string]
+		@param ids:			ids of the instances
+		@type port:			integer
+		@param port:		localhost port of the daemon
+		@rtype:    dict
+		@return:   the instances of -ids- as returned by the operation
+	'''
+	body    = json.dumps(dict(kwargs, ids=ids))
+	request = urllib2.Request('http://127.0.0.1:%d/%s' % (port, operation), body,
+		{'Content-Type': 'application/json'})
+	try:
+		return json.loads(urllib2.urlopen(request).read())
+	except urllib2.HTTPError as e:
+		raise RuntimeError(json.loads(e.read())['error'])
@@ -0,0 +1,265 @@
+import collections
+import os
+import re
+import threading
+import time
+import urlparse
+import Queue
+
+import boto3
+from botocore.exceptions import BotoCoreError
+from botocore.httpsession import URLLib3Session
+from botocore.utils import get_environ_proxies
+
+''' Notes:
+	-	Only idempotent reads are hedged: Describe*, List* and Get* operations.
+		Their HTTP request is sent by a worker thread. If no answer arrives within the
+		-percentile- latency of the recent calls of the same operation, the same signed
+		request goes out a second time and the first answer wins
+	-	No answer within -deadline- seconds fails the call with DeadlineExceeded, which is
+		not retried: a stalled poll costs at most the deadline
+	-	A circuit breaker per endpoint counts consecutive failures, connection errors and 5xx.
+		After -failures- of them, calls fail fast with CircuitOpen for -cooldown- seconds.
+		Then a single trial call decides whether the circuit closes. Hedges are only sent
+		while the circuit is closed
+	-	Requests go through connection pools of this module, one per endpoint, not through
+		the pool of the client. They use the proxies of the environment, no_proxy included,
+		and the CA bundle of the session, ca_bundle or REQUESTS_CA_BUNDLE, like a new client.
+		Settings given to a single client, verify= or Config(proxies, client_cert), are not
+		seen: pass verify and client_cert to hedgingEnable instead
+	-	Hooks are registered like awsedu.metrics: on the default session, for the clients
+		created from now on. Do not combine with a cassette replay, which answers the same requests
+'''
+
+HOOK_ID = 'awsedu-hedging'
+
+READS = re.compile(r'^(Describe|List|Get)')
+
+# latency samples kept per operation, and needed before the percentile is trusted
+WINDOW  = 200
+SAMPLES = 20
+
+class DeadlineExceeded(BotoCoreError):
+	fmt = '{operation} got no answer within {deadline} seconds'
+
+class CircuitOpen(BotoCoreError):
+	fmt = 'circuit open for {endpoint} after {failures} consecutive failures, retry in {retry:.0f} seconds'
+
+class Breaker(object):
+	''' Per endpoint circuit breaker, thread safe '''
+
+	def __init__(self, failures = 5, cooldown = 30):
+		self.failures  = failures
+		self.cooldown  = cooldown
+		self.lock      = threading.Lock()
+		self.endpoints = {}
+
+	def _get(self, endpoint):
+		return self.endpoints.setdefault(endpoint, {'failures': 0, 'opened': None, 'trial': False})
+
+	def check(self, endpoint):
+		''' Raise CircuitOpen unless a call to -endpoint- may go out '''
+		with self.lock:
+			state = self._get(endpoint)
+			if state['opened'] is None:
+				return
+			retry = state['opened'] + self.cooldown - time.time()
+			if retry > 0 or state['trial']:
+				raise CircuitOpen(endpoint=endpoint, failures=state['failures'], retry=max(0, retry))
+			# half open: this call is the trial
+			state['trial'] = True
+
+	def closed(self, endpoint):
+		with self.lock:
+			return self._get(endpoint)['opened'] is None
+
+	def success(self, endpoint):
+		with self.lock:
+			self.endpoints[endpoint] = {'failures': 0, 'opened': None, 'trial': False}
+
+	def failure(self, endpoint):
+		with self.lock:
+			state = self._get(endpoint)
+			state['failures'] += 1
+			state['trial']     = False
+			if state['failures'] >= self.failures:
+				state['opened'] = time.time()
+
+class Hedger(object):
+	''' Sends the idempotent reads of instrumented sessions, with hedging, deadline and circuit breaker '''
+
+	def __init__(self, percentile = 95, deadline = 10, minimum = 0.05, initial = 1.0, failures = 5, cooldown = 30,
+			verify = True, client_cert = None):
+		''' @type percentile:	float
+			@param percentile:	latency percentile of an operation after which its calls are hedged
+			@type deadline:		float
+			@param deadline:	seconds given to a call, hedge included
+			@type minimum:		float
+			@param minimum:		seconds before any hedge, however fast the operation
+			@type initial:		float
+			@param initial:		seconds before a hedge, until enough latencies are known
+			@type failures:		integer
+			@param failures:	consecutive failures opening the circuit of an endpoint
+			@type cooldown:		float
+			@param cooldown:	seconds an open circuit rejects calls
+			@type verify:		boolean|string
+			@param verify:		verify the TLS certificates, with this CA bundle if a path
+			@type client_cert:	string|(string, string)
+			@param client_cert:	client certificate, as in botocore Config
+		'''
+		self.percentile = percentile
+		self.deadline   = deadline
+		self.minimum    = minimum
+		self.initial    = initial
+		self.breaker    = Breaker(failures, cooldown)
+		self.verify     = verify
+		self.clientcert = client_cert
+		self.sessions   = {}
+		self.lock       = threading.Lock()
+		self.latencies  = {}
+		self.stats      = {}
+
+	def _http(self, url):
+		# one pool per endpoint, with the proxies the environment gives its url
+		endpoint = urlparse.urlparse(url).netloc
+		with self.lock:
+			if endpoint not in self.sessions:
+				self.sessions[endpoint] = URLLib3Session(timeout=self.deadline, max_pool_connections=32,
+					proxies=get_environ_proxies(url), verify=self.verify, client_cert=self.clientcert)
+			return self.sessions[endpoint]
+
+	def _count(self, key, field):
+		with self.lock:
+			stats = self.stats.setdefault(key, {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'deadlines': 0, 'rejected': 0})
+			stats[field] += 1
+
+	def threshold(self, key):
+		''' @rtype:    float
+			@return:   seconds after which a call of -key- is hedged
+		'''
+		with self.lock:
+			samples = sorted(self.latencies.get(key, []))
+		if len(samples) < SAMPLES:
+			return self.initial
+		return max(self.minimum, samples[min(len(samples) - 1, int(len(samples) * self.percentile / 100.0))])
+
+	def _send(self, key, request, which, results):
+		started = time.time()
+		try:
+			response = self._http(request.url).send(request)
+			# the body is part of the latency, the losing answer frees its connection
+			response.content
+		except Exception as e:
+			return results.put((None, e, which))
+		with self.lock:
+			self.latencies.setdefault(key, collections.deque(maxlen=WINDOW)).append(time.time() - started)
+		results.put((response, None, which))
+
+	def _start(self, key, request, which, results):
+		worker = threading.Thread(target=self._send, args=(key, request, which, results))
+		worker.daemon = True
+		worker.start()
+
+	def sending(self, request, event_name, **kwargs):
+		# event names look like before-send.ec2.DescribeInstances
+		key = tuple(event_name.split('.')[1:3])
+		if not READS.match(key[1]):
+			return None
+
+		endpoint = urlparse.urlparse(request.url).netloc
+		try:
+			self.breaker.check(endpoint)
+		except CircuitOpen:
+			self._count(key, 'rejected')
+			raise
+
+		self._count(key, 'calls')
+		started = time.time()
+		end     = started + self.deadline
+		hedge   = started + self.threshold(key)
+		results = Queue.Queue()
+		pending = 1
+		hedging = True
+		error   = None
+		self._start(key, request, 0, results)
+
+		while True:
+			limit = min(end, hedge) if hedging else end
+			try:
+				response, failed, which = results.get(timeout=max(0, limit - time.time()))
+			except Queue.Empty:
+				if time.time() >= end:
+					self._count(key, 'deadlines')
+					self.breaker.failure(endpoint)
+					raise DeadlineExceeded(operation=key[1], deadline=self.deadline)
+				# past the threshold: one hedge, unless the endpoint is failing
+				hedging = False
+				if self.breaker.closed(endpoint):
+					self._count(key, 'hedged')
+					self._start(key, request, 1, results)
+					pending += 1
+				continue
+
+			pending -= 1
+			if failed is None:
+				if response.status_code >= 500:
+					self.breaker.failure(endpoint)
+				else:
+					self.breaker.success(endpoint)
+				if which == 1:
+					self._count(key, 'hedge_wins')
+				return response
+
+			# a failed attempt still waits for the other one, it is not hedged otherwise
+			error = error or failed
+			if pending == 0:
+				self.breaker.failure(endpoint)
+				raise error
+
+	def prometheus(self):
+		''' Render the hedging counters in the Prometheus text format '''
+		with self.lock:
+			snapshot = dict((key, dict(stats)) for key, stats in self.stats.items())
+
+		lines = []
+		for field, name, text in [
+				('calls',      'awsedu_hedge_calls_total',        'Idempotent reads sent through the hedger.'),
+				('hedged',     'awsedu_hedges_total',             'Reads sent a second time after the latency threshold.'),
+				('hedge_wins', 'awsedu_hedge_wins_total',         'Reads answered first by the second request.'),
+				('deadlines',  'awsedu_deadline_exceeded_total',  'Reads without answer within the deadline.'),
+				('rejected',   'awsedu_circuit_rejected_total',   'Reads rejected by an open circuit.')]:
+			lines.append('# HELP %s %s' % (name, text))
+			lines.append('# TYPE %s counter' % name)
+			for (service, operation) in sorted(snapshot):
+				lines.append('%s{service="%s",operation="%s"} %d' % (name, service, operation, snapshot[(service, operation)][field]))
+
+		return '\n'.join(lines) + '\n'
+
+# the active hedger, with the session it is registered on
+_ACTIVE = []
+
+def hedgingEnable(session = None, **options):
+	''' Hedge the idempotent reads of the clients created from now on
+
+		@type session:		boto3.Session
+		@param session:		session to instrument, the default one if None
+		@param options:		keyword arguments of Hedger, ex. percentile=99, deadline=5,
+							verify defaults to the CA bundle of the session
+		@rtype:    Hedger
+		@return:   the hedger, with its counters
+	'''
+	hedgingDisable()
+	session = session or boto3._get_default_session()
+	# the CA bundle a new client of the session would verify with
+	options.setdefault('verify', session._session.get_config_variable('ca_bundle')
+		or os.environ.get('REQUESTS_CA_BUNDLE', True))
+	hedger  = Hedger(**options)
+	session.events.register('before-send', hedger.sending, unique_id=HOOK_ID)
+	_ACTIVE.append((hedger, session))
+	return hedger
+
+def hedgingDisable():
+	''' Stop hedging, the counters of the hedger are kept '''
+	while _ACTIVE:
+		hedger, session = _ACTIVE.pop()
+		session.events.unregister('before-send', hedger.sending, unique_id=HOOK_ID)
@@ -0,0 +1,208 @@
+import bisect
+import threading
+import time
+
+import boto3
+
+''' Notes:
+	-	Hooks are registered on the event system of the boto3 default session:
+		every client created after metricsEnable() is instrumented, clients created before are not.
+		The problem modules create a new client on every call, so they are always covered
+	-	Waiter polls show up as the operation they poll, ex. DescribeInstances
+	-	DryRun probes are accounted separately, with the dry_run="true" label
+	-	Throttles are counted per attempt: a call throttled twice then answered counts 2 throttles
+	-	When metrics are disabled no hook is registered, calls pay nothing
+'''
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+THROTTLES = ['Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException']
+
+HOOK_ID = 'awsedu-metrics'
+
+class Metrics(object):
+	''' Thread safe registry of per operation call metrics '''
+
+	def __init__(self):
+		self.lock       = threading.Lock()
+		self.operations = {}
+
+	def _get(self, key):
+		if key not in self.operations:
+			self.operations[key] = {
+				'calls':    0,
+				'errors':   {},
+				'retries':  0,
+				'throttles': 0,
+				'sent':     0,
+				'received': 0,
+				'sum':      0.0,
+				'buckets':  [0] * (len(BUCKETS) + 1)}
+		return self.operations[key]
+
+	def record(self, key, latency, retries = 0, error = None, received = 0):
+		''' Record a completed call
+
+			@type key:			(string, string, boolean)
+			@param key:			service, operation and dry run flag
+			@type latency:		float
+			@param latency:		seconds from the call to the parsed response, retries included
+			@type retries:		integer
+			@param retries:		number of retried attempts
+			@type error:		string
+			@param error:		error code of a failed call
+			@type received:		integer
+			@param received:	bytes of the response body
+		'''
+		with self.lock:
+			operation = self._get(key)
+			operation['calls']    += 1
+			operation['retries']  += retries
+			operation['received'] += received
+			operation['sum']      += latency
+			operation['buckets'][bisect.bisect_left(BUCKETS, latency)] += 1
+			if error:
+				operation['errors'][error] = operation['errors'].get(error, 0) + 1
+
+	def recordThrottle(self, key):
+		''' Record a throttled attempt, retried or not '''
+		with self.lock:
+			self._get(key)['throttles'] += 1
+
+	def recordSent(self, key, sent):
+		''' Record the bytes of a request body, once per attempt '''
+		with self.lock:
+			self._get(key)['sent'] += sent
+
+	def reset(self):
+		with self.lock:
+			self.operations = {}
+
+	def snapshot(self):
+		''' @rtype:    dict
+			@return:   {(service, operation, dry run): metrics} a copy of the current metrics
+		'''
+		with self.lock:
+			return dict((key, dict(value, errors=dict(value['errors']), buckets=list(value['buckets'])))
+				for key, value in self.operations.items())
+
+	def prometheus(self):
+		''' Render the metrics in the Prometheus text exposition format
+
+			@rtype:    string
+			@return:   the exposition text
+		'''
+		snapshot = self.snapshot()
+		lines    = []
+
+		def labels(key, **extra):
+			pairs = [('service', key[0]), ('operation', key[1]), ('dry_run', str(key[2]).lower())]
+			pairs += sorted(extra.items())
+			return '{' + ','.join('%s="%s"' % pair for pair in pairs) + '}'
+
+		lines.append('# HELP awsedu_api_call_duration_seconds Latency of the AWS API calls, retries included.')
+		lines.append('# TYPE awsedu_api_call_duration_seconds histogram')
+		for key in sorted(snapshot):
+			operation  = snapshot[key]
+			cumulative = 0
+			for bound, count in zip(BUCKETS + ['+Inf'], operation['buckets']):
+				cumulative += count
+				lines.append('awsedu_api_call_duration_seconds_bucket%s %d' % (labels(key, le=str(bound)), cumulative))
+			lines.append('awsedu_api_call_duration_seconds_sum%s %f' % (labels(key), operation['sum']))
+			lines.append('awsedu_api_call_duration_seconds_count%s %d' % (labels(key), operation['calls']))
+
+		counters = [
+			('retries',   'awsedu_api_retries_total',        'Retried attempts of the AWS API calls.'),
+			('throttles', 'awsedu_api_throttles_total',      'Throttled attempts of the AWS API calls, retried ones included.'),
+			('sent',      'awsedu_api_sent_bytes_total',     'Bytes of the AWS API request bodies.'),
+			('received',  'awsedu_api_received_bytes_total', 'Bytes of the AWS API response bodies.')]
+
+		for field, name, text in counters:
+			lines.append('# HELP %s %s' % (name, text))
+			lines.append('# TYPE %s counter' % name)
+			for key in sorted(snapshot):
+				lines.append('%s%s %d' % (name, labels(key), snapshot[key][field]))
+
+		lines.append('# HELP awsedu_api_errors_total Failed AWS API calls by error code.')
+		lines.append('# TYPE awsedu_api_errors_total counter')
+		for key in sorted(snapshot):
+			for code, count in sorted(snapshot[key]['errors'].items()):
+				lines.append('awsedu_api_errors_total%s %d' % (labels(key, code=code), count))
+
+		return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+
+def _key(event_name, params):
+	# event names look like before-parameter-build.ec2.RunInstances
+	service, operation = event_name.split('.')[1:3]
+	return (service, operation, bool(params.get('DryRun', False)))
+
+def _beforeCall(event_name, params, context, **kwargs):
+	context['awsedu_metrics'] = (_key(event_name, params), time.time())
+
+def _requestCreated(request, **kwargs):
+	# emitted once per attempt, retries included
+	if 'awsedu_metrics' in request.context and request.body:
+		METRICS.recordSent(request.context['awsedu_metrics'][0], len(request.body))
+
+def _responseReceived(parsed_response, context, **kwargs):
+	# emitted once per attempt: throttles retried to success are counted too
+	if 'awsedu_metrics' in context and parsed_response:
+		if parsed_response.get('Error', {}).get('Code') in THROTTLES:
+			METRICS.recordThrottle(context['awsedu_metrics'][0])
+
+def _received(http_response):
+	# stubbed responses have no body to measure
+	try:
+		return len(http_response.content or '')
+	except AttributeError:
+		return 0
+
+def _afterCall(http_response, parsed, context, **kwargs):
+	if 'awsedu_metrics' not in context:
+		return
+	key, started = context.pop('awsedu_metrics')
+	METRICS.record(key, time.time() - started,
+		retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+		error=parsed.get('Error', {}).get('Code'),
+		received=_received(http_response))
+
+def _afterCallError(exception, context, **kwargs):
+	if 'awsedu_metrics' not in context:
+		return
+	key, started = context.pop('awsedu_metrics')
+	METRICS.record(key, time.time() - started, error=type(exception).__name__)
+
+# events are hierarchical: before-parameter-build matches every service and operation
+HOOKS = [
+	('before-parameter-build', _beforeCall),
+	('request-created',        _requestCreated),
+	('response-received',      _responseReceived),
+	('after-call',             _afterCall),
+	('after-call-error',       _afterCallError)]
+
+def metricsEnable(session = None):
+	''' Start recording the metrics of every AWS API call
+		made by clients created from now on
+
+		@type session:		boto3.Session
+		@param session:		session to instrument, the default one if None
+		@rtype:    Metrics
+		@return:   the registry collecting the metrics
+	'''
+	session = session or boto3._get_default_session()
+	for event, handler in HOOKS:
+		session.events.register(event, handler, unique_id=HOOK_ID + event)
+	return METRICS
+
+def metricsDisable(session = None):
+	''' Stop recording metrics, already collected ones are kept
+
+		@type session:		boto3.Session
+		@param session:		instrumented session, the default one if None
+	'''
+	session = session or boto3._get_default_session()
+	for event, handler in HOOKS:
+		session.events.unregister(event, handler, unique_id=HOOK_ID + event)
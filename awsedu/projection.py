@@ -0,0 +1,95 @@
+''' Notes:
+	-	A projection declares the fields a caller reads from a describe response:
+		every item becomes a record of those fields only, built as soon as its page arrives,
+		so the full nested dicts never outlive their page
+	-	Fields are dotted paths of the item, ex. State.Name or Attachments.0.InstanceId,
+		an (attribute, path) pair names the attribute, else dots become underscores: State_Name
+	-	Missing fields are None, like the high-level resource attributes
+	-	Records have __slots__ and equal strings are shared between them,
+		ex. one 'running' for 50k instances
+'''
+
+class Record(object):
+	''' Base of the projected records, fields are declared by projectionRecord '''
+
+	__slots__ = ()
+	FIELDS    = ()
+
+	def __init__(self, item, shared = None):
+		for attribute, path in self.FIELDS:
+			value = _lookup(item, path)
+			if shared is not None and isinstance(value, basestring):
+				value = shared.setdefault(value, value)
+			setattr(self, attribute, value)
+
+	def __getitem__(self, attribute):
+		return getattr(self, attribute)
+
+	def __repr__(self):
+		return '%s(%s)' % (type(self).__name__,
+			', '.join('%s=%r' % (attribute, getattr(self, attribute)) for attribute, path in self.FIELDS))
+
+	def asdict(self):
+		return dict((attribute, getattr(self, attribute)) for attribute, path in self.FIELDS)
+
+def _lookup(item, path):
+	for step in path:
+		try:
+			item = item[int(step)] if isinstance(item, list) else item[step]
+		except (KeyError, IndexError, ValueError, TypeError):
+			return None
+	return item
+
+def projectionRecord(name, fields):
+	''' Create the record class of a projection
+
+		@type name:		string
+		@param name:	name of the class
+		@type fields:	[string|(string, string),...]
+		@param fields:	dotted paths, or (attribute, dotted path) pairs
+		@rtype:    type
+		@return:   a Record subclass
+	'''
+	declared = []
+	for field in fields:
+		attribute, path = field if isinstance(field, tuple) else (field.replace('.', '_'), field)
+		declared.append((attribute, tuple(path.split('.'))))
+	return type(name, (Record,), {'__slots__': tuple(a for a, p in declared), 'FIELDS': tuple(declared)})
+
+# items of a page, by the key of the page
+ITEMS = {
+	'Reservations': lambda page: (i for reservation in page['Reservations'] for i in reservation['Instances']),
+	'Volumes':      lambda page: page['Volumes']
+}
+
+def projectionPages(pages, key, record):
+	''' Project the items of describe pages as they stream in
+
+		@type pages:	iterable
+		@param pages:	describe responses, ex. a paginator
+		@type key:		string
+		@param key:		Reservations|Volumes
+		@type record:	type
+		@param record:	class returned by projectionRecord
+		@rtype:    generator
+		@return:   records of the items
+	'''
+	shared = {}
+	for page in pages:
+		for item in ITEMS[key](page):
+			yield record(item, shared)
+
+def projectionStream(ec2client, method, record, **kwargs):
+	''' Paginate a describe call and project its items
+
+		@type ec2client:	EC2.Client
+		@param ec2client:	client to use
+		@type method:		string
+		@param method:		describe_instances|describe_volumes
+		@type record:		type
+		@param record:		class returned by projectionRecord
+		@rtype:    generator
+		@return:   records of the items
+	'''
+	key = 'Reservations' if method == 'describe_instances' else 'Volumes'
+	return projectionPages(ec2client.get_paginator(method).paginate(**kwargs), key, record)
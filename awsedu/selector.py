@@ -0,0 +1,366 @@
+import fnmatch
+import heapq
+import re
+
+import boto3
+from botocore.exceptions import ClientError
+from dateutil import parser as dateparser
+
+''' Notes:
+	-	A selector is a boolean expression of predicates, optionally followed by a top-k clause:
+
+		state=running and type!=t2.nano and tag:Name=web* and not az=eu-west-3a
+		state=running,stopped and volume.type=gp2 | top 2 by launch_time desc
+
+	-	Predicates are field op value, with op one of = != < > <= >=. Values separated
+		by commas are alternatives, * and ? are wildcards of = and !=.
+		Dates are ISO 8601: launch_time=2018-01-* matches the ISO form of the date
+	-	Instance fields: id state type az ami vpc subnet key launch_time tag:KEY
+		and volume.FIELD, true when any attached volume matches volume.FIELD
+	-	Volume fields: id state type size az encrypted instance create_time tag:KEY
+	-	Positive = predicates of the top level conjunction become server-side Filters,
+		everything else is evaluated locally in a single streaming pass over the pages.
+		Dates are pushed only with wildcards, launch_time=2018-01-05T10:00:00Z stays local
+	-	Filters are ANDed between names and ORed between values, like EC2 does:
+		a disjunction is pushed only when all its terms are = on the same field
+'''
+
+class SelectorError(Exception):
+	''' Raised for malformed selector expressions '''
+	pass
+
+# field: (server-side filter name, path of the value in the describe item)
+INSTANCE_FIELDS = {
+	'id':          ('instance-id',         ['InstanceId']),
+	'state':       ('instance-state-name', ['State', 'Name']),
+	'type':        ('instance-type',       ['InstanceType']),
+	'az':          ('availability-zone',   ['Placement', 'AvailabilityZone']),
+	'ami':         ('image-id',            ['ImageId']),
+	'vpc':         ('vpc-id',              ['VpcId']),
+	'subnet':      ('subnet-id',           ['SubnetId']),
+	'key':         ('key-name',            ['KeyName']),
+	'launch_time': ('launch-time',         ['LaunchTime'])
+}
+
+VOLUME_FIELDS = {
+	'id':          ('volume-id',              ['VolumeId']),
+	'state':       ('status',                 ['State']),
+	'type':        ('volume-type',            ['VolumeType']),
+	'size':        ('size',                   ['Size']),
+	'az':          ('availability-zone',      ['AvailabilityZone']),
+	'encrypted':   ('encrypted',              ['Encrypted']),
+	'instance':    ('attachment.instance-id', ['Attachments', 0, 'InstanceId']),
+	'create_time': ('create-time',            ['CreateTime'])
+}
+
+# fields holding a date
+DATE_FIELDS = set(['launch_time', 'create_time'])
+
+KINDS = {
+	'instances': (INSTANCE_FIELDS, 'describe_instances', 'Reservations'),
+	'volumes':   (VOLUME_FIELDS,   'describe_volumes',   'Volumes')
+}
+
+# values of a filter and of an InstanceIds/VolumeIds argument
+MAX_VALUES = 200
+
+TOKENS   = re.compile(r'\s*(\(|\)|\||!=|<=|>=|=|<|>|[^\s()|=!<>]+)')
+
+def _tokenize(expression):
+	tokens   = []
+	position = 0
+	expression = expression.strip()
+	while position < len(expression):
+		match = TOKENS.match(expression, position)
+		if not match:
+			raise SelectorError('unexpected character at %d: %s' % (position, expression[position:]))
+		tokens.append(match.group(1))
+		position = match.end()
+	return tokens
+
+class _Parser(object):
+
+	def __init__(self, tokens, fields):
+		self.tokens = tokens
+		self.fields = fields
+		self.index  = 0
+
+	def peek(self):
+		return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+	def keyword(self, word):
+		if self.peek() is not None and self.peek().lower() == word:
+			self.index += 1
+			return True
+		return False
+
+	def take(self):
+		token = self.peek()
+		if token is None:
+			raise SelectorError('unexpected end of selector')
+		self.index += 1
+		return token
+
+	def expression(self):
+		terms = [self.term()]
+		while self.keyword('or'):
+			terms.append(self.term())
+		return terms[0] if len(terms) == 1 else ('or', terms)
+
+	def term(self):
+		factors = [self.factor()]
+		while self.keyword('and'):
+			factors.append(self.factor())
+		return factors[0] if len(factors) == 1 else ('and', factors)
+
+	def factor(self):
+		if self.keyword('not'):
+			return ('not', self.factor())
+		if self.peek() == '(':
+			self.take()
+			node = self.expression()
+			if self.take() != ')':
+				raise SelectorError('missing )')
+			return node
+		return self.predicate()
+
+	def predicate(self):
+		field = self.take()
+		op    = self.take()
+		if op not in ('=', '!=', '<', '>', '<=', '>='):
+			raise SelectorError('expected an operator after %s, found %s' % (field, op))
+
+		if field.startswith('volume.') and self.fields is INSTANCE_FIELDS:
+			known, name = VOLUME_FIELDS, field[len('volume.'):]
+		else:
+			known, name = self.fields, field
+		if not name.startswith('tag:') and name not in known:
+			raise SelectorError('unknown field %s' % field)
+
+		return ('pred', field, op, self.take().split(','))
+
+	def top(self):
+		if not self.keyword('top'):
+			return None
+		count = int(self.take())
+		if not self.keyword('by'):
+			raise SelectorError('expected by after top %d' % count)
+		field   = self.take()
+		if not field.startswith('tag:') and field not in self.fields:
+			raise SelectorError('unknown field %s' % field)
+		reverse = not self.keyword('asc')
+		self.keyword('desc')
+		return (count, field, reverse)
+
+def selectorParse(expression, kind = 'instances'):
+	''' Parse a selector expression
+
+		@type expression:	string
+		@param expression:	selector, as described in the module notes
+		@type kind:			string
+		@param kind:		instances|volumes
+		@rtype:    (tuple, tuple)
+		@return:   the predicate tree, None if empty, and the top-k clause, None if missing
+	'''
+	parser = _Parser(_tokenize(expression), KINDS[kind][0])
+	tree   = None
+	if parser.peek() not in (None, '|'):
+		tree = parser.expression()
+	top = None
+	if parser.peek() == '|':
+		parser.take()
+		top = parser.top()
+	if parser.peek() is not None:
+		raise SelectorError('unexpected %s' % parser.peek())
+	return tree, top
+
+def _filterName(field, fields):
+	if field.startswith('tag:'):
+		return field
+	if field in fields:
+		return fields[field][0]
+	return None
+
+def _pushable(node, fields):
+	# a positive = predicate, or a disjunction of them on the same field
+	if node[0] == 'pred':
+		# EC2 matches dates on their yyyy-mm-ddThh:mm:ss.sssZ form: only a wildcard is sent as is,
+		# the other date literals are compared as dates by the local pass
+		if node[1] in DATE_FIELDS and not all(WILDCARDS.search(literal) for literal in node[3]):
+			return False
+		return node[2] == '=' and _filterName(node[1], fields) is not None
+	if node[0] == 'or':
+		return all(t[0] == 'pred' and _pushable(t, fields) for t in node[1]) \
+			and len(set(t[1] for t in node[1])) == 1
+	return False
+
+def selectorCompile(expression, kind = 'instances'):
+	''' Split a selector into server-side filters and a local remainder
+
+		@type expression:	string
+		@param expression:	selector, as described in the module notes
+		@type kind:			string
+		@param kind:		instances|volumes
+		@rtype:    dict
+		@return:   {'filters': describe Filters, 'remainder': [predicate trees], 'top': top-k clause}
+	'''
+	fields    = KINDS[kind][0]
+	tree, top = selectorParse(expression, kind)
+	conjuncts = [] if tree is None else (tree[1] if tree[0] == 'and' else [tree])
+	filters   = {}
+	remainder = []
+
+	for node in conjuncts:
+		terms = node[1] if node[0] == 'or' else [node]
+		name  = _filterName(terms[0][1], fields) if _pushable(node, fields) else None
+		# the same filter name twice would not be ANDed: keep the second one local
+		if name is None or name in filters:
+			remainder.append(node)
+		else:
+			filters[name] = sum([term[3] for term in terms], [])
+
+	return {
+		'filters':   [{'Name': name, 'Values': values} for name, values in sorted(filters.items())],
+		'remainder': remainder,
+		'top':       top}
+
+def _value(item, field, fields):
+	if field.startswith('tag:'):
+		tags = dict((t['Key'], t['Value']) for t in item.get('Tags', []))
+		return tags.get(field[len('tag:'):])
+	value = item
+	for step in fields[field][1]:
+		try:
+			value = value[step]
+		except (KeyError, IndexError, TypeError):
+			return None
+	return value
+
+WILDCARDS = re.compile(r'[*?\[]')
+
+def _coerce(value, literal):
+	# compare as the type of the actual value
+	if isinstance(value, bool):
+		return literal.lower() == 'true'
+	try:
+		if isinstance(value, (int, long, float)):
+			return type(value)(literal)
+		if hasattr(value, 'tzinfo'):
+			parsed = dateparser.parse(literal)
+			if parsed.tzinfo is None and value.tzinfo is not None:
+				parsed = parsed.replace(tzinfo=value.tzinfo)
+			return parsed
+	except (ValueError, OverflowError):
+		raise SelectorError('cannot compare %s with %s' % (literal, value))
+	return literal
+
+def _equal(value, literal):
+	if isinstance(value, basestring):
+		return fnmatch.fnmatchcase(value, literal)
+	# dates with wildcards match their ISO form, ex. 2018-01-*
+	if hasattr(value, 'tzinfo') and WILDCARDS.search(literal):
+		return fnmatch.fnmatchcase(value.isoformat(), literal)
+	return value == _coerce(value, literal)
+
+def _match(value, op, literals):
+	if value is None:
+		return op == '!='
+	if op in ('=', '!='):
+		found = any(_equal(value, literal) for literal in literals)
+		return found if op == '=' else not found
+	literal = _coerce(value, literals[0])
+	return {'<': value < literal, '>': value > literal, '<=': value <= literal, '>=': value >= literal}[op]
+
+class _Query(object):
+	''' Evaluates predicate trees on describe items,
+		resolving volume predicates of instances with one describe_volumes query each
+	'''
+
+	def __init__(self, kind, ec2client):
+		self.fields    = KINDS[kind][0]
+		self.ec2client = ec2client
+		self.cache     = {}
+
+	def owners(self, node):
+		# ids of the instances with at least one attached volume matching -node-
+		key = (node[1], node[2], tuple(node[3]))
+		if key not in self.cache:
+			predicate = '%s%s%s' % (node[1][len('volume.'):], node[2], ','.join(node[3]))
+			volumes   = selectorStream('state=in-use and ' + predicate, 'volumes', self.ec2client)
+			self.cache[key] = set(a['InstanceId'] for v in volumes for a in v['Attachments'])
+		return self.cache[key]
+
+	def evaluate(self, node, item):
+		if node[0] == 'and':
+			return all(self.evaluate(child, item) for child in node[1])
+		if node[0] == 'or':
+			return any(self.evaluate(child, item) for child in node[1])
+		if node[0] == 'not':
+			return not self.evaluate(node[1], item)
+		if node[1].startswith('volume.') and self.fields is INSTANCE_FIELDS:
+			return item['InstanceId'] in self.owners(node)
+		return _match(_value(item, node[1], self.fields), node[2], node[3])
+
+def selectorStream(expression, kind = 'instances', ec2client = None):
+	''' Stream the instances or volumes matching a selector:
+		server-side filters narrow the pages, the remainder is evaluated as they arrive
+
+		@type expression:	string
+		@param expression:	selector, as described in the module notes
+		@type kind:			string
+		@param kind:		instances|volumes
+		@type ec2client:	EC2.Client
+		@param ec2client:	client to use, a new one if None
+		@rtype:    generator
+		@return:   matching describe_instances|describe_volumes items
+	'''
+	ec2client = ec2client or boto3.client('ec2')
+	compiled  = selectorCompile(expression, kind)
+	query     = _Query(kind, ec2client)
+	filters   = compiled['filters']
+
+	# a positive volume predicate narrows the instances to the owners of its volumes
+	if kind == 'instances':
+		for node in compiled['remainder']:
+			if node[0] == 'pred' and node[1].startswith('volume.') and 'instance-id' not in [f['Name'] for f in filters]:
+				owners = sorted(query.owners(node))
+				if not owners:
+					return
+				if len(owners) <= MAX_VALUES:
+					filters = filters + [{'Name': 'instance-id', 'Values': owners}]
+
+	method, key = KINDS[kind][1:]
+	try:
+		for page in ec2client.get_paginator(method).paginate(Filters=filters):
+			items = page[key]
+			if kind == 'instances':
+				items = [i for reservation in items for i in reservation['Instances']]
+			for item in items:
+				if all(query.evaluate(node, item) for node in compiled['remainder']):
+					yield item
+	except ClientError as e:
+		raise e
+
+def selectorSelect(expression, kind = 'instances', ec2client = None):
+	''' Select the instances or volumes matching a selector, top-k clause included
+
+		@type expression:	string
+		@param expression:	selector, as described in the module notes
+		@type kind:			string
+		@param kind:		instances|volumes
+		@type ec2client:	EC2.Client
+		@param ec2client:	client to use, a new one if None
+		@rtype:    [dict,...,dict]
+		@return:   matching describe_instances|describe_volumes items
+	'''
+	top   = selectorParse(expression, kind)[1]
+	items = selectorStream(expression, kind, ec2client)
+
+	if top is None:
+		return list(items)
+
+	count, field, reverse = top
+	fields = KINDS[kind][0]
+	# a heap of k items: the stream is never held in memory
+	pick   = heapq.nlargest if reverse else heapq.nsmallest
+	return pick(count, items, key=lambda item: _value(item, field, fields))
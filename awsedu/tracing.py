@@ -0,0 +1,278 @@
+import binascii
+import functools
+import json
+import os
+import threading
+import time
+import urllib2
+
+import boto3
+
+''' Notes:
+	-	Spans nest: operation > phase > API call. Waiter polls are API calls
+		of a wait phase and carry the attempt attribute
+	-	API call spans come from hooks on the boto3 default session, like awsedu.metrics:
+		only clients created after tracingEnable() are traced
+	-	The current span is kept per thread: calls issued by worker threads
+		start a new trace unless the worker opens its spans under an explicit parent
+	-	When tracing is disabled span() returns a shared no-op object, calls pay nothing
+'''
+
+HOOK_ID = 'awsedu-tracing'
+
+_exporter = None
+_local    = threading.local()
+
+def _hexid(size):
+	return binascii.hexlify(os.urandom(size))
+
+def _stack():
+	if not hasattr(_local, 'stack'):
+		_local.stack = []
+	return _local.stack
+
+def current():
+	''' @rtype:    Span
+		@return:   the innermost open span of this thread, None if there is none
+	'''
+	stack = _stack()
+	return stack[-1] if stack else None
+
+class Span(object):
+	''' A timed unit of work, with attributes and an optional parent '''
+
+	def __init__(self, name, parent = None, attributes = None, client = False):
+		self.name       = name
+		self.client     = client
+		self.traceid    = parent.traceid if parent else _hexid(16)
+		self.spanid     = _hexid(8)
+		self.parentid   = parent.spanid if parent else None
+		self.attributes = dict(attributes or {})
+		self.children   = 0
+		self.error      = None
+		self.start      = time.time()
+		self.end        = None
+
+		if parent:
+			parent.children += 1
+
+	def duration(self):
+		''' @rtype:    float
+			@return:   seconds from the start to the end of the span
+		'''
+		return (self.end or time.time()) - self.start
+
+	def finish(self, error = None):
+		''' End the span and hand it to the exporter '''
+		self.end   = time.time()
+		self.error = error or self.error
+		if _exporter:
+			_exporter.export(self)
+
+	def __enter__(self):
+		_stack().append(self)
+		return self
+
+	def __exit__(self, kind, value, traceback):
+		_stack().pop()
+		self.finish(repr(value) if value is not None else None)
+		return False
+
+class _NoopSpan(object):
+
+	attributes = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, kind, value, traceback):
+		return False
+
+_NOOP = _NoopSpan()
+
+def span(name, **attributes):
+	''' Open a span, child of the current one, to be used in a with statement
+
+		@type name:		string
+		@param name:	name of the operation or phase
+		@rtype:    Span
+		@return:   the new span, a no-op one when tracing is disabled
+	'''
+	if _exporter is None:
+		return _NOOP
+	return Span(name, current(), attributes)
+
+def annotate(**attributes):
+	''' Add attributes to the current span, if any '''
+	if _exporter is not None and current():
+		current().attributes.update(attributes)
+
+def traced(function):
+	''' Decorator: run -function- inside a span named after it '''
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		with span(function.__name__):
+			return function(*args, **kwargs)
+	return wrapper
+
+class InMemoryExporter(object):
+	''' Keeps the finished spans in a list, for tests '''
+
+	def __init__(self):
+		self.lock  = threading.Lock()
+		self.spans = []
+
+	def export(self, span):
+		with self.lock:
+			self.spans.append(span)
+
+	def find(self, name):
+		''' @rtype:    [Span,...,Span]
+			@return:   finished spans called -name-
+		'''
+		with self.lock:
+			return [s for s in self.spans if s.name == name]
+
+	def children(self, parent):
+		''' @rtype:    [Span,...,Span]
+			@return:   finished children of -parent-, in start order
+		'''
+		with self.lock:
+			return sorted([s for s in self.spans if s.parentid == parent.spanid], key=lambda s: s.start)
+
+class OtlpExporter(object):
+	''' Sends the spans to an OpenTelemetry collector, OTLP/HTTP with json encoding.
+		Spans are buffered and sent when a root span ends or -batch- spans are waiting.
+	'''
+
+	def __init__(self, endpoint = 'http://localhost:4318/v1/traces', service = 'awsedu', batch = 512):
+		self.endpoint = endpoint
+		self.service  = service
+		self.batch    = batch
+		self.lock     = threading.Lock()
+		self.buffer   = []
+
+	def export(self, span):
+		with self.lock:
+			self.buffer.append(span)
+			if span.parentid is not None and len(self.buffer) < self.batch:
+				return
+			spans, self.buffer = self.buffer, []
+		self.send(spans)
+
+	def flush(self):
+		with self.lock:
+			spans, self.buffer = self.buffer, []
+		if spans:
+			self.send(spans)
+
+	def _value(self, value):
+		if isinstance(value, bool):
+			return {'boolValue': value}
+		if isinstance(value, (int, long)):
+			return {'intValue': str(value)}
+		if isinstance(value, float):
+			return {'doubleValue': value}
+		if isinstance(value, (list, tuple)):
+			return {'arrayValue': {'values': [self._value(v) for v in value]}}
+		return {'stringValue': unicode(value)}
+
+	def encode(self, spans):
+		''' @rtype:    dict
+			@return:   the OTLP ExportTraceServiceRequest of -spans-
+		'''
+		encoded = []
+
+		for span in spans:
+			item = {
+				'traceId':           span.traceid,
+				'spanId':            span.spanid,
+				'name':              span.name,
+				'kind':              3 if span.client else 1,
+				'startTimeUnixNano': str(int(span.start * 1e9)),
+				'endTimeUnixNano':   str(int(span.end * 1e9)),
+				'attributes':        [{'key': k, 'value': self._value(v)} for k, v in sorted(span.attributes.items())],
+				'status':            {'code': 2, 'message': span.error} if span.error else {'code': 1}}
+			if span.parentid:
+				item['parentSpanId'] = span.parentid
+			encoded.append(item)
+
+		return {'resourceSpans': [{
+			'resource':   {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service}}]},
+			'scopeSpans': [{'scope': {'name': 'awsedu.tracing'}, 'spans': encoded}]}]}
+
+	def send(self, spans):
+		request = urllib2.Request(self.endpoint, json.dumps(self.encode(spans)),
+			{'Content-Type': 'application/json'})
+		try:
+			urllib2.urlopen(request, timeout=5).read()
+		except (urllib2.URLError, IOError) as e:
+			# losing spans must never break the traced operation
+			print "could not export %d spans: %s" % (len(spans), e)
+
+def _beforeCall(event_name, params, context, **kwargs):
+	# event names look like before-parameter-build.ec2.RunInstances
+	parent = current()
+	call   = Span('.'.join(event_name.split('.')[1:3]), parent, client=True)
+
+	if params.get('DryRun'):
+		call.attributes['dry_run'] = True
+	if 'InstanceIds' in params:
+		call.attributes['instance_count'] = len(params['InstanceIds'])
+	if parent is not None and parent.name.startswith('wait'):
+		call.attributes['attempt'] = parent.children
+
+	context['awsedu_span'] = call
+
+def _afterCall(http_response, parsed, context, **kwargs):
+	if 'awsedu_span' not in context:
+		return
+	call     = context.pop('awsedu_span')
+	metadata = parsed.get('ResponseMetadata', {})
+	call.attributes['status_code'] = metadata.get('HTTPStatusCode', http_response.status_code)
+	call.attributes['retries']     = metadata.get('RetryAttempts', 0)
+	if 'RequestId' in metadata:
+		call.attributes['request_id'] = metadata['RequestId']
+	code = parsed.get('Error', {}).get('Code')
+	if code:
+		call.attributes['error_code'] = code
+	# a successful DryRun probe answers with an error
+	call.finish(code if code != 'DryRunOperation' else None)
+
+def _afterCallError(exception, context, **kwargs):
+	if 'awsedu_span' in context:
+		context.pop('awsedu_span').finish(repr(exception))
+
+HOOKS = [
+	('before-parameter-build', _beforeCall),
+	('after-call',             _afterCall),
+	('after-call-error',       _afterCallError)]
+
+def tracingEnable(exporter, session = None):
+	''' Start tracing the operations and the AWS API calls
+		made by clients created from now on
+
+		@type exporter:		InMemoryExporter|OtlpExporter
+		@param exporter:	receives the finished spans
+		@type session:		boto3.Session
+		@param session:		session to instrument, the default one if None
+	'''
+	global _exporter
+	_exporter = exporter
+	session   = session or boto3._get_default_session()
+	for event, handler in HOOKS:
+		session.events.register(event, handler, unique_id=HOOK_ID + event)
+
+def tracingDisable(session = None):
+	''' Stop tracing, buffered spans are flushed
+
+		@type session:		boto3.Session
+		@param session:		instrumented session, the default one if None
+	'''
+	global _exporter
+	session = session or boto3._get_default_session()
+	for event, handler in HOOKS:
+		session.events.unregister(event, handler, unique_id=HOOK_ID + event)
+	if hasattr(_exporter, 'flush'):
+		_exporter.flush()
+	_exporter = None
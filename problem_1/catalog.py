@@ -0,0 +1,114 @@
+import boto3
+from botocore.exceptions import ClientError
+
+from awsedu.cache import diskCache
+from problem_1.images import imagesAccount, imagesDescribe
+
+''' Notes:
+	-	The catalog lists the instance types of a region, their architectures,
+		virtualization types and availability zones: launches and resizes are checked
+		against it in memory, before any request is issued
+	-	It is loaded once with paginated describe_instance_types and describe_instance_type_offerings
+		calls, then cached per account and region for TTL seconds, in memory and on disk:
+		instance-types-<account>-<region>.json. Zone names map to other zones in other accounts
+	-	The catalog is an optimization, not a gate: when it cannot be loaded, ex. for lack
+		of permissions, nothing is checked and EC2 has the last word. Same for an ami that
+		cannot be described
+	-	A type missing from the cached catalog may be newer than the cache:
+		the catalog is reloaded once before the type is reported unknown
+'''
+
+TTL = 7 * 24 * 3600
+
+class CatalogError(ValueError):
+	''' Raised for instance types that cannot run the image or do not exist in the zone '''
+	pass
+
+def catalogLoad(region = None, refresh = False, ec2client = None):
+	''' Get the instance-type catalog of a region
+
+		@type region:	string
+		@param region:	region of the catalog, the default one if None
+		@type refresh:		boolean
+		@param refresh:		ignore the cached catalog
+		@type ec2client:	EC2.Client
+		@param ec2client:	client of -region- to use, a new one if None
+		@rtype:    dict
+		@return:   {instance type: {'arch': [...], 'virtualization': [...], 'zones': [...]}}
+	'''
+	region = region or (ec2client.meta.region_name if ec2client else boto3._get_default_session().region_name)
+	cache  = diskCache('instance-types-%s-%s' % (imagesAccount(ec2client), region))
+
+	if not refresh:
+		catalog = cache.get('catalog', TTL)
+		if catalog:
+			return catalog
+
+	ec2client = ec2client or boto3.client('ec2', region_name=region)
+	catalog   = {}
+
+	try:
+		for page in ec2client.get_paginator('describe_instance_types').paginate(PaginationConfig={'PageSize': 100}):
+			for item in page['InstanceTypes']:
+				catalog[item['InstanceType']] = {
+					'arch':           item['ProcessorInfo']['SupportedArchitectures'],
+					'virtualization': item.get('SupportedVirtualizationTypes', []),
+					'zones':          []}
+
+		offerings = ec2client.get_paginator('describe_instance_type_offerings')
+		for page in offerings.paginate(LocationType='availability-zone', PaginationConfig={'PageSize': 1000}):
+			for offering in page['InstanceTypeOfferings']:
+				if offering['InstanceType'] in catalog:
+					catalog[offering['InstanceType']]['zones'].append(offering['Location'])
+	except ClientError as e:
+		raise e
+
+	print "Instance types in %s: %d" % (region, len(catalog))
+	cache.put('catalog', catalog, TTL)
+
+	return catalog
+
+def catalogCheck(instancetype, ami = None, zone = None, region = None, ec2client = None):
+	''' Check that -instancetype- exists, can run -ami- and is offered in -zone-
+
+		@type instancetype:	string
+		@param instancetype:	t2.micro|m4.large|...
+		@type ami:			string
+		@param ami:			ami id, not checked if None
+		@type zone:			string
+		@param zone:		availability zone, not checked if None
+		@type region:		string
+		@param region:		region of the catalog, the default one if None
+		@type ec2client:	EC2.Client
+		@param ec2client:	client of -region- to use, a new one if None
+		@rtype:    None
+		@return:   None, raises CatalogError otherwise
+	'''
+	try:
+		catalog = catalogLoad(region, ec2client=ec2client)
+		if instancetype not in catalog:
+			catalog = catalogLoad(region, refresh=True, ec2client=ec2client)
+	except ClientError as e:
+		print "Instance types not checked: ", e
+		return None
+
+	if instancetype not in catalog:
+		raise CatalogError('unknown instance type %s' % instancetype)
+	known = catalog[instancetype]
+
+	if zone is not None and zone not in known['zones']:
+		raise CatalogError('%s is not offered in %s, only in %s' % (instancetype, zone, ', '.join(sorted(known['zones']))))
+
+	if ami is not None:
+		try:
+			image = imagesDescribe(ami, region, ec2client)
+		except (ClientError, ValueError) as e:
+			print "Image not checked: ", e
+			return None
+		if image['arch'] not in known['arch']:
+			raise CatalogError('%s is %s, %s runs %s' % (ami, image['arch'], instancetype, ', '.join(known['arch'])))
+		if image['virtualization'] not in known['virtualization']:
+			raise CatalogError('%s needs %s virtualization, %s supports %s'
+				% (ami, image['virtualization'], instancetype, ', '.join(known['virtualization'])))
+
+	return None
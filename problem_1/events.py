@@ -0,0 +1,240 @@
+import json
+import re
+import threading
+import time
+import Queue
+
+import boto3
+from botocore.exceptions import ClientError
+
+''' Notes:
+	-	EC2 publishes an "EC2 Instance State-change Notification" event on EventBridge
+		every time an instance changes state; a rule can forward them to an SQS queue
+	-	Events are not ordered: the time of the event decides which state is the latest
+	-	A StateEvents tracker must be started before the operation it waits on,
+		otherwise the events of fast transitions are lost and only the fallback poll sees them
+	-	Waiting on events costs no EC2 API calls: describe_instances is used only
+		when no event arrives for -silence- seconds
+	-	A wait only trusts states changed since it began, or since -since-: a lagging queue
+		may still hold the 'stopped' of a previous stop when a new stop is awaited
+	-	SqsEventSource deletes every message it reads: give every tracker its own queue,
+		trackers sharing a queue steal each other's events
+	-	The queue is long polled for RECEIVE seconds, the most SQS allows: an idle tracker
+		costs one receive_message call every RECEIVE seconds. stop does not wait for the call in flight
+	-	Instances just launched may be unknown to describe_instances for a while:
+		the fallback poll leaves them pending instead of failing the wait
+'''
+
+DETAIL_TYPE = 'EC2 Instance State-change Notification'
+
+# seconds of a long poll of the queue
+RECEIVE = 20
+
+INSTANCE_ID = re.compile(r'\bi-[0-9a-zA-Z]+')
+
+# states an instance never leaves for the awaited one
+DEAD_ENDS = {
+	'running':    ['shutting-down', 'terminated', 'stopping', 'stopped'],
+	'stopped':    ['shutting-down', 'terminated'],
+	'terminated': []
+}
+
+def _now():
+	return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+class WaitError(Exception):
+	''' Raised when the instances cannot reach, or did not reach in time, the awaited state '''
+	pass
+
+class LocalEventSource(object):
+	''' In-process stand-in of the event queue, for testing '''
+
+	def __init__(self):
+		self.queue = Queue.Queue()
+
+	def publish(self, instanceid, state, when = None):
+		''' Publish a state change of an instance
+
+			@type instanceid:	string
+			@param instanceid:	the id of the instance
+			@type state:		string
+			@param state:		pending|running|stopping|stopped|...
+			@type when:			string
+			@param when:		ISO 8601 time of the change, now if None
+		'''
+		self.queue.put((instanceid, state, when or _now()))
+
+	def receive(self, timeout):
+		''' Wait at most -timeout- seconds for events
+
+			@rtype:    [(string, string, string),...]
+			@return:   (instance id, state, time) of the received events
+		'''
+		try:
+			events = [self.queue.get(timeout=timeout)]
+		except Queue.Empty:
+			return []
+
+		while True:
+			try:
+				events.append(self.queue.get_nowait())
+			except Queue.Empty:
+				return events
+
+class SqsEventSource(object):
+	''' EventBridge state-change events delivered to an SQS queue '''
+
+	def __init__(self, queueurl, region = None):
+		self.queueurl  = queueurl
+		self.sqsclient = boto3.client('sqs', region_name=region)
+
+	def receive(self, timeout):
+		''' Long poll the queue for at most -timeout- seconds
+			and delete the received messages, the queue must not be shared with another tracker
+
+			@rtype:    [(string, string, string),...]
+			@return:   (instance id, state, time) of the received events
+		'''
+		try:
+			response = self.sqsclient.receive_message(
+				QueueUrl=self.queueurl,
+				MaxNumberOfMessages=10,
+				WaitTimeSeconds=max(0, min(20, int(timeout))))
+		except ClientError as e:
+			raise e
+
+		events   = []
+		messages = response.get('Messages', [])
+
+		for message in messages:
+			body = json.loads(message['Body'])
+			if body.get('detail-type') == DETAIL_TYPE:
+				events.append((body['detail']['instance-id'], body['detail']['state'], body['time']))
+
+		if messages:
+			self.sqsclient.delete_message_batch(
+				QueueUrl=self.queueurl,
+				Entries=[{'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(messages)])
+
+		return events
+
+class StateEvents(object):
+	''' Tracks the state of instances from a stream of state-change events
+		and resolves waits as the events arrive.
+		A single tracker can serve any number of concurrent waits.
+	'''
+
+	def __init__(self, source, silence = 30, region = None):
+		''' @type source:	LocalEventSource|SqsEventSource
+			@param source:	where the events come from
+			@type silence:	integer
+			@param silence:	seconds without events before falling back to describe_instances
+		'''
+		self.source    = source
+		self.silence   = silence
+		self.region    = region
+		self.states    = {}
+		self.condition = threading.Condition()
+		self.running   = False
+		self.thread    = None
+
+	def start(self):
+		''' Start consuming events in a background thread '''
+		if self.thread:
+			self.thread.join()
+		self.running = True
+		self.thread  = threading.Thread(target=self._consume)
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def stop(self):
+		''' Stop consuming events, the receive in flight ends in the background '''
+		self.running = False
+
+	def _consume(self):
+		while self.running:
+			events = self.source.receive(timeout=RECEIVE)
+			if events:
+				self._update(events)
+
+	def _update(self, events):
+		with self.condition:
+			for instanceid, state, when in events:
+				# keep only the latest state, events may arrive out of order
+				if instanceid not in self.states or self.states[instanceid][1] <= when:
+					self.states[instanceid] = (state, when)
+			self.condition.notify_all()
+
+	def _poll(self, ids):
+		# fallback: one describe_instances for every instance still awaited,
+		# the ids EC2 does not know yet stay pending until the next poll
+		ec2client = boto3.client('ec2', region_name=self.region)
+		now       = _now()
+
+		while True:
+			try:
+				info = ec2client.describe_instances(InstanceIds=ids)
+				break
+			except ClientError as e:
+				if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+					raise e
+				unknown = set(INSTANCE_ID.findall(e.response['Error'].get('Message', '')))
+				if not unknown.intersection(ids):
+					return None
+				ids = [my_id for my_id in ids if my_id not in unknown]
+				if not ids:
+					return None
+
+		self._update([(instance['InstanceId'], instance['State']['Name'], now)
+			for reservation in info['Reservations']
+			for instance in reservation['Instances']])
+
+	def wait(self, ids, state, timeout = 600, since = None):
+		''' Wait for all the instances to be in state -state-
+
+			@type ids:		[string,...,string]
+			@param ids:		ids of the instances
+			@type state:	string
+			@param state:	running|stopped|terminated
+			@type timeout:	integer
+			@param timeout:	seconds before giving up
+			@type since:	string
+			@param since:	ISO 8601 time of the operation, states of earlier events are ignored, now if None
+			@rtype:    None
+			@return:   None
+		'''
+		deadline = time.time() + timeout
+		since    = since or _now()
+		pending  = set(ids)
+		seen     = dict((my_id, self.states.get(my_id)) for my_id in ids)
+		quiet    = time.time() + self.silence
+
+		while True:
+			with self.condition:
+				for my_id in list(pending):
+					current = self.states.get(my_id)
+					if current != seen[my_id]:
+						seen[my_id] = current
+						quiet = time.time() + self.silence
+					# states of events older than the wait may predate the operation
+					if not current or current[1] < since:
+						continue
+					if current[0] == state:
+						pending.discard(my_id)
+					elif current[0] in DEAD_ENDS.get(state, []):
+						raise WaitError('instance %s is %s, it cannot become %s' % (my_id, current[0], state))
+
+				if not pending:
+					return None
+
+				now = time.time()
+				if now >= deadline:
+					raise WaitError('%d instances are not %s yet' % (len(pending), state))
+				if now < quiet:
+					self.condition.wait(min(quiet, deadline) - now)
+					continue
+
+			print "no events for %d seconds, polling the state of the instances" % self.silence
+			self._poll(sorted(pending))
+			quiet = time.time() + self.silence
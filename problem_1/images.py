@@ -0,0 +1,161 @@
+import re
+
+import boto3
+from botocore.exceptions import ClientError
+
+from awsedu.cache import diskCache
+
+''' Notes:
+	-	The launch functions accept an image instead of an ami id, in one of the forms:
+
+		'ami-969c2deb'                          an id, used as it is
+		'amazon-linux-2'                        an alias of ALIASES
+		'amzn2-ami-hvm-2.0.*-x86_64-gp2'        a name pattern, of images owned by you or by amazon
+		{'name': 'my-app-*', 'owners': ['self'], 'arch': 'arm64'}
+
+	-	An image resolves to its most recent available ami, the resolution is cached
+		per region for TTL seconds, in memory and on disk: repeated launches make no describe_images call
+	-	Ids are region specific, so are the cache files: images-<region>.json.
+		They also keep the architecture and virtualization of the amis checked by problem_1.catalog
+	-	Queries with the 'self' owner see the private amis of an account: they are cached
+		in images-<account>-<region>.json, the account is asked to STS once per access key
+'''
+
+TTL = 24 * 3600
+
+IMAGE_ID = re.compile(r'^ami-[0-9a-f]+$')
+
+ALIASES = {
+	'amazon-linux-2': {'name': 'amzn2-ami-hvm-2.0.*-x86_64-gp2', 'owners': ['amazon']},
+	'amazon-linux':   {'name': 'amzn-ami-hvm-*-x86_64-gp2',      'owners': ['amazon']},
+	'deep-learning':  {'name': 'Deep Learning AMI (Amazon Linux) Version *', 'owners': ['amazon']},
+	'ubuntu-18.04':   {'name': 'ubuntu/images/hvm-ssd/ubuntu-bionic-18.04-amd64-server-*', 'owners': ['099720109477']}
+}
+
+# account id of every access key seen
+ACCOUNTS = {}
+
+def imagesAccount(client = None):
+	''' Get the id of the account of the credentials of -client-,
+		asked to STS once per access key
+
+		@type client:	botocore client
+		@param client:	client whose credentials are used, the default session if None
+		@rtype:    string
+		@return:   account id
+	'''
+	if client is not None:
+		credentials = client._request_signer._credentials
+	else:
+		credentials = boto3._get_default_session().get_credentials()
+	credentials = credentials.get_frozen_credentials()
+
+	if credentials.access_key not in ACCOUNTS:
+		stsclient = boto3.client('sts',
+			aws_access_key_id=credentials.access_key,
+			aws_secret_access_key=credentials.secret_key,
+			aws_session_token=credentials.token)
+		ACCOUNTS[credentials.access_key] = stsclient.get_caller_identity()['Account']
+
+	return ACCOUNTS[credentials.access_key]
+
+def imagesQuery(image):
+	''' Normalize an image, as described in the module notes, into a query
+
+		@type image:	string|dict
+		@param image:	alias, name pattern or query
+		@rtype:    dict
+		@return:   {'name', 'owners', 'arch', 'virtualization'}
+	'''
+	if isinstance(image, basestring):
+		image = ALIASES.get(image, {'name': image, 'owners': ['self', 'amazon']})
+	if 'name' not in image:
+		raise ValueError('an image query needs a name: %r' % (image,))
+	return {
+		'name':           image['name'],
+		'owners':         sorted(image.get('owners', ['self', 'amazon'])),
+		'arch':           image.get('arch', 'x86_64'),
+		'virtualization': image.get('virtualization', 'hvm')}
+
+def imagesResolve(image, region = None, ttl = TTL, refresh = False):
+	''' Resolve an image to the id of its most recent available ami
+
+		@type image:	string|dict
+		@param image:	ami id, alias, name pattern or query
+		@type region:	string
+		@param region:	region of the ami, the default one if None
+		@type ttl:		integer
+		@param ttl:		seconds a resolution stays cached
+		@type refresh:	boolean
+		@param refresh:	ignore the cached resolution
+		@rtype:    string
+		@return:   ami id
+	'''
+	if isinstance(image, basestring) and IMAGE_ID.match(image):
+		return image
+
+	query  = imagesQuery(image)
+	region = region or boto3._get_default_session().region_name
+	scope  = '%s-%s' % (imagesAccount(), region) if 'self' in query['owners'] else region
+	cache  = diskCache('images-%s' % scope)
+	key    = '%(name)s|%(arch)s|%(virtualization)s|' % query + ','.join(query['owners'])
+
+	if not refresh:
+		cached = cache.get(key, ttl)
+		if cached:
+			return cached
+
+	ec2client = boto3.client('ec2', region_name=region)
+	filters   = [
+		{'Name': 'name',                'Values': [query['name']]},
+		{'Name': 'architecture',        'Values': [query['arch']]},
+		{'Name': 'virtualization-type', 'Values': [query['virtualization']]},
+		{'Name': 'state',               'Values': ['available']}]
+
+	try:
+		images = ec2client.describe_images(Owners=query['owners'], Filters=filters)['Images']
+	except ClientError as e:
+		raise e
+
+	if not images:
+		raise ValueError('no available image in %s matches %s' % (region, key))
+
+	latest = max(images, key=lambda image: image['CreationDate'])
+	print "Resolved %s to %s (%s)" % (query['name'], latest['ImageId'], latest['Name'])
+	cache.put(key, latest['ImageId'], ttl)
+
+	return latest['ImageId']
+
+def imagesDescribe(ami, region = None, ec2client = None):
+	''' Get the architecture and virtualization type of an ami,
+		cached like the resolutions: they never change
+
+		@type ami:		string
+		@param ami:		ami id
+		@type region:		string
+		@param region:		region of the ami, the default one if None
+		@type ec2client:	EC2.Client
+		@param ec2client:	client of -region- to use, a new one if None
+		@rtype:    dict
+		@return:   {'arch', 'virtualization'}
+	'''
+	region = region or (ec2client.meta.region_name if ec2client else boto3._get_default_session().region_name)
+	cache  = diskCache('images-%s' % region)
+
+	cached = cache.get(ami)
+	if cached:
+		return cached
+
+	ec2client = ec2client or boto3.client('ec2', region_name=region)
+	try:
+		images = ec2client.describe_images(ImageIds=[ami])['Images']
+	except ClientError as e:
+		raise e
+
+	if not images:
+		raise ValueError('no image %s in %s' % (ami, region))
+
+	described = {'arch': images[0]['Architecture'], 'virtualization': images[0]['VirtualizationType']}
+	cache.put(ami, described, TTL)
+
+	return described
@@ -1,11 +1,36 @@
 import boto3
 from botocore.exceptions import ClientError
 
+from awsedu.projection import projectionRecord, projectionStream
+from awsedu.tracing import annotate, span, traced
+from problem_1.catalog import catalogCheck
+from problem_1.images import imagesResolve
+from problem_1.readiness import readinessReport
+
 ''' Notes: 
 	-	If you specify more instances than Amazon EC2 can launch in the target Availability Zone, Amazon EC2 launches the largest possible number of instances above MinCount.
 	-	If you specify a minimum that is more instances than Amazon EC2 can launch in the target Availability Zone,  Amazon EC2 launches no instances at all.
+	-	The sync paths only read a few fields of describe_instances: they project the pages into records
+	-	The sync paths of launch and start can go on until the instances are usable:
+		-readiness- probes their ports or status checks, see problem_1.readiness
+		The outcome goes back to the caller: a 'Readiness' entry {'ready': [ids], 'not_ready': [ids]}
+		in the responses, a -ready- attribute on the instances of ec2ResourceLaunch
+	-	Instance types are checked against the cached catalog of problem_1.catalog before any request:
+		a type that cannot run the ami, or is not offered in the zone, fails before the first call
 '''
-def ec2ResourceLaunch(mincount, maxcount, ami, instancetype = 't2.micro', sync = True):
+
+# fields read by the sync paths
+LAUNCHED = projectionRecord('Launched', ['ImageId', 'InstanceId', 'InstanceType', 'State.Name', 'PublicIpAddress', 'PublicDnsName'])
+STATES   = projectionRecord('InstanceState', ['InstanceId', 'State.Name'])
+TYPES    = projectionRecord('InstanceTypes', ['InstanceId', 'InstanceType', 'ImageId', 'Placement.AvailabilityZone'])
+
+def _readiness(ready, late, ids = None):
+	# the 'Readiness' entry of a response, restricted to -ids- if given
+	keep = (lambda my_id: True) if ids is None else set(ids).__contains__
+	return {'ready': sorted(filter(keep, ready)), 'not_ready': sorted(filter(keep, late))}
+
+@traced
+def ec2ResourceLaunch(mincount, maxcount, ami, instancetype = 't2.micro', sync = True, events = None, readiness = None):
 	''' Launches -maxcount- instances of -InstanceType- 
 		with the specified ami using high-level resource interface
 		and returns the related objects
@@ -14,58 +39,82 @@ def ec2ResourceLaunch(mincount, maxcount, ami, instancetype = 't2.micro', sync =
 		@param mincount:    	minimum number of instances to launch
 		@type maxcount:     	integer
 		@param maxcount:    	maximum number of instances to launch
-		@type ami:          	string
-		@param ami:         	amazon machine image deployed
+		@type ami:          	string|dict
+		@param ami:         	amazon machine image deployed: an id, or an image resolved by problem_1.images
 		@type instancetype:		string
 		@param instancetype:	type of launched instances
 		@type sync:				boolean
 		@param sync: 			wait for the operation to take effect
+		@type events:			StateEvents
+		@param events: 			started state-change events tracker, waits on its events instead of polling
+		@type readiness:		dict
+		@param readiness:		with sync, probe the instances until usable: readinessWait options, ex. {'ports': [22]}
 		@rtype:    [ec2factoryObj, ..., ec2factoryObj]
-		@return:   list of instance type objects
+		@return:   list of instance type objects, with -readiness- their boolean -ready- attribute
 	'''
 
 	# Object Oriented High level AWS client interface
 	ec2resource = boto3.resource('ec2')
+	ami         = imagesResolve(ami)
+	catalogCheck(instancetype, ami)
 	
 	# Try a dry run to veryfy permissions
 	# Dry-runs always return an error response:
 	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
-	try:
-		ec2resource.create_instances(
-		MinCount = mincount, 
-		MaxCount = maxcount, 
-		ImageId  = ami, 
-		InstanceType=instancetype,
-		DryRun = True)
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
+	with span('dry-run'):
+		try:
+			ec2resource.create_instances(
+			MinCount = mincount, 
+			MaxCount = maxcount, 
+			ImageId  = ami, 
+			InstanceType=instancetype,
+			DryRun = True)
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 
 	try:
-		instances = ec2resource.create_instances(
-		MinCount = mincount, 
-		MaxCount = maxcount, 
-		ImageId  = ami, 
-		InstanceType=instancetype)
+		with span('request'):
+			instances = ec2resource.create_instances(
+			MinCount = mincount, 
+			MaxCount = maxcount, 
+			ImageId  = ami, 
+			InstanceType=instancetype)
 	except ClientError as e:
 		raise e
+
+	annotate(instance_ids=[instance.id for instance in instances], instance_count=len(instances))
  
 	if sync:
 		# Wait till all the instances are in a running state
-		for instance in instances:
-			print "waiting for the instance to be in running state"
-			instance.wait_until_running()
-			instance.reload()
-			print "Image id: ",		instance.image_id
-			print "Instance id: ", instance.id
-			print "Instance type: ", instance.instance_type
-			print "Instance state: ", instance.state['Name']
-			print "instance public IP: ", instance.public_ip_address
-			print "Instance public DNS: ", instance.public_dns_name
+		with span('wait'):
+			if events:
+				print "waiting for the instances to be in running state"
+				events.wait([instance.id for instance in instances], 'running')
+			else:
+				for instance in instances:
+					with span('wait instance', instance_id=instance.id):
+						print "waiting for the instance to be in running state"
+						instance.wait_until_running()
+		with span('describe'):
+			for instance in instances:
+				instance.reload()
+				print "Image id: ",		instance.image_id
+				print "Instance id: ", instance.id
+				print "Instance type: ", instance.instance_type
+				print "Instance state: ", instance.state['Name']
+				print "instance public IP: ", instance.public_ip_address
+				print "Instance public DNS: ", instance.public_dns_name
+		if readiness is not None:
+			with span('ready'):
+				ready, late = readinessReport([instance.id for instance in instances], readiness)
+			for instance in instances:
+				instance.ready = instance.id in ready
 
 	return instances
 
-def ec2ClientLaunch(mincount, maxcount, ami, instancetype = 't2.micro', sync = True):
+@traced
+def ec2ClientLaunch(mincount, maxcount, ami, instancetype = 't2.micro', sync = True, events = None, readiness = None):
 	''' Launches -maxcount- instances of -InstanceType-
 		using low-level client interface
 		with the specified ami and returns the operation response
@@ -74,64 +123,83 @@ def ec2ClientLaunch(mincount, maxcount, ami, instancetype = 't2.micro', sync = T
 		@param mincount:    	minimum number of instances to launch
 		@type maxcount:     	integer
 		@param maxcount:    	maximum number of instances to launch
-		@type ami:          	string
-		@param ami:         	amazon machine image deployed
+		@type ami:          	string|dict
+		@param ami:         	amazon machine image deployed: an id, or an image resolved by problem_1.images
 		@type instancetype:   	string
 		@param instancetype: 	type of launched instances
 		@type sync:				boolean
 		@param sync: 			wait for the operation to take effect
+		@type events:			StateEvents
+		@param events: 			started state-change events tracker, waits on its events instead of polling
+		@type readiness:		dict
+		@param readiness:		with sync, probe the instances until usable: readinessWait options, ex. {'ports': [22]}
 		@rtype:    dict
-		@return:   response dict containing information about running instances
+		@return:   response dict containing information about running instances,
+				   with -readiness- its 'Readiness' entry: {'ready': [ids], 'not_ready': [ids]}
 	'''
 
 	# Low level AWS client 1:1 interface
 	ec2client = boto3.client('ec2')
+	ami       = imagesResolve(ami)
+	catalogCheck(instancetype, ami)
 
 	# Try a dry run to veryfy permissions
 	# Dry-runs always return an error response:
 	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
+	with span('dry-run'):
+		try:
+			ec2client.run_instances(
+				MinCount = mincount, 
+				MaxCount = maxcount, 
+				ImageId = ami, 
+				InstanceType = instancetype,
+				DryRun = True)
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 	try:
-		ec2client.run_instances(
-			MinCount = mincount, 
-			MaxCount = maxcount, 
-			ImageId = ami, 
-			InstanceType = instancetype,
-			DryRun = True)
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
-	try:
-		response = ec2client.run_instances(
-			MinCount = mincount, 
-			MaxCount = maxcount, 
-			ImageId = ami, 
-			InstanceType = instancetype)
+		with span('request'):
+			response = ec2client.run_instances(
+				MinCount = mincount, 
+				MaxCount = maxcount, 
+				ImageId = ami, 
+				InstanceType = instancetype)
 	except ClientError as e:
 		raise e
 
 	ids = [x.get('InstanceId') for x in response['Instances']]
+	annotate(instance_ids=ids, instance_count=len(ids))
 
 	# wait for the instances to be in a running state
 	if sync:
-		for my_id in ids:
-			waiter = ec2client.get_waiter('instance_running')
-			print "waiting for the instance to be in running state"
-			waiter.wait(InstanceIds=[my_id])
+		with span('wait'):
+			if events:
+				print "waiting for the instances to be in running state"
+				events.wait(ids, 'running')
+			else:
+				for my_id in ids:
+					with span('wait instance', instance_id=my_id):
+						waiter = ec2client.get_waiter('instance_running')
+						print "waiting for the instance to be in running state"
+						waiter.wait(InstanceIds=[my_id])
 			
-		info = ec2client.describe_instances(InstanceIds=ids)
-
-		for reservation in info['Reservations']:
-			for instance in reservation['Instances']:
-				print "Image id: ", instance['ImageId']
-				print "Instance id: ", instance['InstanceId']
-				print "Instance type: ", instance['InstanceType']
-				print "Instance state: ", instance['State']['Name']
-				print "Instance public IP: ", instance['PublicIpAddress']
-				print "Instance public DNS: ", instance['PublicDnsName']
+		with span('describe'):
+			for instance in projectionStream(ec2client, 'describe_instances', LAUNCHED, InstanceIds=ids):
+				print "Image id: ", instance.ImageId
+				print "Instance id: ", instance.InstanceId
+				print "Instance type: ", instance.InstanceType
+				print "Instance state: ", instance.State_Name
+				print "Instance public IP: ", instance.PublicIpAddress
+				print "Instance public DNS: ", instance.PublicDnsName
+		if readiness is not None:
+			with span('ready'):
+				ready, late = readinessReport(ids, readiness, ec2client)
+			response['Readiness'] = _readiness(ready, late)
 
 	return response
 
-def ec2ResourceStop(ids, force = False, sync = True):	
+@traced
+def ec2ResourceStop(ids, force = False, sync = True, events = None):	
 	''' Stops running instances
 		using high-level resource interface
 
@@ -141,38 +209,52 @@ def ec2ResourceStop(ids, force = False, sync = True):
 		@param force:	force the stop
 		@type sync:		boolean
 		@param sync: 	wait for the operation to take effect
+		@type events:	StateEvents
+		@param events:	started state-change events tracker, waits on its events instead of polling
 		@rtype:		[dict,...,dict]
 		@return:	response metadata
 	'''
 
 	# Object Oriented High level AWS client interface
 	ec2resource = boto3.resource('ec2')
+	annotate(instance_ids=ids, instance_count=len(ids))
 
 	# Try a dry run to veryfy permissions
 	# Dry-runs always return an error response:
 	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
-	try:
-		ec2resource.instances.filter(InstanceIds=ids).stop(Force=force, DryRun=True)
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
+	with span('dry-run'):
+		try:
+			ec2resource.instances.filter(InstanceIds=ids).stop(Force=force, DryRun=True)
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 	try:
 		instances = ec2resource.instances.filter(InstanceIds=ids)
-		response  = instances.stop(Force=force)
+		with span('request'):
+			response  = instances.stop(Force=force)
 
 		if sync:
-			for instance in instances:
-				print "waiting for the instance to be in stopped state"
-				instance.wait_until_stopped()
-				instance.reload()
-				print "Instance id: ", instance.id
-				print "Instance state: ", instance.state['Name']	 
+			with span('wait'):
+				if events:
+					print "waiting for the instances to be in stopped state"
+					events.wait(ids, 'stopped')
+				else:
+					for instance in instances:
+						with span('wait instance', instance_id=instance.id):
+							print "waiting for the instance to be in stopped state"
+							instance.wait_until_stopped()
+			with span('describe'):
+				for instance in instances:
+					instance.reload()
+					print "Instance id: ", instance.id
+					print "Instance state: ", instance.state['Name']	 
 	except ClientError as e:
 		raise e
 
 	return response
 
-def ec2ClientStop(ids, force = False, sync = True):
+@traced
+def ec2ClientStop(ids, force = False, sync = True, events = None):
 	''' Stops running instances
 		using low-level client interface
 
@@ -182,44 +264,54 @@ def ec2ClientStop(ids, force = False, sync = True):
 		@param force:	force the stop
 		@type sync:		boolean
 		@param sync: 	wait for the operation to take effect
+		@type events:	StateEvents
+		@param events:	started state-change events tracker, waits on its events instead of polling
 		@rtype:		[dict,...,dict]
 		@return:	response metadata
 	'''
 
 	# Object Oriented High level AWS client interface
 	ec2client = boto3.client('ec2')
+	annotate(instance_ids=ids, instance_count=len(ids))
 
 	# Try a dry run to veryfy permissions
 	# Dry-runs always return an error response:
 	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
+	with span('dry-run'):
+		try:
+			ec2client.stop_instances(InstanceIds=ids, Force=force, DryRun=True)	
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 	try:
-		ec2client.stop_instances(InstanceIds=ids, Force=force, DryRun=True)	
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
-	try:
-		response = ec2client.stop_instances(InstanceIds=ids, Force=force)
+		with span('request'):
+			response = ec2client.stop_instances(InstanceIds=ids, Force=force)
 	
 		# wait for the instances to be in a stopped state
 		if sync:
-			for my_id in ids:
-				waiter = ec2client.get_waiter('instance_stopped')
-				print "waiting for the instance to be in stopped state"
-				waiter.wait(InstanceIds=[my_id])
-
-			info = ec2client.describe_instances(InstanceIds=ids)
-
-			for reservation in info['Reservations']:
-				for instance in reservation['Instances']:
-					print "Instance id: ", instance['InstanceId']
-					print "Instance state: ", instance['State']['Name']
+			with span('wait'):
+				if events:
+					print "waiting for the instances to be in stopped state"
+					events.wait(ids, 'stopped')
+				else:
+					for my_id in ids:
+						with span('wait instance', instance_id=my_id):
+							waiter = ec2client.get_waiter('instance_stopped')
+							print "waiting for the instance to be in stopped state"
+							waiter.wait(InstanceIds=[my_id])
+
+			with span('describe'):
+				for instance in projectionStream(ec2client, 'describe_instances', STATES, InstanceIds=ids):
+					print "Instance id: ", instance.InstanceId
+					print "Instance state: ", instance.State_Name
 
 	except ClientError as e:
 		raise e
 
 	return response
 
-def ec2ResourceStart(ids, sync = True):
+@traced
+def ec2ResourceStart(ids, sync = True, events = None, readiness = None):
 	''' Starts stopped instances
 		using high-level resource interface
 
@@ -227,37 +319,58 @@ def ec2ResourceStart(ids, sync = True):
 		@param ids:		ids of the instances
 		@type sync:		boolean
 		@param sync: 	wait for the operation to take effect
+		@type events:	StateEvents
+		@param events:	started state-change events tracker, waits on its events instead of polling
+		@type readiness:	dict
+		@param readiness:	with sync, probe the instances until usable: readinessWait options, ex. {'ports': [22]}
 		@rtype:    [dict,...,dict]
-		@return:   response metadata
+		@return:   response metadata, with -readiness- the 'Readiness' entry of its instances in every response
 	'''
 
 	# Object Oriented High level AWS client interface
 	ec2resource = boto3.resource('ec2')
+	annotate(instance_ids=ids, instance_count=len(ids))
 
 	# Try a dry run to veryfy permissions
 	# Dry-runs always return an error response:
 	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
-	try:
-		ec2resource.instances.filter(InstanceIds=ids).start(DryRun=True)
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
+	with span('dry-run'):
+		try:
+			ec2resource.instances.filter(InstanceIds=ids).start(DryRun=True)
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 	try:
 		instances = ec2resource.instances.filter(InstanceIds=ids)
-		response  = instances.start()
+		with span('request'):
+			response  = instances.start()
 		if sync:
-			for instance in instances:
-				print "waiting for the instance to be in running state"
-				instance.wait_until_running()
-				instance.reload()
-				print "Instance id: ", instance.id
-				print "Instance state: ", instance.state['Name']
+			with span('wait'):
+				if events:
+					print "waiting for the instances to be in running state"
+					events.wait(ids, 'running')
+				else:
+					for instance in instances:
+						with span('wait instance', instance_id=instance.id):
+							print "waiting for the instance to be in running state"
+							instance.wait_until_running()
+			with span('describe'):
+				for instance in instances:
+					instance.reload()
+					print "Instance id: ", instance.id
+					print "Instance state: ", instance.state['Name']
+			if readiness is not None:
+				with span('ready'):
+					ready, late = readinessReport(ids, readiness)
+				for part in response:
+					part['Readiness'] = _readiness(ready, late, [i['InstanceId'] for i in part['StartingInstances']])
 	except ClientError as e:
 		raise e
 
 	return response
 
-def ec2ClientStart(ids, sync = True):
+@traced
+def ec2ClientStart(ids, sync = True, events = None, readiness = None):
 	''' Starts stopped instances
 		using low-level client interface
 
@@ -265,43 +378,59 @@ def ec2ClientStart(ids, sync = True):
 		@param ids:		ids of the instances
 		@type sync:		boolean
 		@param sync: 	wait for the operation to take effect
-		@rtype:    [dict,...,dict]
-		@return:   response metadata
+		@type events:	StateEvents
+		@param events:	started state-change events tracker, waits on its events instead of polling
+		@type readiness:	dict
+		@param readiness:	with sync, probe the instances until usable: readinessWait options, ex. {'ports': [22]}
+		@rtype:    dict
+		@return:   response metadata, with -readiness- its 'Readiness' entry
 	'''
 
 	# Object Oriented High level AWS client interface
 	ec2client = boto3.client('ec2')
+	annotate(instance_ids=ids, instance_count=len(ids))
 
 	# Try a dry run to veryfy permissions
 	# Dry-runs always return an error response:
 	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
+	with span('dry-run'):
+		try:
+			ec2client.start_instances(InstanceIds=ids, DryRun=True)	
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 	try:
-		ec2client.start_instances(InstanceIds=ids, DryRun=True)	
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
-	try:
-		response = ec2client.start_instances(InstanceIds=ids)
+		with span('request'):
+			response = ec2client.start_instances(InstanceIds=ids)
 		
 		# wait for the instances to be in a running state
 		if sync:
-			for my_id in ids:
-				waiter = ec2client.get_waiter('instance_running')
-				print "waiting for the instance to be in stopped state"
-				waiter.wait(InstanceIds=[my_id])
-
-			info = ec2client.describe_instances(InstanceIds = ids)
-
-			for reservation in info['Reservations']:
-				for instance in reservation['Instances']:
-					print "Instance id: ", instance['InstanceId']
-					print "Instance state: ", instance['State']['Name']
+			with span('wait'):
+				if events:
+					print "waiting for the instances to be in running state"
+					events.wait(ids, 'running')
+				else:
+					for my_id in ids:
+						with span('wait instance', instance_id=my_id):
+							waiter = ec2client.get_waiter('instance_running')
+							print "waiting for the instance to be in stopped state"
+							waiter.wait(InstanceIds=[my_id])
+
+			with span('describe'):
+				for instance in projectionStream(ec2client, 'describe_instances', STATES, InstanceIds=ids):
+					print "Instance id: ", instance.InstanceId
+					print "Instance state: ", instance.State_Name
+			if readiness is not None:
+				with span('ready'):
+					ready, late = readinessReport(ids, readiness, ec2client)
+				response['Readiness'] = _readiness(ready, late)
 	except ClientError as e:
 		raise e
 
 	return response
 
-def ec2ResourceTerminate(ids, sync = True):
+@traced
+def ec2ResourceTerminate(ids, sync = True, events = None):
 	''' Termiates running/stopped instances
 		using high-level resource interface
 
@@ -309,37 +438,51 @@ def ec2ResourceTerminate(ids, sync = True):
 		@param ids:		ids of the instances
 		@type sync:		boolean
 		@param sync: 	wait for the operation to take effect
+		@type events:	StateEvents
+		@param events:	started state-change events tracker, waits on its events instead of polling
 		@rtype:    [dict,...,dict]
 		@return:   response metadata
 	'''
 
 	# Object Oriented High level AWS client interface
 	ec2resource = boto3.resource('ec2')
+	annotate(instance_ids=ids, instance_count=len(ids))
 
 	# Try a dry run to veryfy permissions
 	# Dry-runs always return an error response:
 	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
-	try:
-		ec2resource.instances.filter(InstanceIds=ids).terminate(DryRun=True)
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
+	with span('dry-run'):
+		try:
+			ec2resource.instances.filter(InstanceIds=ids).terminate(DryRun=True)
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 	try:
 		instances = ec2resource.instances.filter(InstanceIds=ids)
-		response  = instances.terminate()
+		with span('request'):
+			response  = instances.terminate()
 		if sync:
-			for instance in instances:
-				print "waiting for the instance to be in terminated state"
-				instance.wait_until_terminated()
-				instance.reload()
-				print "Instance id: ", instance.id
-				print "Instance state: ", instance.state['Name']
+			with span('wait'):
+				if events:
+					print "waiting for the instances to be in terminated state"
+					events.wait(ids, 'terminated')
+				else:
+					for instance in instances:
+						with span('wait instance', instance_id=instance.id):
+							print "waiting for the instance to be in terminated state"
+							instance.wait_until_terminated()
+			with span('describe'):
+				for instance in instances:
+					instance.reload()
+					print "Instance id: ", instance.id
+					print "Instance state: ", instance.state['Name']
 	except ClientError as e:
 		raise e
 
 	return response
 
-def ec2ClientTerminate(ids, sync = True):
+@traced
+def ec2ClientTerminate(ids, sync = True, events = None):
 	''' Terminates running/stopped instances
 		using low-level client interface
 
@@ -347,42 +490,52 @@ def ec2ClientTerminate(ids, sync = True):
 		@param ids:		ids of the instances
 		@type sync:		boolean
 		@param sync: 	wait for the operation to take effect
+		@type events:	StateEvents
+		@param events:	started state-change events tracker, waits on its events instead of polling
 		@rtype:    [dict,...,dict]
 		@return:   response metadata
 	'''
 
 	# Object Oriented High level AWS client interface
 	ec2client = boto3.client('ec2')
+	annotate(instance_ids=ids, instance_count=len(ids))
 
 	# Try a dry run to veryfy permissions
 	# Dry-runs always return an error response:
 	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
+	with span('dry-run'):
+		try:
+			ec2client.terminate_instances(InstanceIds=ids, DryRun=True)	
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 	try:
-		ec2client.terminate_instances(InstanceIds=ids, DryRun=True)	
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
-	try:
-		response = ec2client.terminate_instances(InstanceIds=ids)
+		with span('request'):
+			response = ec2client.terminate_instances(InstanceIds=ids)
 
 		# wait for the instances to be in a terminated state
 		if sync:
-			for my_id in ids:
-				waiter = ec2client.get_waiter('instance_terminated')
-				print "waiting for the instance to be in terminated state"
-				waiter.wait(InstanceIds=[my_id])
-
-			info = ec2client.describe_instances(InstanceIds = ids)
-
-			for reservation in info['Reservations']:
-				for instance in reservation['Instances']:
-					print "Instance id: ", instance['InstanceId']
-					print "Instance state: ", instance['State']['Name']
+			with span('wait'):
+				if events:
+					print "waiting for the instances to be in terminated state"
+					events.wait(ids, 'terminated')
+				else:
+					for my_id in ids:
+						with span('wait instance', instance_id=my_id):
+							waiter = ec2client.get_waiter('instance_terminated')
+							print "waiting for the instance to be in terminated state"
+							waiter.wait(InstanceIds=[my_id])
+
+			with span('describe'):
+				for instance in projectionStream(ec2client, 'describe_instances', STATES, InstanceIds=ids):
+					print "Instance id: ", instance.InstanceId
+					print "Instance state: ", instance.State_Name
 	except ClientError as e:
 		raise e
 
 	return response
 
+@traced
 def ec2ResourceListInstanceByStatus(status):
 	''' List all instances in a given status
 		using high-level resource interface
@@ -411,14 +564,18 @@ def ec2ResourceListInstanceByStatus(status):
 
 	return instances
 
-def ec2ClientListInstanceByStatus(status):
+@traced
+def ec2ClientListInstanceByStatus(status, fields = None):
 	''' List all instances in a given status
 		using low-level client interface
 
 		@type status:		string
 		@param status:		running|terminated|stopped...
+		@type fields:		[string,...,string]
+		@param fields:		dotted paths read from every instance, ex. ['InstanceId', 'State.Name'],
+							the whole response is kept if None
 		@rtype:    [dict,...,dict]
-		@return:   response metadata
+		@return:   response metadata, the projected instances if -fields-
 	'''
 	ec2client = boto3.client('ec2')
 
@@ -427,6 +584,17 @@ def ec2ClientListInstanceByStatus(status):
 	'Values': [status]
 	}]
 
+	if fields:
+		record    = projectionRecord('Instance', fields)
+		instances = []
+		for instance in projectionStream(ec2client, 'describe_instances', record,
+				Filters=filters, PaginationConfig={'PageSize': 1000}):
+			for attribute, path in record.FIELDS:
+				print "%s: " % attribute, instance[attribute]
+			print "--------------------"
+			instances.append(instance)
+		return instances
+
 	info = ec2client.describe_instances(Filters=filters)
 
 	for reservation in info['Reservations']:
@@ -440,6 +608,7 @@ def ec2ClientListInstanceByStatus(status):
 
 	return info
 
+@traced
 def ec2ClientModifyInstanceType(ids, new_type):
 	''' Change instance type, using high level resource interface 
 		only works if instance is stopped
@@ -453,40 +622,45 @@ def ec2ClientModifyInstanceType(ids, new_type):
 	'''
 	
 	ec2client = boto3.client('ec2')
+	annotate(instance_ids=ids, instance_count=len(ids))
 	filters   = [{'Name':'instance-state-name','Values': ['stopped']}]
 
-	info = ec2client.describe_instances(InstanceIds=ids, Filters=filters)
+	instances = list(projectionStream(ec2client, 'describe_instances', TYPES, InstanceIds=ids, Filters=filters))
+
+	# the whole resize is checked before the first instance changes
+	for instance in instances:
+		catalogCheck(new_type, instance.ImageId, instance.Placement_AvailabilityZone)
 
 	# Try a dry run to veryfy permissions
 	# only single instance objects can invoke modify attribute
 	# instancegroups cannot
-	try:
-		for reservation in info['Reservations']:
-			for instance in reservation['Instances']:		
-				if instance['InstanceType'] is not new_type:
+	with span('dry-run'):
+		try:
+			for instance in instances:
+				if instance.InstanceType is not new_type:
 					ec2client.modify_instance_attribute(
-						InstanceId=instance['InstanceId'],
+						InstanceId=instance.InstanceId,
 						InstanceType={'Value': new_type}, 
 						DryRun=True)
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 
 	try:
-		for reservation in info['Reservations']:
-			for instance in reservation['Instances']:
-				if instance['InstanceType'] is not new_type:
-					print "Changing the type of instance: "
-					print "Instance id: ", instance['InstanceId']
-					print "From "+instance['InstanceType']+" to "+new_type
-					ec2client.modify_instance_attribute(
-						InstanceId=instance['InstanceId'],
-						InstanceType={'Value': new_type})
+		for instance in instances:
+			if instance.InstanceType is not new_type:
+				print "Changing the type of instance: "
+				print "Instance id: ", instance.InstanceId
+				print "From "+instance.InstanceType+" to "+new_type
+				ec2client.modify_instance_attribute(
+					InstanceId=instance.InstanceId,
+					InstanceType={'Value': new_type})
 	except ClientError as e:
 			raise e
 
 	return None
 	
+@traced
 def ec2ResourceModifyInstanceType(ids, new_type):
 	''' Change instance type, using low-level client interface
 		only works if instance is stopped
@@ -501,20 +675,26 @@ def ec2ResourceModifyInstanceType(ids, new_type):
 
 	# Object Oriented High level AWS client interface
 	ec2resource = boto3.resource('ec2')
+	annotate(instance_ids=ids, instance_count=len(ids))
 	filters     = [{'Name':'instance-state-name','Values': ['stopped']}]
 
+	# the whole resize is checked before the first instance changes
+	for instance in ec2resource.instances.filter(InstanceIds=ids, Filters=filters):
+		catalogCheck(new_type, instance.image_id, instance.placement['AvailabilityZone'])
+
 	# Try a dry run to veryfy permissions
 	# only single instance objects can invoke modify attribute
 	# instancegroups cannot
-	try:
-		instances = ec2resource.instances.filter(InstanceIds=ids, Filters=filters)
+	with span('dry-run'):
+		try:
+			instances = ec2resource.instances.filter(InstanceIds=ids, Filters=filters)
 		
-		for instance in instances:
-			if instance.instance_type is not new_type:
-				instance.modify_attribute(InstanceType={'Value': new_type}, DryRun=True)
-	except ClientError as e:
-		if 'DryRunOperation' not in str(e):
-			raise
+			for instance in instances:
+				if instance.instance_type is not new_type:
+					instance.modify_attribute(InstanceType={'Value': new_type}, DryRun=True)
+		except ClientError as e:
+			if 'DryRunOperation' not in str(e):
+				raise
 
 	try:		
 		instances = ec2resource.instances.filter(InstanceIds=ids, Filters=filters)		
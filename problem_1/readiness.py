@@ -0,0 +1,200 @@
+import errno
+import select
+import socket
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+from awsedu.projection import projectionRecord, projectionStream
+
+''' Notes:
+	-	An instance in the running state is not yet usable: it is ready when every probed
+		TCP port accepts connections and, optionally, both its status checks are ok
+	-	Every instance is probed at once: non-blocking connects multiplexed by a single
+		select loop, at most MAX_SOCKETS in flight, and one describe_instance_status call
+		per MAX_IDS instances and round for the status checks
+	-	After a failed attempt a port is retried after -backoff- seconds, doubled at every
+		failure up to -maxbackoff-: slow hosts are not hammered, fast ones are not held back
+	-	Nothing runs past the deadline, instances not ready by then are reported as such
+'''
+
+# select() handles file descriptors below 1024
+MAX_SOCKETS = 512
+
+# ids per describe_instance_status call
+MAX_IDS     = 100
+
+ADDRESSES = projectionRecord('Address', ['InstanceId', 'PublicIpAddress', 'PrivateIpAddress'])
+
+class _Target(object):
+
+	def __init__(self, my_id, address, port, backoff, maxbackoff):
+		self.id      = my_id
+		self.address = address
+		self.port    = port
+		self.delay   = backoff
+		self.maximum = maxbackoff
+		self.due     = 0
+		self.socket  = None
+		self.started = None
+		self.open    = False
+
+	def connect(self, now):
+		family       = socket.AF_INET6 if ':' in self.address else socket.AF_INET
+		self.socket  = socket.socket(family, socket.SOCK_STREAM)
+		self.socket.setblocking(0)
+		self.started = now
+		code = self.socket.connect_ex((self.address, self.port))
+		if code == 0:
+			self.done(True, now)
+		elif code not in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+			self.done(False, now)
+
+	def done(self, opened, now):
+		self.socket.close()
+		self.socket = None
+		self.open   = opened
+		if not opened:
+			self.due   = now + self.delay
+			self.delay = min(self.delay * 2, self.maximum)
+
+def readinessHosts(ids, public = True, ec2client = None):
+	''' Get the addresses to probe of instances
+
+		@type ids:			[string,...,string]
+		@param ids:			ids of the instances
+		@type public:		boolean
+		@param public:		probe the public addresses, the private ones if False or missing
+		@type ec2client:	EC2.Client
+		@param ec2client:	client to use, a new one if None
+		@rtype:    dict
+		@return:   {instance id: address}
+	'''
+	ec2client = ec2client or boto3.client('ec2')
+	hosts     = {}
+	for instance in projectionStream(ec2client, 'describe_instances', ADDRESSES, InstanceIds=ids):
+		hosts[instance.InstanceId] = (public and instance.PublicIpAddress) or instance.PrivateIpAddress
+	return hosts
+
+def _statusOk(ids, ec2client):
+	ok = set()
+	for start in range(0, len(ids), MAX_IDS):
+		try:
+			response = ec2client.describe_instance_status(InstanceIds=ids[start:start + MAX_IDS])
+		except ClientError as e:
+			raise e
+		for status in response['InstanceStatuses']:
+			if status['InstanceStatus']['Status'] == 'ok' and status['SystemStatus']['Status'] == 'ok':
+				ok.add(status['InstanceId'])
+	return ok
+
+def readinessWait(hosts, ports = (22,), status = False, deadline = 600, timeout = 5,
+		backoff = 1, maxbackoff = 30, interval = 15, ec2client = None):
+	''' Probe every host at once until it is ready or the deadline passes
+
+		@type hosts:		dict
+		@param hosts:		{instance id: address}, as returned by readinessHosts
+		@type ports:		[integer,...,integer]
+		@param ports:		TCP ports that must accept connections, ex. [22, 80]
+		@type status:		boolean
+		@param status:		also wait for the instance and system status checks to be ok
+		@type deadline:		float
+		@param deadline:	seconds before giving up on the hosts not ready
+		@type timeout:		float
+		@param timeout:		seconds of a connection attempt
+		@type backoff:		float
+		@param backoff:		seconds before the first retry of a port, doubled at every failure
+		@type maxbackoff:	float
+		@param maxbackoff:	maximum seconds between two attempts on a port
+		@type interval:		float
+		@param interval:	seconds between two rounds of status checks
+		@type ec2client:	EC2.Client
+		@param ec2client:	client of the status checks, a new one if None
+		@rtype:    (set, set)
+		@return:   ids of the ready instances, ids of the instances not ready
+	'''
+	end     = time.time() + deadline
+	targets = [_Target(my_id, address, port, backoff, maxbackoff)
+		for my_id, address in hosts.items() if address for port in ports]
+	pending = set(hosts)
+	checked = set() if status else set(hosts)
+	polled  = 0
+
+	if status:
+		ec2client = ec2client or boto3.client('ec2')
+
+	while pending:
+		now = time.time()
+		if now >= end:
+			break
+
+		# a round of status checks for the instances still missing them
+		if status and now >= polled + interval and pending - checked:
+			checked |= _statusOk(sorted(pending - checked), ec2client)
+			polled   = now
+			now      = time.time()
+
+		# start the attempts that are due, within the socket budget
+		flying = [t for t in targets if t.socket is not None]
+		for target in targets:
+			if len(flying) >= MAX_SOCKETS:
+				break
+			if target.id in pending and not target.open and target.socket is None and target.due <= now:
+				target.connect(now)
+				if target.socket is not None:
+					flying.append(target)
+
+		# ready: status checked, and every port open on a known address
+		closed  = set(t.id for t in targets if not t.open)
+		pending = set(my_id for my_id in pending
+			if my_id not in checked or my_id in closed or (ports and not hosts[my_id]))
+		if not pending:
+			break
+
+		# sleep until a connection completes, an attempt expires or a retry is due
+		wakeups = [t.started + timeout for t in flying] + \
+			[t.due for t in targets if t.socket is None and not t.open and t.id in pending and t.due > now]
+		if status and pending - checked:
+			wakeups.append(polled + interval)
+		wait = max(0, min(wakeups + [end]) - time.time())
+
+		if not flying:
+			time.sleep(wait)
+			continue
+		writable = select.select([], [t.socket for t in flying], [], wait)[1]
+
+		now = time.time()
+		for target in flying:
+			if target.socket in writable:
+				target.done(target.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0, now)
+			elif now >= target.started + timeout:
+				target.done(False, now)
+
+	for target in targets:
+		if target.socket is not None:
+			target.socket.close()
+
+	return set(hosts) - pending, pending
+
+def readinessReport(ids, options = None, ec2client = None):
+	''' Probe freshly started instances and print the outcome,
+		used by the sync paths of the launch and start functions
+
+		@type ids:			[string,...,string]
+		@param ids:			ids of the running instances
+		@type options:		dict
+		@param options:		keyword arguments of readinessWait, ex. {'ports': [22, 80], 'deadline': 300}
+		@type ec2client:	EC2.Client
+		@param ec2client:	client to use, a new one if None
+		@rtype:    (set, set)
+		@return:   ids of the ready instances, ids of the instances not ready
+	'''
+	ec2client   = ec2client or boto3.client('ec2')
+	ready, late = readinessWait(readinessHosts(ids, ec2client=ec2client), ec2client=ec2client, **(options or {}))
+
+	print "Ready instances: ", len(ready)
+	for my_id in sorted(late):
+		print "Instance not ready: ", my_id
+
+	return ready, late
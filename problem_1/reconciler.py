@@ -0,0 +1,336 @@
+import json
+from multiprocessing.pool import ThreadPool
+
+import boto3
+from botocore.exceptions import ClientError
+
+from problem_1.catalog import catalogCheck
+from problem_1.images import imagesResolve
+
+''' Notes:
+	-	A spec describes groups of instances, every group has an ami, an instance type,
+		a count and the volumes that must be attached to each of its instances:
+
+		{"groups": [{"name": "hvm", "ami": "ami-969c2deb", "type": "t2.micro", "count": 3,
+		             "volumes": [{"device": "/dev/sdh", "type": "gp2", "size": 8}]}]}
+
+	-	Instances belong to a group through the GROUP_TAG tag, which is set at launch
+	-	The ami of an instance cannot change: instances with a stale ami are replaced.
+		A group ami can be an image of problem_1.images, ex. "amazon-linux-2".
+		IMAGE_TAG records at launch the image of the spec: instances running another ami are
+		replaced when the spec names another image, not when a newer ami of the same image
+		is released, unless -replace- asks for it. Untagged instances running another ami are always replaced
+	-	Volumes not mentioned in the spec are never detached nor deleted
+	-	EBS volumes can only grow: a spec smaller than the actual size is reported, never applied
+	-	Pending instances cannot be stopped: their type change is reported and left to a later pass
+	-	DryRun probes are not issued, the plan mode replaces them
+'''
+
+GROUP_TAG   = 'awsedu:group'
+IMAGE_TAG   = 'awsedu:image'
+ALIVE       = ['pending', 'running', 'stopping', 'stopped']
+
+# EC2 limits: values per filter and ids per batched state change call
+MAX_FILTER  = 200
+MAX_IDS     = 1000
+MAX_WORKERS = 16
+
+def _chunks(items, size):
+	return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _parallel(function, items):
+	# run -function- on every item, at most MAX_WORKERS calls in flight
+	if not items:
+		return []
+	pool = ThreadPool(min(MAX_WORKERS, len(items)))
+	try:
+		return pool.map(function, items)
+	finally:
+		pool.close()
+
+def _image(ami):
+	# the value of IMAGE_TAG: the image as the spec names it, queries in a stable form
+	return ami if isinstance(ami, basestring) else json.dumps(ami, sort_keys=True, separators=(',', ':'))
+
+def reconcileLoadSpec(path):
+	''' Load a spec from a json file and fill in the defaults
+
+		@type path:		string
+		@param path:	path of the json spec
+		@rtype:    dict
+		@return:   normalized spec
+	'''
+	with open(path) as f:
+		return reconcileNormalizeSpec(json.load(f))
+
+def reconcileNormalizeSpec(spec):
+	''' Fill in the defaults of a spec: t2.micro instances,
+		count 1 and gp2 volumes
+
+		@type spec:		dict
+		@param spec:	spec as described in the module notes
+		@rtype:    dict
+		@return:   normalized spec
+	'''
+	groups = []
+
+	for group in spec['groups']:
+		groups.append({
+			'name':    group['name'],
+			'ami':     group['ami'],
+			'image':   _image(group['ami']),
+			'type':    group.get('type', 't2.micro'),
+			'count':   int(group.get('count', 1)),
+			'volumes': [{
+				'device': volume['device'],
+				'type':   volume.get('type', 'gp2'),
+				'size':   int(volume['size'])} for volume in group.get('volumes', [])]
+		})
+
+	return {'groups': groups}
+
+def ec2ClientSnapshot(names, ec2client = None):
+	''' Take one snapshot of the actual state of the groups
+		using paginated describe_instances and describe_volumes calls
+
+		@type names:		[string,...,string]
+		@param names:		names of the groups
+		@type ec2client:	EC2.Client
+		@param ec2client:	client to use, a new one if None
+		@rtype:    dict
+		@return:   {instance id: {'group', 'image', 'ami', 'type', 'state', 'zone', 'launch', 'volumes'}}
+	'''
+	ec2client = ec2client or boto3.client('ec2')
+	filters   = [{'Name': 'tag:' + GROUP_TAG, 'Values': names},
+				 {'Name': 'instance-state-name', 'Values': ALIVE}]
+	snapshot  = {}
+
+	try:
+		for page in ec2client.get_paginator('describe_instances').paginate(Filters=filters):
+			for reservation in page['Reservations']:
+				for instance in reservation['Instances']:
+					tags = dict((t['Key'], t['Value']) for t in instance.get('Tags', []))
+					snapshot[instance['InstanceId']] = {
+						'group':   tags[GROUP_TAG],
+						'image':   tags.get(IMAGE_TAG),
+						'ami':     instance['ImageId'],
+						'type':    instance['InstanceType'],
+						'state':   instance['State']['Name'],
+						'zone':    instance['Placement']['AvailabilityZone'],
+						'launch':  instance['LaunchTime'],
+						'volumes': {}}
+
+		# a single describe_volumes covers up to MAX_FILTER instances
+		for ids in _chunks(sorted(snapshot), MAX_FILTER):
+			filters = [{'Name': 'attachment.instance-id', 'Values': ids}]
+			for page in ec2client.get_paginator('describe_volumes').paginate(Filters=filters):
+				for volume in page['Volumes']:
+					for attachment in volume['Attachments']:
+						if attachment['InstanceId'] in snapshot:
+							snapshot[attachment['InstanceId']]['volumes'][attachment['Device']] = {
+								'id':   volume['VolumeId'],
+								'type': volume['VolumeType'],
+								'size': volume['Size']}
+	except ClientError as e:
+		raise e
+
+	return snapshot
+
+def _stale(instance, group, replace):
+	if instance['ami'] == group['ami']:
+		return False
+	# a newer ami of the image launched from only replaces instances on request
+	return replace or instance.get('image') != group['image']
+
+def reconcileDiff(spec, snapshot, replace = False):
+	''' Compute the minimal set of changes that brings
+		the actual state -snapshot- to the desired state -spec-
+
+		@type spec:			dict
+		@param spec:		normalized spec, with resolved amis
+		@type snapshot:		dict
+		@param snapshot:	actual state, as returned by ec2ClientSnapshot
+		@type replace:		boolean
+		@param replace:		replace the instances of an image by its newer ami
+		@rtype:    dict
+		@return:   plan: ids and requests grouped by kind of operation
+	'''
+	plan = {'terminate': [], 'stop': [], 'modify': [], 'start': [],
+			'launch': [], 'create': [], 'grow': [], 'skipped': []}
+
+	for group in spec['groups']:
+		members = [dict(instance, id=my_id) for my_id, instance in snapshot.items()
+					if instance['group'] == group['name']]
+
+		# instances with a stale ami cannot be fixed, only replaced
+		stale = [i for i in members if _stale(i, group, replace)]
+		good  = [i for i in members if not _stale(i, group, replace)]
+
+		# keep the instances closest to the spec and the oldest ones,
+		# terminate the most recently launched extras
+		good.sort(key=lambda i: (i['type'] != group['type'], i['state'] != 'running', i['launch']))
+		kept = good[:group['count']]
+
+		plan['terminate'] += [i['id'] for i in stale + good[group['count']:]]
+
+		if len(kept) < group['count']:
+			plan['launch'].append({'group': group, 'count': group['count'] - len(kept)})
+
+		for instance in kept:
+			# the type of an instance can only change while it is stopped,
+			# and a pending instance cannot be stopped yet
+			if instance['type'] != group['type'] and instance['state'] == 'pending':
+				plan['skipped'].append('%s: pending, its type changes to %s on a later pass' %
+					(instance['id'], group['type']))
+			elif instance['type'] != group['type']:
+				if instance['state'] != 'stopped':
+					plan['stop'].append(instance['id'])
+				plan['modify'].append((instance['id'], group['type']))
+				plan['start'].append(instance['id'])
+			elif instance['state'] in ('stopping', 'stopped'):
+				if instance['state'] == 'stopping':
+					plan['stop'].append(instance['id'])
+				plan['start'].append(instance['id'])
+
+			for volume in group['volumes']:
+				actual = instance['volumes'].get(volume['device'])
+
+				if actual is None:
+					plan['create'].append((instance['id'], instance['zone'], volume))
+				elif actual['size'] > volume['size']:
+					plan['skipped'].append('%s: %s is %d GB, volumes cannot shrink to %d GB' %
+						(instance['id'], volume['device'], actual['size'], volume['size']))
+				elif actual['size'] != volume['size'] or actual['type'] != volume['type']:
+					plan['grow'].append((actual['id'], volume))
+
+	return plan
+
+def reconcileCountCalls(plan):
+	''' Count the API calls needed to apply -plan-,
+		waiter polls excluded
+
+		@type plan:		dict
+		@param plan:	plan returned by reconcileDiff
+		@rtype:    integer
+		@return:   number of API calls
+	'''
+	calls  = len(_chunks(plan['terminate'], MAX_IDS))
+	calls += len(_chunks(plan['stop'], MAX_IDS))
+	calls += len(_chunks(plan['start'], MAX_IDS))
+
+	# modify_instance_attribute, create_volume, attach_volume
+	# and modify_volume only accept one resource per call
+	calls += len(plan['modify'])
+	calls += len(plan['launch'])
+	calls += 2 * len(plan['create'])
+	calls += len(plan['grow'])
+
+	return calls
+
+def _launch(ec2client, launch):
+	group = launch['group']
+	tags  = [{'ResourceType': 'instance', 'Tags': [{'Key': GROUP_TAG, 'Value': group['name']},
+												 {'Key': IMAGE_TAG, 'Value': group['image']}]},
+			 {'ResourceType': 'volume',   'Tags': [{'Key': GROUP_TAG, 'Value': group['name']}]}]
+
+	# volumes of new instances are created by the launch call itself
+	mappings = [{
+		'DeviceName': volume['device'],
+		'Ebs': {'VolumeSize': volume['size'], 'VolumeType': volume['type'], 'DeleteOnTermination': True}}
+		for volume in group['volumes']]
+
+	response = ec2client.run_instances(
+		MinCount = launch['count'],
+		MaxCount = launch['count'],
+		ImageId = group['ami'],
+		InstanceType = group['type'],
+		BlockDeviceMappings = mappings,
+		TagSpecifications = tags)
+
+	return [x.get('InstanceId') for x in response['Instances']]
+
+def ec2ClientReconcile(spec, plan = False, sync = True, replace = False):
+	''' Bring the instance groups described in -spec- to their desired state
+		using low-level client interface, with batched and parallel calls
+
+		@type spec:		dict
+		@param spec:	spec as described in the module notes
+		@type plan:		boolean
+		@param plan: 	only compute and report the changes, nothing is applied
+		@type sync:		boolean
+		@param sync: 	wait for the operation to take effect
+		@type replace:	boolean
+		@param replace:	replace the instances of a group image, ex. an alias, by its newer ami
+		@rtype:    dict
+		@return:   the plan, with the number of API calls in 'calls'
+	'''
+	ec2client = boto3.client('ec2')
+	spec      = reconcileNormalizeSpec(spec)
+	for group in spec['groups']:
+		group['ami'] = imagesResolve(group['ami'])
+		catalogCheck(group['type'], group['ami'])
+
+	changes = reconcileDiff(spec, ec2ClientSnapshot([g['name'] for g in spec['groups']], ec2client), replace)
+	changes['calls'] = reconcileCountCalls(changes)
+
+	print "Terminate: ", len(changes['terminate'])
+	print "Launch: ",    sum(launch['count'] for launch in changes['launch'])
+	print "Stop: ",      len(changes['stop'])
+	print "Modify: ",    len(changes['modify'])
+	print "Start: ",     len(changes['start'])
+	print "Create volumes: ", len(changes['create'])
+	print "Grow volumes: ",   len(changes['grow'])
+	print "API calls: ", changes['calls']
+	for message in changes['skipped']:
+		print "Skipped: ", message
+
+	if plan:
+		return changes
+
+	try:
+		# fire the calls nobody has to wait for first,
+		# so that their latency overlaps with the stop waiter
+		for ids in _chunks(changes['terminate'], MAX_IDS):
+			ec2client.terminate_instances(InstanceIds=ids)
+
+		launched = sum(_parallel(lambda launch: _launch(ec2client, launch), changes['launch']), [])
+
+		volumes = _parallel(lambda (my_id, zone, volume): ec2client.create_volume(
+			AvailabilityZone=zone,
+			VolumeType=volume['type'],
+			Size=volume['size'])['VolumeId'], changes['create'])
+
+		_parallel(lambda (volumeid, volume): ec2client.modify_volume(
+			VolumeId=volumeid,
+			VolumeType=volume['type'],
+			Size=volume['size']), changes['grow'])
+
+		if changes['stop']:
+			for ids in _chunks(changes['stop'], MAX_IDS):
+				ec2client.stop_instances(InstanceIds=ids)
+			# a single waiter polls the state of every instance at once
+			print "waiting for the instances to be in stopped state"
+			ec2client.get_waiter('instance_stopped').wait(InstanceIds=changes['stop'])
+
+		_parallel(lambda (my_id, new_type): ec2client.modify_instance_attribute(
+			InstanceId=my_id,
+			InstanceType={'Value': new_type}), changes['modify'])
+
+		for ids in _chunks(changes['start'], MAX_IDS):
+			ec2client.start_instances(InstanceIds=ids)
+
+		if volumes:
+			print "waiting for the volumes to be in available state"
+			ec2client.get_waiter('volume_available').wait(VolumeIds=volumes)
+			_parallel(lambda ((my_id, zone, volume), volumeid): ec2client.attach_volume(
+				Device=volume['device'],
+				InstanceId=my_id,
+				VolumeId=volumeid), zip(changes['create'], volumes))
+
+		if sync and (launched or changes['start']):
+			print "waiting for the instances to be in running state"
+			ec2client.get_waiter('instance_running').wait(InstanceIds=launched + changes['start'])
+	except ClientError as e:
+		raise e
+
+	return changes
@@ -1,5 +1,7 @@
 import boto3
 from botocore.exceptions import ClientError
+
+from awsedu.projection import projectionRecord, projectionStream
 ''' Notes: 
 	-	If you detach a volume from a running instance, you must first unmount it
 	-	if a volume is the root device of an instance, you must first stop the instance instead
@@ -285,20 +287,26 @@ def ec2ResourceListAttacchedVolumes(ids):
 
 	return volumes
 
-def ec2ClientListAttacchedVolumes(ids):
+def ec2ClientListAttacchedVolumes(ids, fields = None):
 	''' List all volumes attacched to input instances
 		using the low-level resource interface.
 
 		@type ids:     		[string,...,string]
 		@param ids:    		ids of the instances
+		@type fields:		[string,...,string]
+		@param fields:		dotted paths read from every volume, ex. ['VolumeId', 'Attachments.0.InstanceId'],
+							the whole response is kept if None
 		@rtype:    dict
-		@return:   response metadata
+		@return:   response metadata, the projected volumes if -fields-
 	'''
 	ec2client = boto3.client('ec2')
 
 	try:
 		filters  = [{'Name':'status', 'Values':['in-use']},
 					{'Name':'attachment.instance-id', 'Values':ids}]
+		if fields:
+			return list(projectionStream(ec2client, 'describe_volumes', projectionRecord('Volume', fields),
+				Filters=filters, PaginationConfig={'PageSize': 500}))
 		response  = ec2client.describe_volumes(Filters=filters)
 	except ClientError as e:
 		raise e
@@ -0,0 +1,333 @@
+import datetime
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import boto3
+from botocore.exceptions import ClientError
+
+import problem_2.problem2 as p2
+
+''' Notes:
+	-	Calls are issued concurrently, at most -rate- per second: snapshot calls have
+		their own, lower, request limits and throttled calls only slow the batch down
+	-	A single DryRun probe checks the permissions of a whole batch
+	-	One describe_snapshots call per round tracks the completion of every pending snapshot
+	-	Snapshots taken here are tagged with BACKUP_TAG, pruning only ever considers tagged snapshots.
+		VOLUME_TAG keeps the id of their volume
+	-	Copies are issued by the destination region, from the source region,
+		and carry the BACKUP_TAG and VOLUME_TAG of their source: they are pruned in the destination
+		region. Their VolumeId is a placeholder, vol-ffffffff, they are grouped by VOLUME_TAG
+	-	A failed call does not stop the batch: the other calls go on, created snapshots are
+		still awaited, then SnapshotError reports the failures along with what was done
+'''
+
+BACKUP_TAG  = 'awsedu:backup'
+VOLUME_TAG  = 'awsedu:volume'
+
+# ids per describe_snapshots call and per filter
+MAX_IDS     = 200
+MAX_WORKERS = 16
+
+class SnapshotError(RuntimeError):
+	''' Raised when some calls of a batch failed,
+		-done- holds the results of the others, None for the failed items,
+		-errors- maps the failed items to their exception
+	'''
+
+	def __init__(self, message, done, errors):
+		RuntimeError.__init__(self, message)
+		self.done   = done
+		self.errors = errors
+
+class RateLimiter(object):
+	''' Token bucket: at most -rate- acquisitions per second, shared by threads '''
+
+	def __init__(self, rate):
+		self.rate  = float(rate)
+		self.lock  = threading.Lock()
+		self.next  = time.time()
+
+	def acquire(self):
+		with self.lock:
+			now       = time.time()
+			slot      = max(now, self.next)
+			self.next = slot + 1.0 / self.rate
+		time.sleep(max(0, slot - now))
+
+def _parallel(function, items, rate):
+	# every item is tried: returns the results, None for the failed items, and {item: exception}
+	if not items:
+		return [], {}
+	limiter = RateLimiter(rate)
+	pool    = ThreadPool(min(MAX_WORKERS, len(items)))
+
+	def limited(item):
+		limiter.acquire()
+		try:
+			return function(item), None
+		except ClientError as e:
+			return None, e
+
+	try:
+		outcomes = pool.map(limited, items)
+	finally:
+		pool.close()
+
+	errors = dict((item, error) for item, (result, error) in zip(items, outcomes) if error is not None)
+	return [result for result, error in outcomes], errors
+
+def _raiseErrors(action, done, errors):
+	if errors:
+		codes = ', '.join('%s: %s' % (item, e.response['Error']['Code']) for item, e in sorted(errors.items()))
+		raise SnapshotError('%d calls to %s failed, %s' % (len(errors), action, codes), done, errors)
+
+def _dryRun(call, **kwargs):
+	# Dry-runs always return an error response:
+	# 'DryrunOperation': OK 'UnauthorizedOperation': NO
+	try:
+		call(DryRun=True, **kwargs)
+	except ClientError as e:
+		if 'DryRunOperation' not in str(e):
+			raise
+
+def ec2ClientWaitSnapshots(snapshotids, interval = 15, region = None):
+	''' Wait for snapshots to be completed
+		using batched describe_snapshots calls
+
+		@type snapshotids:	[string,...,string]
+		@param snapshotids:	ids of the snapshots
+		@type interval:		integer
+		@param interval:	seconds between two polls
+		@rtype:    [dict,...,dict]
+		@return:   the completed snapshots
+	'''
+	ec2client = boto3.client('ec2', region_name=region)
+	pending   = list(snapshotids)
+	completed = []
+
+	while pending:
+		remaining = []
+		for start in range(0, len(pending), MAX_IDS):
+			try:
+				response = ec2client.describe_snapshots(SnapshotIds=pending[start:start + MAX_IDS])
+			except ClientError as e:
+				raise e
+
+			for snapshot in response['Snapshots']:
+				if snapshot['State'] == 'completed':
+					completed.append(snapshot)
+				elif snapshot['State'] == 'error':
+					raise RuntimeError('snapshot %s failed: %s' % (snapshot['SnapshotId'], snapshot.get('StateMessage', '')))
+				else:
+					remaining.append(snapshot['SnapshotId'])
+
+		pending = remaining
+		if pending:
+			print "waiting for %d snapshots to be completed" % len(pending)
+			time.sleep(interval)
+
+	return completed
+
+def ec2ClientCreateSnapshots(volumeids, name, rate = 5, sync = True):
+	''' Snapshot a set of volumes concurrently
+		using low-level client interface,
+		SnapshotError reports the failed calls once the others are done
+
+		@type volumeids:	[string,...,string]
+		@param volumeids:	ids of the volumes
+		@type name:			string
+		@param name:		name of the backup, value of the BACKUP_TAG tag
+		@type rate:			integer
+		@param rate:		maximum number of calls per second
+		@type sync:			boolean
+		@param sync: 		wait for the snapshots to be completed
+		@rtype:    [string,...,string]
+		@return:   ids of the snapshots, in the order of -volumeids-
+	'''
+	ec2client = boto3.client('ec2')
+
+	def tags(volumeid):
+		return [{'ResourceType': 'snapshot', 'Tags': [{'Key': BACKUP_TAG, 'Value': name}, {'Key': VOLUME_TAG, 'Value': volumeid}]}]
+
+	if not volumeids:
+		return []
+
+	_dryRun(ec2client.create_snapshot, VolumeId=volumeids[0], TagSpecifications=tags(volumeids[0]))
+
+	snapshotids, errors = _parallel(lambda volumeid: ec2client.create_snapshot(
+		VolumeId=volumeid,
+		Description='%s backup of %s' % (name, volumeid),
+		TagSpecifications=tags(volumeid))['SnapshotId'], volumeids, rate)
+
+	if sync:
+		ec2ClientWaitSnapshots([snapshotid for snapshotid in snapshotids if snapshotid])
+
+	_raiseErrors('create_snapshot', snapshotids, errors)
+	return snapshotids
+
+def ec2ClientSnapshotInstances(ids, name, rate = 5, sync = True):
+	''' Snapshot every volume attached to the input instances
+
+		@type ids:		[string,...,string]
+		@param ids:		ids of the instances
+		@type name:		string
+		@param name:	name of the backup, value of the BACKUP_TAG tag
+		@type rate:		integer
+		@param rate:	maximum number of calls per second
+		@type sync:		boolean
+		@param sync: 	wait for the snapshots to be completed
+		@rtype:    [string,...,string]
+		@return:   ids of the snapshots
+	'''
+	volumeids = []
+
+	# a filter takes at most MAX_IDS values
+	for start in range(0, len(ids), MAX_IDS):
+		volumes    = p2.ec2ClientListAttacchedVolumes(ids[start:start + MAX_IDS], fields=['VolumeId'])
+		volumeids += [volume.VolumeId for volume in volumes]
+
+	return ec2ClientCreateSnapshots(volumeids, name, rate, sync)
+
+def _volume(snapshot):
+	# copies have a placeholder VolumeId, the tag keeps the real one
+	tags = dict((tag['Key'], tag['Value']) for tag in snapshot.get('Tags', []))
+	return tags.get(VOLUME_TAG, snapshot['VolumeId'])
+
+def _backupTags(snapshotids, region):
+	# {snapshot id: {BACKUP_TAG, VOLUME_TAG}} of snapshots of -region-
+	ec2client = boto3.client('ec2', region_name=region)
+	backups   = {}
+	for start in range(0, len(snapshotids), MAX_IDS):
+		try:
+			response = ec2client.describe_snapshots(SnapshotIds=snapshotids[start:start + MAX_IDS])
+		except ClientError as e:
+			raise e
+		for snapshot in response['Snapshots']:
+			tags = dict((tag['Key'], tag['Value']) for tag in snapshot.get('Tags', []))
+			backup = {VOLUME_TAG: _volume(snapshot)}
+			if BACKUP_TAG in tags:
+				backup[BACKUP_TAG] = tags[BACKUP_TAG]
+			backups[snapshot['SnapshotId']] = backup
+	return backups
+
+def ec2ClientCopySnapshots(snapshotids, source, destination, rate = 5, sync = True, name = None):
+	''' Copy snapshots to another region concurrently,
+		SnapshotError reports the failed calls once the others are done
+
+		@type snapshotids:	[string,...,string]
+		@param snapshotids:	ids of the snapshots in the -source- region
+		@type source:		string
+		@param source:		region of the snapshots
+		@type destination:	string
+		@param destination:	region of the copies
+		@type rate:			integer
+		@param rate:		maximum number of calls per second
+		@type sync:			boolean
+		@param sync: 		wait for the copies to be completed
+		@type name:			string
+		@param name:		value of the BACKUP_TAG tag of the copies, the one of their source if None
+		@rtype:    [string,...,string]
+		@return:   ids of the copies, in the order of -snapshotids-
+	'''
+	ec2client = boto3.client('ec2', region_name=destination)
+
+	if not snapshotids:
+		return []
+
+	backups = _backupTags(snapshotids, source)
+	if name:
+		for backup in backups.values():
+			backup[BACKUP_TAG] = name
+
+	def tags(snapshotid):
+		if snapshotid not in backups:
+			return []
+		return [{'ResourceType': 'snapshot', 'Tags': [{'Key': key, 'Value': value}
+			for key, value in sorted(backups[snapshotid].items())]}]
+
+	_dryRun(ec2client.copy_snapshot, SourceRegion=source, SourceSnapshotId=snapshotids[0], TagSpecifications=tags(snapshotids[0]))
+
+	copyids, errors = _parallel(lambda snapshotid: ec2client.copy_snapshot(
+		SourceRegion=source,
+		SourceSnapshotId=snapshotid,
+		Description='copy of %s from %s' % (snapshotid, source),
+		TagSpecifications=tags(snapshotid))['SnapshotId'], snapshotids, rate)
+
+	if sync:
+		ec2ClientWaitSnapshots([copyid for copyid in copyids if copyid], region=destination)
+
+	_raiseErrors('copy_snapshot', copyids, errors)
+	return copyids
+
+def ec2ClientDeleteSnapshots(snapshotids, rate = 5, region = None):
+	''' Delete snapshots concurrently,
+		SnapshotError reports the failed calls once the others are done
+
+		@type snapshotids:	[string,...,string]
+		@param snapshotids:	ids of the snapshots
+		@type rate:			integer
+		@param rate:		maximum number of calls per second
+		@type region:		string
+		@param region:		region of the snapshots, the default one if None
+		@rtype:    None
+		@return:   None
+	'''
+	ec2client = boto3.client('ec2', region_name=region)
+
+	if not snapshotids:
+		return None
+
+	_dryRun(ec2client.delete_snapshot, SnapshotId=snapshotids[0])
+
+	errors = _parallel(lambda snapshotid: ec2client.delete_snapshot(SnapshotId=snapshotid), snapshotids, rate)[1]
+	_raiseErrors('delete_snapshot', [snapshotid for snapshotid in snapshotids if snapshotid not in errors], errors)
+
+	return None
+
+def ec2ClientPruneSnapshots(name, keep = 7, days = None, rate = 5, plan = False, region = None):
+	''' Apply the retention policy of a backup: for every volume keep the
+		-keep- most recent snapshots and those younger than -days- days
+
+		@type name:		string
+		@param name:	name of the backup, value of the BACKUP_TAG tag
+		@type keep:		integer
+		@param keep:	snapshots kept for every volume
+		@type days:		integer
+		@param days:	snapshots younger than this are always kept
+		@type rate:		integer
+		@param rate:	maximum number of calls per second
+		@type plan:		boolean
+		@param plan:	only list the snapshots to delete
+		@type region:	string
+		@param region:	region of the backup, ex. the destination of its copies, the default one if None
+		@rtype:    [string,...,string]
+		@return:   ids of the deleted snapshots
+	'''
+	ec2client = boto3.client('ec2', region_name=region)
+	filters   = [{'Name': 'tag:' + BACKUP_TAG, 'Values': [name]}]
+	byvolume  = {}
+
+	try:
+		paginator = ec2client.get_paginator('describe_snapshots')
+		for page in paginator.paginate(OwnerIds=['self'], Filters=filters, PaginationConfig={'PageSize': 1000}):
+			for snapshot in page['Snapshots']:
+				byvolume.setdefault(_volume(snapshot), []).append(snapshot)
+	except ClientError as e:
+		raise e
+
+	expired = []
+	for volumeid, snapshots in byvolume.items():
+		snapshots.sort(key=lambda snapshot: snapshot['StartTime'], reverse=True)
+		for snapshot in snapshots[keep:]:
+			age = datetime.datetime.now(snapshot['StartTime'].tzinfo) - snapshot['StartTime']
+			if days is None or age.days >= days:
+				expired.append(snapshot['SnapshotId'])
+
+	print "Snapshots: ", sum(len(snapshots) for snapshots in byvolume.values())
+	print "Expired: ", len(expired)
+
+	if not plan:
+		ec2ClientDeleteSnapshots(expired, rate, region)
+
+	return expired
@@ -39,7 +39,7 @@ def iamAddUserToGroup(groupname, username):
     except ClientError as e:
         raise e
 
-def iamDeleteUser():
+def iamDeleteUser(username):
     
     iam = boto3.resource('iam')
 
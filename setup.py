@@ -0,0 +1,12 @@
+from setuptools import setup
+
+setup(
+    name='awseducate',
+    version='0.1.0',
+    description='AWS Exercises',
+    packages=['awsedu', 'problem_1', 'problem_2', 'problem_3'],
+    install_requires=['boto3'],
+    entry_points={
+        'console_scripts': ['awsedu = awsedu.cli:main'],
+    },
+)
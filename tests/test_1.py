@@ -18,8 +18,9 @@ import problem_1.problem1 as p1
 '''
 
 # 1
-hvm = p1.ec2ResourceLaunch(3,3,'ami-969c2deb') #a
-dl  = p1.ec2ResourceLaunch(2,2,'ami-3c8a3b41') #b
+# images are resolved in the default region, ids would be region specific
+hvm = p1.ec2ResourceLaunch(3,3,'amazon-linux') #a
+dl  = p1.ec2ResourceLaunch(2,2,'deep-learning') #b
 
 # 2 client-like invocation
 p1.ec2ResourceStop([i.id for i in dl])
@@ -0,0 +1,38 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import awsedu.batch as batch
+
+'''
+The volumes of tests/test_2.py as a batch:
+    -   v1, v2 and the listing of the running instances overlap
+    -   each attach waits for its volume and for the listing only
+    -   the detach of v1 follows its attach, the delete follows the detach:
+        they all name ${v1.VolumeId}, no explicit order is needed
+'''
+
+jobs = [
+    {'id': 'v1', 'call': 'problem_2.ec2ClientCreateVolume',
+     'args': {'zone': 'eu-west-3c', 'volumetype': 'standard', 'size': 1024}},
+    {'id': 'v2', 'call': 'problem_2.ec2ClientCreateVolume',
+     'args': {'zone': 'eu-west-3c', 'volumetype': 'gp2', 'size': 512}},
+    {'id': 'running', 'call': 'problem_1.ec2ClientListInstanceByStatus', 'args': {'status': 'running'}},
+    {'id': 'attach-v1', 'call': 'problem_2.ec2ClientAttachVolume',
+     'args': {'devicename': '/dev/sdh', 'volumeid': '${v1.VolumeId}',
+              'instanceid': '${running.Reservations.0.Instances.0.InstanceId}'}},
+    {'id': 'attach-v2', 'call': 'problem_2.ec2ClientAttachVolume',
+     'args': {'devicename': '/dev/sdh', 'volumeid': '${v2.VolumeId}',
+              'instanceid': '${running.Reservations.0.Instances.1.InstanceId}'}},
+    {'id': 'detach-v1', 'call': 'problem_2.ec2ClientDetachVolume',
+     'args': {'volumeid': '${v1.VolumeId}'}},
+    {'id': 'delete-v1', 'call': 'problem_2.ec2ClientDeleteVolume',
+     'args': {'volumeid': '${v1.VolumeId}'}}
+]
+
+graph = batch.batchGraph(jobs)
+print graph
+print graph['detach-v1'] >= set(['attach-v1']), graph['delete-v1'] >= set(['detach-v1']), 'attach-v1' not in graph['attach-v2']
+
+report = batch.batchRun(jobs)
+batch.batchReport(report)
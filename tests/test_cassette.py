@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+
+import awsedu.cassette as cassette
+
+'''
+Record and replay, offline, against a local stand-in of the EC2 endpoint:
+    -   StopInstances answers after 0.3 s, the instance is stopped 1 s later
+    -   the recording polls describe_instances every 0.2 s until it is stopped
+    -   the replay at half scale polls every 0.05 s: it sees 'stopping'
+        until the virtual clock reaches the recorded stop, then 'stopped'
+    -   writes never recorded, or recorded with other parameters, fail
+'''
+
+STOPPED = []
+
+DESCRIBE = '''<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<reservationSet><item><instancesSet><item><instanceId>i-1</instanceId>
+<instanceState><code>%d</code><name>%s</name></instanceState></item></instancesSet></item></reservationSet>
+</DescribeInstancesResponse>'''
+
+STOP = '''<StopInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<instancesSet><item><instanceId>i-1</instanceId><currentState><code>64</code><name>stopping</name></currentState>
+</item></instancesSet></StopInstancesResponse>'''
+
+class Ec2(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        action = urlparse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])))['Action'][0]
+        if action == 'StopInstances':
+            time.sleep(0.3)
+            STOPPED.append(time.time() + 1)
+            body = STOP
+        else:
+            time.sleep(0.05)
+            body = DESCRIBE % ((80, 'stopped') if STOPPED and time.time() > STOPPED[0] else (64, 'stopping'))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def stopAndPoll(ec2client, interval):
+    states  = []
+    started = time.time()
+    ec2client.stop_instances(InstanceIds=['i-1'])
+    while not states or states[-1] != 'stopped':
+        time.sleep(interval)
+        states.append(ec2client.describe_instances(InstanceIds=['i-1'])['Reservations'][0]['Instances'][0]['State']['Name'])
+    return states, time.time() - started
+
+server = HTTPServer(('127.0.0.1', 0), Ec2)
+threading.Thread(target=server.serve_forever).start()
+path = os.path.join(tempfile.mkdtemp(), 'stop.json')
+
+# 1 record against the local endpoint
+session = boto3.Session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+cassette.cassetteRecord(path, session)
+states, elapsed = stopAndPoll(session.client('ec2', endpoint_url='http://127.0.0.1:%d' % server.server_port), 0.2)
+cassette.cassetteStop()
+server.shutdown()
+print "recorded: %d polls, %.2f s" % (len(states), elapsed)
+
+# 2 replay without endpoint nor credentials, twice as fast
+session = boto3.Session(region_name='eu-west-3')
+cassette.cassetteReplay(path, scale=0.5, session=session)
+states, elapsed = stopAndPoll(session.client('ec2'), 0.05)
+cassette.cassetteStop()
+print "replayed: %d polls, %.2f s" % (len(states), elapsed)
+print states[0] == 'stopping', states[-1] == 'stopped', 0.5 < elapsed < 1.0
+
+# 3 a write that was never recorded
+cassette.cassetteReplay(path, session=session)
+try:
+    session.client('ec2').start_instances(InstanceIds=['i-1'])
+except cassette.CassetteError as e:
+    print e
+cassette.cassetteStop()
+
+# 4 a recorded write, on another instance
+cassette.cassetteReplay(path, session=session)
+try:
+    session.client('ec2').stop_instances(InstanceIds=['i-2'])
+except cassette.CassetteError as e:
+    print e
+cassette.cassetteStop()
@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# a fresh cache directory: the catalog is loaded by this test
+os.environ['AWSEDU_CACHE'] = tempfile.mkdtemp()
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.stub import Stubber
+
+import problem_1.catalog as catalog
+
+'''
+catalogCheck against stubbed responses, offline:
+    -   t3.micro is missing from the cached catalog: it is reloaded once, then found
+    -   a type still missing after the reload is unknown
+    -   an arm64 ami does not run on t3.micro
+    -   an ami that cannot be described is not checked
+    -   another account has its own catalog: the same zone names are other zones
+'''
+
+IDENTITY = '''<GetCallerIdentityResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/"><GetCallerIdentityResult>
+<Arn>arn:aws:iam::%s:user/test</Arn><UserId>TEST</UserId><Account>%s</Account></GetCallerIdentityResult>
+</GetCallerIdentityResponse>'''
+ACCOUNTS = {'x': '111111111111', 'y': '222222222222'}
+
+class Raw(object):
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+def identity(request, **kwargs):
+    # STS answers the account of the access key, without leaving the process
+    account = ACCOUNTS[request.headers['Authorization'].split('Credential=')[1].split('/')[0]]
+    return AWSResponse(request.url, 200, {}, Raw(IDENTITY % (account, account)))
+
+def types(*names):
+    return {'InstanceTypes': [{'InstanceType': name, 'SupportedVirtualizationTypes': ['hvm'],
+        'ProcessorInfo': {'SupportedArchitectures': ['x86_64']}} for name in names]}
+
+def offerings(*names):
+    return {'InstanceTypeOfferings': [{'InstanceType': name, 'LocationType': 'availability-zone',
+        'Location': 'eu-west-3a'} for name in names]}
+
+def image(ami, arch):
+    return {'Images': [{'ImageId': ami, 'Architecture': arch, 'VirtualizationType': 'hvm'}]}
+
+boto3.setup_default_session(region_name='eu-west-3')
+boto3._get_default_session().events.register('before-send.sts', identity)
+
+session   = boto3.Session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+ec2client = session.client('ec2')
+stubber   = Stubber(ec2client)
+
+# the cached catalog predates t3.micro, the reload knows it
+stubber.add_response('describe_instance_types', types('t2.micro'))
+stubber.add_response('describe_instance_type_offerings', offerings('t2.micro'))
+stubber.add_response('describe_instance_types', types('t2.micro', 't3.micro'))
+stubber.add_response('describe_instance_type_offerings', offerings('t2.micro', 't3.micro'))
+stubber.add_response('describe_images', image('ami-1', 'x86_64'), {'ImageIds': ['ami-1']})
+# t3.nano is unknown even to the reload
+stubber.add_response('describe_instance_types', types('t2.micro', 't3.micro'))
+stubber.add_response('describe_instance_type_offerings', offerings('t2.micro', 't3.micro'))
+stubber.add_response('describe_images', image('ami-2', 'arm64'), {'ImageIds': ['ami-2']})
+stubber.add_response('describe_images', {'Images': []}, {'ImageIds': ['ami-3']})
+
+with stubber:
+    # 1 reload on a miss
+    print catalog.catalogCheck('t3.micro', 'ami-1', 'eu-west-3a', ec2client=ec2client) is None
+
+    # 2 unknown
+    try:
+        catalog.catalogCheck('t3.nano', ec2client=ec2client)
+    except catalog.CatalogError as e:
+        print e
+
+    # 3 architecture, from the cached catalog
+    try:
+        catalog.catalogCheck('t3.micro', 'ami-2', ec2client=ec2client)
+    except catalog.CatalogError as e:
+        print e
+
+    # 4 not checked
+    print catalog.catalogCheck('t3.micro', 'ami-3', ec2client=ec2client) is None
+
+    stubber.assert_no_pending_responses()
+
+# 5 the catalog of another account is loaded, t3.micro is not offered in its eu-west-3a
+other   = boto3.Session(aws_access_key_id='y', aws_secret_access_key='y', region_name='eu-west-3').client('ec2')
+stubber = Stubber(other)
+stubber.add_response('describe_instance_types', types('t2.micro', 't3.micro'))
+stubber.add_response('describe_instance_type_offerings', offerings('t2.micro'))
+
+with stubber:
+    try:
+        catalog.catalogCheck('t3.micro', zone='eu-west-3a', ec2client=other)
+    except catalog.CatalogError as e:
+        print e
+    stubber.assert_no_pending_responses()
+
+print sorted(os.listdir(os.environ['AWSEDU_CACHE']))
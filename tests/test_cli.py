@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+'''
+Cold start of the awsedu command:
+    -   --help must not import boto3
+    -   the best of 10 runs must stay within the budget
+'''
+
+BUDGET = 0.15
+
+root    = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+command = [sys.executable, '-c', 'import sys, awsedu.cli; sys.stdout.write(str("boto3" in sys.modules))']
+
+# 1 nothing heavy is imported by the entry point
+print subprocess.check_output(command, cwd=root) == 'False'
+
+# 2 budget
+times = []
+for i in range(10):
+    started = time.time()
+    subprocess.call([sys.executable, '-m', 'awsedu', '--help'], cwd=root, stdout=open(os.devnull, 'w'))
+    times.append(time.time() - started)
+
+print "cold start: %.3f s, budget %.3f s" % (min(times), BUDGET)
+print min(times) < BUDGET
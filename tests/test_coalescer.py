@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import awsedu.coalescer as coalescer
+
+'''
+The coalescer against a local stand-in of the EC2 endpoint, i-1 to i-5 exist:
+    -   5 concurrent stops become a single StopInstances call
+    -   a batch failed by i-bad: the other callers retry alone, only the caller of i-bad fails
+    -   a throttled batch: every caller gets the error, nobody retries alone
+    -   3 callers waiting share one poller, the wait on i-bad fails without starving the others,
+        a throttled poll is retried by the next round
+'''
+
+KNOWN   = set(['i-%d' % n for n in range(1, 6)])
+STOPPED = {}
+THROTTLE = [0]
+CALLS   = {'StopInstances': 0, 'DescribeInstances': 0}
+
+THROTTLED = '''<Response><Errors><Error><Code>RequestLimitExceeded</Code>
+<Message>Request limit exceeded.</Message></Error></Errors><RequestID>1</RequestID></Response>'''
+
+NOTFOUND = '''<Response><Errors><Error><Code>InvalidInstanceID.NotFound</Code>
+<Message>The instance IDs '%s' do not exist</Message></Error></Errors><RequestID>1</RequestID></Response>'''
+
+STOP = '''<StopInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><instancesSet>%s</instancesSet>
+</StopInstancesResponse>'''
+STOPPING = '''<item><instanceId>%s</instanceId><currentState><code>64</code><name>stopping</name></currentState></item>'''
+
+DESCRIBE = '''<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<reservationSet><item><instancesSet>%s</instancesSet></item></reservationSet></DescribeInstancesResponse>'''
+INSTANCE = '''<item><instanceId>%s</instanceId><instanceState><code>%d</code><name>%s</name></instanceState></item>'''
+
+class Ec2(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        query  = urlparse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])))
+        action = query['Action'][0]
+        ids    = sorted(values[0] for name, values in query.items() if name.startswith('InstanceId.'))
+        CALLS[action] += 1
+        unknown = [my_id for my_id in ids if my_id not in KNOWN]
+        status  = 200
+        if THROTTLE[0] > 0:
+            THROTTLE[0] -= 1
+            status, body = 503, THROTTLED
+        elif unknown:
+            status, body = 400, NOTFOUND % ', '.join(unknown)
+        elif action == 'StopInstances':
+            STOPPED.update((my_id, time.time() + 0.3) for my_id in ids)
+            body = STOP % ''.join(STOPPING % my_id for my_id in ids)
+        else:
+            body = DESCRIBE % ''.join(INSTANCE % ((my_id, 80, 'stopped')
+                if time.time() > STOPPED.get(my_id, 1e10) else (my_id, 64, 'stopping')) for my_id in ids)
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def concurrently(function, arguments):
+    outcomes = {}
+    def run(argument):
+        try:
+            outcomes[argument] = function(argument)
+        except (ClientError, RuntimeError) as e:
+            outcomes[argument] = e
+    threads = [threading.Thread(target=run, args=(argument,)) for argument in arguments]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return outcomes
+
+server = Server(('127.0.0.1', 0), Ec2)
+threading.Thread(target=server.serve_forever).start()
+
+session = boto3.Session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+merger  = coalescer.Coalescer(window=0.2, interval=0.2, region='eu-west-3')
+merger.ec2client = session.client('ec2', endpoint_url='http://127.0.0.1:%d' % server.server_port,
+    config=Config(retries={'max_attempts': 0}))
+
+# 1 coalescing, every caller gets back its own instance
+outcomes = concurrently(lambda my_id: merger.call('stop', [my_id]), sorted(KNOWN))
+print CALLS['StopInstances'] == 1, merger.stats['calls'] == 1
+print all([i['InstanceId'] for i in outcomes[my_id]['StoppingInstances']] == [my_id] for my_id in KNOWN)
+
+# 2 failed batch: 1 failed call, then one call per caller
+outcomes = concurrently(lambda my_id: merger.call('stop', [my_id]), ['i-1', 'i-2', 'i-bad'])
+print CALLS['StopInstances'] == 5
+print outcomes['i-1']['StoppingInstances'][0]['InstanceId'], outcomes['i-2']['StoppingInstances'][0]['InstanceId']
+print outcomes['i-bad'].response['Error']['Code']
+
+# 3 throttled batch: a single call, its error for everyone
+THROTTLE[0] = 1
+outcomes = concurrently(lambda my_id: merger.call('stop', [my_id]), ['i-3', 'i-4', 'i-5'])
+print CALLS['StopInstances'] == 6, set(e.response['Error']['Code'] for e in outcomes.values()) == set(['RequestLimitExceeded'])
+
+# 4 shared poller, its first round is throttled
+STOPPED.clear()
+merger.call('stop', ['i-1', 'i-2', 'i-3', 'i-4'])
+THROTTLE[0] = 1
+started  = time.time()
+outcomes = concurrently(lambda ids: merger.wait(ids.split(','), 'stopped', timeout=5), ['i-1,i-2', 'i-3', 'i-4,i-bad'])
+print outcomes['i-1,i-2'] is None, outcomes['i-3'] is None, time.time() - started < 3
+print outcomes['i-4,i-bad']
+# a round with i-bad: the failed describe, then one without i-bad
+print CALLS['DescribeInstances'] <= 2 * merger.stats['polls'] + 1
+# nothing left to await: the poller leaves after its next round
+time.sleep(0.5)
+print merger.stats['polls'] < 10, merger.poller is None
+
+server.shutdown()
@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+import time
+import urlparse
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+import problem_1.events as ev
+
+'''
+Waits resolved by state-change events, with the in-process queue:
+    -   the events of two instances arrive out of order
+    -   an instance terminates while we wait for it to stop
+    -   a 'stopped' left over from an earlier stop does not end the wait
+    -   without events, the poll finds i-4 stopped and leaves i-5, still unknown to EC2, pending
+'''
+
+POLLS = []
+
+NOTFOUND = '''<Response><Errors><Error><Code>InvalidInstanceID.NotFound</Code>
+<Message>The instance ID 'i-5' does not exist</Message></Error></Errors><RequestID>1</RequestID></Response>'''
+
+DESCRIBE = '''<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<reservationSet><item><instancesSet><item><instanceId>i-4</instanceId>
+<instanceState><code>80</code><name>stopped</name></instanceState></item></instancesSet></item></reservationSet>
+</DescribeInstancesResponse>'''
+
+class Raw(object):
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+def describe(request, **kwargs):
+    # EC2 knows i-4, not i-5 yet
+    ids = sorted(v[0] for k, v in urlparse.parse_qs(request.body).items() if k.startswith('InstanceId.'))
+    POLLS.append(ids)
+    if 'i-5' in ids:
+        return AWSResponse(request.url, 400, {}, Raw(NOTFOUND))
+    return AWSResponse(request.url, 200, {}, Raw(DESCRIBE))
+
+def at(seconds):
+    # ISO 8601 time, -seconds- from now
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + seconds))
+
+source  = ev.LocalEventSource()
+tracker = ev.StateEvents(source, silence=5).start()
+
+# 1 the late 'pending' of i-1 must not hide its 'running'
+def publish():
+    source.publish('i-1', 'running', at(0))
+    source.publish('i-1', 'pending', at(-10))
+    source.publish('i-2', 'running', at(0))
+
+threading.Timer(0.5, publish).start()
+tracker.wait(['i-1', 'i-2'], 'running', timeout=10)
+
+# 2 a terminated instance will never be stopped
+threading.Timer(0.5, lambda: source.publish('i-2', 'terminated')).start()
+try:
+    tracker.wait(['i-2'], 'stopped', timeout=10)
+except ev.WaitError as e:
+    print e
+
+# 3 the stale 'stopped' of i-3 is ignored, only the fresh one ends the wait
+source.publish('i-3', 'stopped', at(-3600))
+time.sleep(1.5)
+threading.Timer(1.5, lambda: source.publish('i-3', 'stopped')).start()
+started = time.time()
+tracker.wait(['i-3'], 'stopped', timeout=10)
+print time.time() - started > 1
+
+# an event ends the long poll of the stopped tracker
+tracker.stop()
+source.publish('i-0', 'running')
+tracker.thread.join()
+
+# 4 no events: a poll, i-5 is not found, i-4 is described alone
+boto3.setup_default_session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+boto3._get_default_session().events.register('before-send.ec2.DescribeInstances', describe)
+source  = ev.LocalEventSource()
+tracker = ev.StateEvents(source, silence=1).start()
+threading.Timer(2.5, lambda: source.publish('i-5', 'stopped')).start()
+tracker.wait(['i-4', 'i-5'], 'stopped', timeout=10)
+print POLLS[:2] == [['i-4', 'i-5'], ['i-4']]
+
+tracker.stop()
+source.publish('i-0', 'running')
+tracker.thread.join()
+
+# with the real queue, the problem 1 helpers wait on the events:
+# p1.ec2ClientStop(ids, events=ev.StateEvents(ev.SqsEventSource(queueurl)).start())
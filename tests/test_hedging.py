@@ -0,0 +1,105 @@
+import os
+import sys
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import awsedu.hedging as hedging
+
+'''
+Hedged describe_instances against a local stand-in of the EC2 endpoint:
+    -   one request out of four takes 1 s, the others 20 ms: hedges cut the tail
+    -   a stalled endpoint fails the call at the deadline
+    -   a failing endpoint opens the circuit: calls stop reaching it
+    -   the proxy of the environment is used: the local endpoint serves as the proxy of a made up host
+'''
+
+MODE     = ['tail']
+REQUESTS = [0]
+
+DESCRIBE = '''<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<reservationSet/></DescribeInstancesResponse>'''
+
+ERROR = '''<Response><Errors><Error><Code>InternalError</Code><Message>boom</Message></Error></Errors>
+<RequestID>1</RequestID></Response>'''
+
+class Ec2(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        REQUESTS[0] += 1
+        status, body = 200, DESCRIBE
+        if MODE[0] == 'tail':
+            time.sleep(1 if REQUESTS[0] % 4 == 0 else 0.02)
+        elif MODE[0] == 'stalled':
+            time.sleep(3)
+        else:
+            status, body = 500, ERROR
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+server = Server(('127.0.0.1', 0), Ec2)
+threading.Thread(target=server.serve_forever).start()
+
+session = boto3.Session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+hedger  = hedging.hedgingEnable(session, percentile=90, deadline=1.5, initial=0.1, failures=3, cooldown=60)
+client  = session.client('ec2', endpoint_url='http://127.0.0.1:%d' % server.server_port,
+    config=Config(retries={'max_attempts': 0}))
+
+# 1 the 1 s answers are hedged
+latencies = []
+for i in range(20):
+    started = time.time()
+    client.describe_instances()
+    latencies.append(time.time() - started)
+print "slowest call: %.2f s" % max(latencies)
+print max(latencies) < 0.5, hedger.stats[('ec2', 'DescribeInstances')]['hedge_wins'] >= 4
+
+# 2 deadline
+MODE[0] = 'stalled'
+started = time.time()
+try:
+    client.describe_instances()
+except hedging.DeadlineExceeded as e:
+    print e, "after %.2f s" % (time.time() - started)
+
+# 3 circuit breaker, the stalled call was the first failure
+MODE[0] = 'failing'
+for i in range(2):
+    try:
+        client.describe_instances()
+    except ClientError as e:
+        print e.response['Error']['Code']
+before = REQUESTS[0]
+try:
+    client.describe_instances()
+except hedging.CircuitOpen as e:
+    print e
+print REQUESTS[0] == before
+
+# 4 through the proxy of the environment
+MODE[0] = 'tail'
+os.environ['http_proxy'] = 'http://127.0.0.1:%d' % server.server_port
+proxied = session.client('ec2', endpoint_url='http://ec2.awsedu.invalid', config=Config(retries={'max_attempts': 0}))
+before  = REQUESTS[0]
+proxied.describe_instances()
+print REQUESTS[0] > before
+del os.environ['http_proxy']
+
+sys.stdout.write(hedger.prometheus())
+hedging.hedgingDisable()
+server.shutdown()
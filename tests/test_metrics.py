@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import awsedu.metrics as metrics
+
+'''
+Metrics of calls to a local stand-in of the EC2 endpoint:
+    -   describe_instances is throttled twice, then answers: 2 retries, 2 throttles, no error
+    -   stop_instances is throttled until the retries are exhausted: 3 throttles, 1 error
+'''
+
+THROTTLED = [2]
+
+DESCRIBE = '''<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<reservationSet/></DescribeInstancesResponse>'''
+
+THROTTLE = '''<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded.</Message>
+</Error></Errors><RequestID>1</RequestID></Response>'''
+
+class Ec2(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        status, answer = 200, DESCRIBE
+        if 'Action=StopInstances' in body or THROTTLED[0] > 0:
+            THROTTLED[0] -= 1
+            status, answer = 503, THROTTLE
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(answer)))
+        self.end_headers()
+        self.wfile.write(answer)
+
+    def log_message(self, format, *args):
+        pass
+
+server = HTTPServer(('127.0.0.1', 0), Ec2)
+threading.Thread(target=server.serve_forever).start()
+
+session  = boto3.Session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+registry = metrics.metricsEnable(session)
+client   = session.client('ec2', endpoint_url='http://127.0.0.1:%d' % server.server_port,
+    config=Config(retries={'mode': 'legacy', 'max_attempts': 2}))
+
+registry.reset()
+
+# 1 throttled, then answered
+client.describe_instances()
+describe = registry.snapshot()[('ec2', 'DescribeInstances', False)]
+print describe['retries'], describe['throttles'], describe['errors']
+print describe['retries'] == 2, describe['throttles'] == 2, not describe['errors']
+
+# 2 throttled to the end
+try:
+    client.stop_instances(InstanceIds=['i-1'])
+except ClientError as e:
+    print e.response['Error']['Code']
+stop = registry.snapshot()[('ec2', 'StopInstances', False)]
+print stop['throttles'] == 3, stop['errors'] == {'RequestLimitExceeded': 1}
+
+# 3 the counters as scraped
+prometheus = registry.prometheus()
+print 'awsedu_api_throttles_total{service="ec2",operation="DescribeInstances",dry_run="false"} 2' in prometheus
+print 'awsedu_api_errors_total{service="ec2",operation="StopInstances",dry_run="false",code="RequestLimitExceeded"} 1' in prometheus
+
+metrics.metricsDisable(session)
+server.shutdown()
@@ -0,0 +1,64 @@
+import os
+import resource
+import subprocess
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import awsedu.projection as projection
+
+'''
+Peak memory of a 50k instances listing, offline:
+    -   pages of 1000 instances with block devices, interfaces and security groups
+    -   full: the items are kept as parsed, like a single describe_instances response
+    -   projected: the six fields printed by the listings, page by page
+'''
+
+INSTANCES = 50000
+PAGE      = 1000
+
+FIELDS = ['InstanceId', 'InstanceType', 'State.Name', 'PublicIpAddress', 'PublicDnsName', 'Placement.AvailabilityZone']
+
+def instance(n):
+    return {
+        'InstanceId': 'i-%017x' % n, 'ImageId': 'ami-969c2deb', 'InstanceType': 't2.micro',
+        'State': {'Code': 16, 'Name': 'running'}, 'KeyName': 'awsedu',
+        'Placement': {'AvailabilityZone': 'eu-west-3a', 'GroupName': '', 'Tenancy': 'default'},
+        'PrivateIpAddress': '10.0.%d.%d' % (n / 256 % 256, n % 256),
+        'PublicIpAddress': '35.180.%d.%d' % (n / 256 % 256, n % 256),
+        'PublicDnsName': 'ec2-35-180-%d-%d.eu-west-3.compute.amazonaws.com' % (n / 256 % 256, n % 256),
+        'BlockDeviceMappings': [{'DeviceName': '/dev/xvda', 'Ebs': {
+            'VolumeId': 'vol-%017x' % n, 'Status': 'attached', 'DeleteOnTermination': True}}],
+        'NetworkInterfaces': [{
+            'NetworkInterfaceId': 'eni-%017x' % n, 'SubnetId': 'subnet-0a1b2c3d', 'VpcId': 'vpc-0a1b2c3d',
+            'MacAddress': '06:%02x:%02x:00:00:01' % (n / 256 % 256, n % 256), 'Status': 'in-use',
+            'Groups': [{'GroupId': 'sg-0a1b2c3d', 'GroupName': 'default'}],
+            'PrivateIpAddresses': [{'Primary': True, 'PrivateIpAddress': '10.0.%d.%d' % (n / 256 % 256, n % 256)}]}],
+        'SecurityGroups': [{'GroupId': 'sg-0a1b2c3d', 'GroupName': 'default'}],
+        'Tags': [{'Key': 'Name', 'Value': 'web-%d' % n}, {'Key': 'awsedu:group', 'Value': 'hvm'}]}
+
+def pages():
+    for start in range(0, INSTANCES, PAGE):
+        yield {'Reservations': [{'Instances': [instance(n) for n in range(start, start + PAGE)]}]}
+
+if len(sys.argv) > 1:
+    if sys.argv[1] == 'full':
+        kept = [i for page in pages() for r in page['Reservations'] for i in r['Instances']]
+    else:
+        kept = list(projection.projectionPages(pages(), 'Reservations', projection.projectionRecord('Instance', FIELDS)))
+    # kilobytes on linux
+    print resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sys.exit(0)
+
+# 1 records read like the items
+record = projection.projectionRecord('Instance', FIELDS + [('zone', 'Placement.AvailabilityZone'), 'Tags.1.Value', 'Missing.Field'])
+first  = next(projection.projectionPages(pages(), 'Reservations', record))
+print first.State_Name == 'running', first.zone == 'eu-west-3a', first['Tags_1_Value'] == 'hvm', first.Missing_Field is None
+
+# 2 peak memory, each mode in its own process
+peaks = {}
+for mode in ('full', 'projected'):
+    peaks[mode] = int(subprocess.check_output([sys.executable, __file__, mode]))
+    print "%-10s %8.1f MB" % (mode, peaks[mode] / 1024.0)
+
+print "ratio: %.1f" % (float(peaks['full']) / peaks['projected'])
+print peaks['projected'] < peaks['full'] / 3
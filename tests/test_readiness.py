@@ -0,0 +1,41 @@
+import os
+import socket
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import problem_1.readiness as rd
+
+'''
+Readiness against local listening sockets, every loopback address is a host:
+    -   i-a listens from the start
+    -   i-b starts listening after 1.5 s, it is found within the backoff
+    -   i-c never listens, it is reported not ready at the 3 s deadline
+'''
+
+def listen(address, port):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((address, port))
+    server.listen(5)
+    return server
+
+a     = listen('127.0.0.1', 0)
+port  = a.getsockname()[1]
+hosts = {'i-a': '127.0.0.1', 'i-b': '127.0.0.2', 'i-c': '127.0.0.3'}
+late  = []
+threading.Timer(1.5, lambda: late.append(listen('127.0.0.2', port))).start()
+
+# 1 all the hosts are probed at once
+started     = time.time()
+ready, slow = rd.readinessWait(hosts, ports=[port], deadline=3, timeout=1, backoff=0.2, maxbackoff=1)
+elapsed     = time.time() - started
+
+print "ready: ", sorted(ready), "not ready: ", sorted(slow), "in %.2f s" % elapsed
+print ready == set(['i-a', 'i-b']), slow == set(['i-c']), 2.9 < elapsed < 3.5
+
+# 2 without the hosts still refusing, the wait ends as soon as the others are ready
+started     = time.time()
+ready, slow = rd.readinessWait({'i-a': '127.0.0.1', 'i-b': '127.0.0.2'}, ports=[port], deadline=3)
+print ready == set(['i-a', 'i-b']), time.time() - started < 0.5
@@ -0,0 +1,71 @@
+import datetime
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import problem_1.reconciler as rec
+
+'''
+reconcileDiff and reconcileCountCalls on a hand-made snapshot, offline:
+    -   a stale ami is replaced, the most recently launched extra is terminated
+    -   a wrong type is stopped, modified and started, unless it is already stopped,
+        a pending one is skipped: it cannot be stopped yet
+    -   a stopped instance is started
+    -   missing volumes are created, others grown, shrinking is skipped
+'''
+
+spec = rec.reconcileNormalizeSpec({'groups': [
+    {'name': 'web', 'ami': 'ami-new', 'type': 't2.micro', 'count': 3,
+     'volumes': [{'device': '/dev/sdh', 'size': 8}]},
+    {'name': 'db',  'ami': 'ami-db', 'type': 't2.small', 'count': 3},
+    {'name': 'new', 'ami': 'ami-db', 'count': 2}
+]})
+
+def instance(group, ami, my_type, state, minute, volumes = None):
+    return {'group': group, 'image': ami, 'ami': ami, 'type': my_type, 'state': state, 'zone': 'eu-west-3a',
+            'launch': datetime.datetime(2018, 1, 1, 0, minute), 'volumes': volumes or {}}
+
+def volume(volumeid, size, my_type = 'gp2'):
+    return {'/dev/sdh': {'id': volumeid, 'type': my_type, 'size': size}}
+
+snapshot = {
+    # web: one stale, one stopped, one extra stopped later, volumes too small and too big
+    'i-stale':   instance('web', 'ami-old', 't2.micro', 'running', 0, volume('vol-1', 8)),
+    'i-web1':    instance('web', 'ami-new', 't2.micro', 'running', 1, volume('vol-2', 8)),
+    'i-web2':    instance('web', 'ami-new', 't2.micro', 'running', 2, volume('vol-3', 4, 'standard')),
+    'i-stopped': instance('web', 'ami-new', 't2.micro', 'stopped', 3, volume('vol-4', 16)),
+    'i-extra':   instance('web', 'ami-new', 't2.micro', 'stopped', 4),
+    # db: wrong type, running, stopped and pending
+    'i-db1':     instance('db', 'ami-db', 't2.micro', 'running', 0),
+    'i-db2':     instance('db', 'ami-db', 't2.micro', 'stopped', 1),
+    'i-db3':     instance('db', 'ami-db', 't2.micro', 'pending', 2)
+}
+
+plan = rec.reconcileDiff(spec, snapshot)
+
+# 1 replaced and extra instances, launches
+print sorted(plan['terminate']) == ['i-extra', 'i-stale']
+print [(launch['group']['name'], launch['count']) for launch in plan['launch']] == [('new', 2)]
+
+# 2 type changes, the pending instance is left alone
+print plan['stop'] == ['i-db1']
+print sorted(plan['modify']) == [('i-db1', 't2.small'), ('i-db2', 't2.small')]
+print sorted(plan['start']) == ['i-db1', 'i-db2', 'i-stopped']
+print [message for message in plan['skipped'] if message.startswith('i-db3')]
+
+# 3 volumes
+print [(my_id, volume['device']) for my_id, zone, volume in plan['create']] == []
+print plan['grow'] == [('vol-3', spec['groups'][0]['volumes'][0])]
+print [message for message in plan['skipped'] if message.startswith('i-stopped')]
+
+# 4 calls: terminate, stop, start, 2 modify, 1 launch, 1 grow
+print rec.reconcileCountCalls(plan) == 7
+
+# 5 an instance without its volume: create and attach
+del snapshot['i-web1']['volumes']['/dev/sdh']
+plan = rec.reconcileDiff(spec, snapshot)
+print [(my_id, volume['device']) for my_id, zone, volume in plan['create']] == [('i-web1', '/dev/sdh')]
+print rec.reconcileCountCalls(plan) == 9
+
+# 6 nothing runs: one launch per group
+print rec.reconcileCountCalls(rec.reconcileDiff(spec, {})) == len(spec['groups'])
@@ -0,0 +1,29 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import problem_1.reconciler as rec
+
+'''
+Same fleet of tests/test_1.py, described as a desired state:
+    -   3 free-tier instances with  (HVM) ami
+    -   2 t2.nano instances with Deep Learning ami, with an extra gp2 volume
+'''
+
+spec = {'groups': [
+    {'name': 'hvm', 'ami': 'ami-969c2deb', 'count': 3},
+    {'name': 'dl',  'ami': 'ami-3c8a3b41', 'type': 't2.nano', 'count': 2,
+     'volumes': [{'device': '/dev/sdh', 'type': 'gp2', 'size': 8}]}
+]}
+
+# 1 nothing runs, only the number of calls is reported
+plan = rec.ec2ClientReconcile(spec, plan=True)
+print plan['calls']
+
+# 2 apply, then a second pass must find nothing to do
+rec.ec2ClientReconcile(spec)
+print rec.ec2ClientReconcile(spec, plan=True)['calls'] == 0
+
+# 3 shrink the hvm group: only the most recently launched instance goes away
+spec['groups'][0]['count'] = 2
+rec.ec2ClientReconcile(spec)
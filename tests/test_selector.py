@@ -0,0 +1,87 @@
+import datetime
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+from botocore.stub import Stubber
+from dateutil.tz import tzutc
+
+import awsedu.selector as sel
+
+'''
+Selectors, offline:
+    -   what is pushed as server-side filters and what is left to the local pass
+    -   a volume predicate narrows describe_instances to the owners of the matching volumes
+    -   dates compare as dates, wildcards match their ISO form
+    -   a date = is pushed only with wildcards, EC2 would not match 2018-01-05T10:00:00Z
+'''
+
+# 1 pushdown of the top level conjunction
+compiled = sel.selectorCompile('state=running and type!=t2.nano and tag:Name=web* and not az=eu-west-3a')
+print compiled['filters'] == [
+    {'Name': 'instance-state-name', 'Values': ['running']},
+    {'Name': 'tag:Name', 'Values': ['web*']}]
+print [node[0] for node in compiled['remainder']] == ['pred', 'not']
+
+# 2 the same filter name twice is not ANDed by EC2: the second one stays local
+compiled = sel.selectorCompile('state=running and state=stopped,running')
+print compiled['filters'] == [{'Name': 'instance-state-name', 'Values': ['running']}]
+print compiled['remainder'] == [('pred', 'state', '=', ['stopped', 'running'])]
+
+# 3 a disjunction is pushed only when all its terms are = on the same field
+print sel.selectorCompile('state=running or state=stopped')['filters'] == \
+    [{'Name': 'instance-state-name', 'Values': ['running', 'stopped']}]
+print sel.selectorCompile('state=running or type=t2.nano')['filters'] == []
+print sel.selectorCompile('size>=100 and type=gp2 | top 2 by size', 'volumes') == {
+    'filters':   [{'Name': 'volume-type', 'Values': ['gp2']}],
+    'remainder': [('pred', 'size', '>=', ['100'])],
+    'top':       (2, 'size', True)}
+
+# 3b dates: pushed with a wildcard, compared locally without
+print sel.selectorCompile('launch_time=2018-01-*')['filters'] == [{'Name': 'launch-time', 'Values': ['2018-01-*']}]
+print sel.selectorCompile('launch_time=2018-01-05T10:00:00Z,2018-02-*') == {
+    'filters':   [],
+    'remainder': [('pred', 'launch_time', '=', ['2018-01-05T10:00:00Z', '2018-02-*'])],
+    'top':       None}
+
+def instance(my_id, launched):
+    return {'InstanceId': my_id, 'State': {'Name': 'running'}, 'LaunchTime': launched}
+
+session   = boto3.Session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+ec2client = session.client('ec2')
+stubber   = Stubber(ec2client)
+january   = datetime.datetime(2018, 1, 5, 10, 0, tzinfo=tzutc())
+february  = datetime.datetime(2018, 2, 1, 10, 0, tzinfo=tzutc())
+
+# 4 volume predicate: one describe_volumes, then only the owners of gp2 volumes are described
+stubber.add_response('describe_volumes',
+    {'Volumes': [{'VolumeId': 'vol-1', 'Attachments': [{'InstanceId': 'i-1'}]},
+                 {'VolumeId': 'vol-2', 'Attachments': [{'InstanceId': 'i-2'}]}]},
+    {'Filters': [{'Name': 'status', 'Values': ['in-use']}, {'Name': 'volume-type', 'Values': ['gp2']}]})
+stubber.add_response('describe_instances',
+    {'Reservations': [{'Instances': [instance('i-1', january)]}]},
+    {'Filters': [{'Name': 'instance-state-name', 'Values': ['running']},
+                 {'Name': 'instance-id', 'Values': ['i-1', 'i-2']}]})
+
+# 5 dates: wildcards on the ISO form, comparisons as dates
+DATES = ['not launch_time=2018-01-*', 'launch_time>=2018-01-15', 'launch_time!=2018-01-05T10:00:00Z',
+         'launch_time=2018-01-05T10:00:00Z']
+for expression in DATES:
+    stubber.add_response('describe_instances',
+        {'Reservations': [{'Instances': [instance('i-1', january), instance('i-2', february)]}]}, {'Filters': []})
+
+with stubber:
+    print [i['InstanceId'] for i in sel.selectorSelect('state=running and volume.type=gp2', ec2client=ec2client)]
+    for expression in DATES:
+        print expression, [i['InstanceId'] for i in sel.selectorSelect(expression, ec2client=ec2client)]
+    stubber.assert_no_pending_responses()
+
+# 6 a literal that is not a date
+stubber.add_response('describe_instances',
+    {'Reservations': [{'Instances': [instance('i-1', january)]}]}, {'Filters': []})
+with stubber:
+    try:
+        sel.selectorSelect('launch_time<soon', ec2client=ec2client)
+    except sel.SelectorError as e:
+        print e
@@ -0,0 +1,122 @@
+import os
+import sys
+import threading
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+
+import problem_2.snapshots as snapshots
+
+'''
+Snapshot batches against a local stand-in of the EC2 endpoint, every region answers:
+    -   vol-bad cannot be snapshot: the others are still taken and awaited, then the error is raised
+    -   copies carry the tags of their source, their VolumeId is the vol-ffffffff placeholder
+    -   prune deletes in the region it is given, and keeps -keep- copies of every source volume
+'''
+
+REQUESTS  = []
+SNAPSHOTS = {}
+LOCK      = threading.Lock()
+
+ERROR = '''<Response><Errors><Error><Code>%s</Code><Message>%s</Message></Error></Errors>
+<RequestID>1</RequestID></Response>'''
+
+SNAPSHOT = '''<%sResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><snapshotId>%s</snapshotId></%sResponse>'''
+
+DESCRIBE = '''<DescribeSnapshotsResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><snapshotSet>%s</snapshotSet>
+</DescribeSnapshotsResponse>'''
+ITEM = '''<item><snapshotId>%s</snapshotId><volumeId>%s</volumeId><status>completed</status>
+<startTime>2018-01-01T00:%02d:00.000Z</startTime><tagSet>%s</tagSet></item>'''
+TAG  = '''<item><key>%s</key><value>%s</value></item>'''
+
+DELETE = '''<DeleteSnapshotResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><return>true</return></DeleteSnapshotResponse>'''
+
+def store(region, prefix, volumeid, query):
+    # a new snapshot with the tags of the request, snapshots of a region start one minute apart
+    tags = dict((query[k], query[k[:-3] + 'Value']) for k in query if k.startswith('TagSpecification.1.Tag.') and k.endswith('.Key'))
+    with LOCK:
+        snapshotid = '%s-%d' % (prefix, len(SNAPSHOTS) + 1)
+        started    = len([s for s in SNAPSHOTS.values() if s['region'] == region])
+        SNAPSHOTS[snapshotid] = {'region': region, 'volume': volumeid, 'started': started, 'tags': tags}
+    return snapshotid
+
+def item(snapshotid):
+    snapshot = SNAPSHOTS[snapshotid]
+    return ITEM % (snapshotid, snapshot['volume'], snapshot['started'], ''.join(TAG % tag for tag in snapshot['tags'].items()))
+
+class Ec2(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        query  = dict((k, v[0]) for k, v in urlparse.parse_qs(self.rfile.read(int(self.headers['Content-Length']))).items())
+        action = query['Action']
+        region = self.headers['X-Region']
+        REQUESTS.append((region, query))
+        status = 200
+        if query.get('DryRun') == 'true':
+            status, body = 412, ERROR % ('DryRunOperation', 'Request would have succeeded.')
+        elif query.get('VolumeId') == 'vol-bad':
+            status, body = 400, ERROR % ('InvalidVolume.NotFound', 'The volume does not exist.')
+        elif action == 'CreateSnapshot':
+            body = SNAPSHOT % (action, store(region, 'snap', query['VolumeId'], query), action)
+        elif action == 'CopySnapshot':
+            body = SNAPSHOT % (action, store(region, 'snap-copy', 'vol-ffffffff', query), action)
+        elif action == 'DescribeSnapshots' and 'SnapshotId.1' in query:
+            body = DESCRIBE % ''.join(item(v) for k, v in sorted(query.items()) if k.startswith('SnapshotId.'))
+        elif action == 'DescribeSnapshots':
+            body = DESCRIBE % ''.join(item(my_id) for my_id, s in sorted(SNAPSHOTS.items())
+                if s['region'] == region and s['tags'].get('awsedu:backup') == query['Filter.1.Value.1'])
+        else:
+            body = DELETE
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def local(request, **kwargs):
+    # the requests go to the local endpoint, with the region they were meant for
+    request.headers['X-Region'] = urlparse.urlparse(request.url).netloc.split('.')[1]
+    request.url = 'http://127.0.0.1:%d/' % server.server_port
+
+def calls(action, region = None):
+    return [query for host, query in REQUESTS
+        if query['Action'] == action and query.get('DryRun') != 'true' and region in (None, host)]
+
+server = Server(('127.0.0.1', 0), Ec2)
+threading.Thread(target=server.serve_forever).start()
+
+boto3.setup_default_session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+boto3._get_default_session().events.register('before-send', local, unique_id='test-snapshots-local')
+
+# 1 one failed call among three
+try:
+    snapshots.ec2ClientCreateSnapshots(['vol-1', 'vol-bad', 'vol-2'], 'daily', rate=50)
+except snapshots.SnapshotError as e:
+    print e
+    print [snapshotid is not None for snapshotid in e.done], e.errors.keys()
+print len(calls('CreateSnapshot')) == 3
+print len([k for k in calls('DescribeSnapshots')[0] if k.startswith('SnapshotId.')]) == 2
+
+# 2 two more days of backups, all copied to eu-west-1 with the tags of their source
+taken  = [snapshotid for snapshotid in e.done if snapshotid]
+taken += snapshots.ec2ClientCreateSnapshots(['vol-1', 'vol-2'], 'daily', rate=50)
+taken += snapshots.ec2ClientCreateSnapshots(['vol-1', 'vol-2'], 'daily', rate=50)
+copies = snapshots.ec2ClientCopySnapshots(taken, 'eu-west-3', 'eu-west-1', rate=50)
+print len(copies) == 6, set(SNAPSHOTS[c]['volume'] for c in copies) == set(['vol-ffffffff'])
+print all(SNAPSHOTS[c]['tags'] == SNAPSHOTS[s]['tags'] for s, c in zip(taken, copies))
+
+# 3 prune in the destination region: 3 copies of each volume, 2 kept for each
+expired = snapshots.ec2ClientPruneSnapshots('daily', keep=2, rate=50, region='eu-west-1')
+print sorted(SNAPSHOTS[s]['tags']['awsedu:volume'] for s in expired) == ['vol-1', 'vol-2']
+print sorted(c['SnapshotId'] for c in calls('DeleteSnapshot', 'eu-west-1')) == sorted(expired)
+print calls('DeleteSnapshot', 'eu-west-3') == []
+
+server.shutdown()
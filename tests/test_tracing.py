@@ -0,0 +1,93 @@
+import os
+import sys
+import threading
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+import botocore.waiter
+
+import awsedu.tracing as tracing
+import problem_1.problem1 as p1
+
+'''
+Spans of problem_1 ec2ClientStop, offline, against a local stand-in of the EC2 endpoint:
+    -   the dry run answers DryRunOperation, the stop answers 'stopping'
+    -   the instance_stopped waiter sees 'stopping' twice, then 'stopped'
+    -   operation > phase > API call nesting, the waiter polls carry attempts 1, 2 and 3
+'''
+
+POLLS = [0]
+
+ERROR = '''<Response><Errors><Error><Code>DryRunOperation</Code><Message>Request would have succeeded.</Message>
+</Error></Errors><RequestID>1</RequestID></Response>'''
+
+DESCRIBE = '''<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<reservationSet><item><instancesSet><item><instanceId>i-1</instanceId>
+<instanceState><code>%d</code><name>%s</name></instanceState></item></instancesSet></item></reservationSet>
+</DescribeInstancesResponse>'''
+
+STOP = '''<StopInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+<instancesSet><item><instanceId>i-1</instanceId><currentState><code>64</code><name>stopping</name></currentState>
+</item></instancesSet></StopInstancesResponse>'''
+
+class Ec2(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        query  = urlparse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])))
+        status = 200
+        if query.get('DryRun') == ['true']:
+            status, body = 412, ERROR
+        elif query['Action'][0] == 'StopInstances':
+            body = STOP
+        else:
+            POLLS[0] += 1
+            body = DESCRIBE % ((80, 'stopped') if POLLS[0] > 2 else (64, 'stopping'))
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def local(request, **kwargs):
+    # the problem modules create their clients, their requests are sent to the local endpoint
+    request.url = 'http://127.0.0.1:%d/' % server.server_port
+
+class Clock(object):
+    # the waiter polls every 15 s, the endpoint answers at once
+    @staticmethod
+    def sleep(seconds):
+        pass
+
+server = HTTPServer(('127.0.0.1', 0), Ec2)
+threading.Thread(target=server.serve_forever).start()
+
+boto3.setup_default_session(aws_access_key_id='x', aws_secret_access_key='x', region_name='eu-west-3')
+session = boto3._get_default_session()
+session.events.register('before-send', local, unique_id='test-tracing-local')
+botocore.waiter.time = Clock
+
+exporter = tracing.InMemoryExporter()
+tracing.tracingEnable(exporter)
+p1.ec2ClientStop(['i-1'])
+tracing.tracingDisable()
+server.shutdown()
+
+# 1 a single trace, rooted at the operation
+operation = exporter.find('ec2ClientStop')[0]
+print operation.parentid is None, operation.attributes['instance_count'] == 1
+print len(set(s.traceid for s in exporter.spans)) == 1
+
+# 2 operation > phase > API call
+phases = exporter.children(operation)
+print [s.name for s in phases]
+print [[c.name for c in exporter.children(s)] for s in phases if s.name != 'wait']
+print exporter.children(phases[0])[0].attributes.get('dry_run') is True
+
+# 3 waiter polls, numbered
+polls = exporter.children(exporter.find('wait instance')[0])
+print [c.name for c in polls], [c.attributes['attempt'] for c in polls]
+print exporter.find('wait instance')[0].attributes['instance_id'] == 'i-1'